@@ -0,0 +1,51 @@
+"""
+AsyncDatabaseConnection.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module handles the asyncio connection to the MongoDB database. It mirrors DatabaseConnection but uses
+PyMongo's native async client, so many queries can be in flight at once from a single event loop.
+Issues: None known
+"""
+
+import logging
+
+from pymongo import AsyncMongoClient
+
+
+class AsyncDatabaseConnection:
+    """
+    Handles the asyncio connection to the MongoDB database.
+    """
+
+    def __init__(self, connection_string, db_name):
+        """
+        Initialize the AsyncDatabaseConnection object with the given connection string and database name.
+        The client connects lazily on the first operation, so no event loop is needed to construct it.
+
+        :param connection_string: MongoDB connection string
+        :param db_name: Name of the database to connect to
+        """
+        try:
+            self.client = AsyncMongoClient(connection_string)
+            self.database = self.client[db_name]
+            logging.info(f"Configured async connection to database: {db_name}")
+        except Exception as e:
+            logging.error(f"Failed to connect to MongoDB: {e}")
+            raise ConnectionError(f"Failed to connect to MongoDB: {e}")
+
+    def get_collection(self, collection_name):
+        """
+        Get a collection from the connected database.
+
+        :param collection_name: Name of the collection to retrieve
+        :return: AsyncCollection object
+        """
+        return self.database[collection_name]
+
+    async def close(self):
+        """
+        Close the client and its connection pool.
+        """
+        await self.client.close()
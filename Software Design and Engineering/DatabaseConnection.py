@@ -3,38 +3,207 @@ DatabaseConnection.py
 Author: Nathan Wilson
 Contact: nathan.wilson3@outlook.com
 Date: 2024-07-21
-Version: 1.0
+Version: 1.2
 Purpose: This module handles the connection to the MongoDB database.
+Clients are shared through a process-wide registry keyed by connection string and pool settings, so any number of
+DatabaseConnection objects reuse one connection pool. The registry is reset in forked children, and pool activity
+is tracked through pymongo's connection pool monitoring events.
 Issues: None known
 """
 
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
 import logging
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path)
 
+# Pool settings used when a caller does not pass its own (100 and 0 match pymongo's own defaults)
+DEFAULT_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+DEFAULT_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+DEFAULT_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Collects connection pool statistics from pymongo's pool monitoring events.
+    """
+
+    def __init__(self):
+        """
+        Initialize the counters. Event handlers run on pymongo's threads, so updates are guarded by a lock.
+        """
+        self.lock = threading.Lock()
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.open_connections = 0
+        self.pools_cleared = 0
+
+    def _record_wait(self, event):
+        """
+        Add the time a checkout spent waiting for a connection to the wait statistics.
+
+        :param event: ConnectionCheckedOutEvent or ConnectionCheckOutFailedEvent
+        """
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            wait_ms = duration * 1000
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self._record_wait(event)
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.checkout_failures += 1
+            self._record_wait(event)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open_connections -= 1
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self.pools_cleared += 1
+
+    # Remaining events carry nothing we report on
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self):
+        """
+        Report the current pool statistics.
+
+        :return: Dictionary of pool statistics
+        """
+        with self.lock:
+            return {
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_wait_ms': self.total_wait_ms / self.checkouts if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait_ms,
+                'open_connections': self.open_connections,
+                'pools_cleared': self.pools_cleared,
+            }
+
+
+# Process-wide registry of (MongoClient, PoolStatsListener) pairs keyed by connection string and pool settings
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _reset_registry_after_fork():
+    """
+    MongoClient is not fork-safe, so a forked child (e.g. a gunicorn worker) must open its own clients.
+    The lock is recreated because another thread may have held it at the moment of the fork.
+    """
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_registry_after_fork)
+
+
+def get_client(connection_string, max_pool_size=None, min_pool_size=None, wait_queue_timeout_ms=None):
+    """
+    Get the shared MongoClient for a connection string, creating it on first use.
+    The client connects lazily, so no sockets are opened until the first operation.
+
+    :param connection_string: MongoDB connection string
+    :param max_pool_size: Maximum number of pooled connections per server
+    :param min_pool_size: Number of connections the pool keeps open
+    :param wait_queue_timeout_ms: Milliseconds to wait for a free connection before failing
+    :return: Tuple of (MongoClient, PoolStatsListener)
+    """
+    options = (
+        DEFAULT_MAX_POOL_SIZE if max_pool_size is None else max_pool_size,
+        DEFAULT_MIN_POOL_SIZE if min_pool_size is None else min_pool_size,
+        DEFAULT_WAIT_QUEUE_TIMEOUT_MS if wait_queue_timeout_ms is None else wait_queue_timeout_ms,
+    )
+    key = (connection_string,) + options
+    with _clients_lock:
+        if key not in _clients:
+            listener = PoolStatsListener()
+            client = MongoClient(
+                connection_string,
+                maxPoolSize=options[0],
+                minPoolSize=options[1],
+                waitQueueTimeoutMS=options[2],
+                connect=False,
+                event_listeners=[listener],
+            )
+            _clients[key] = (client, listener)
+        return _clients[key]
+
+
+def close_all():
+    """
+    Close every shared client, e.g. on application shutdown.
+    """
+    with _clients_lock:
+        for client, _ in _clients.values():
+            client.close()
+        _clients.clear()
+
+
 class DatabaseConnection:
     """
     Handles connection to the MongoDB database.
     """
 
-    def __init__(self, connection_string, db_name):
+    def __init__(self, connection_string, db_name, max_pool_size=None, min_pool_size=None,
+                 wait_queue_timeout_ms=None):
         """
         Initialize the DatabaseConnection object with the given connection string and database name.
+        Connections with the same connection string and pool settings share one client and pool.
 
         :param connection_string: MongoDB connection string
         :param db_name: Name of the database to connect to
+        :param max_pool_size: Maximum number of pooled connections (defaults to MONGO_MAX_POOL_SIZE or 100)
+        :param min_pool_size: Minimum number of pooled connections (defaults to MONGO_MIN_POOL_SIZE or 0)
+        :param wait_queue_timeout_ms: Milliseconds to wait for a pooled connection (defaults to
+            MONGO_WAIT_QUEUE_TIMEOUT_MS, or no limit)
         """
         try:
-            # Debugging statements to check the values
-            print(f"Connection String: {connection_string}")
-            print(f"Database Name: {db_name}")
-
-            self.client = MongoClient(connection_string)
+            self.client, self.pool_listener = get_client(connection_string, max_pool_size, min_pool_size,
+                                                         wait_queue_timeout_ms)
             self.database = self.client[db_name]
             logging.info(f"Connected to database: {db_name}")
         except Exception as e:
@@ -50,16 +219,27 @@ class DatabaseConnection:
         """
         return self.database[collection_name]
 
+    def pool_stats(self):
+        """
+        Get statistics for the shared connection pool.
+
+        :return: Dictionary with checked out connections, checkout counts and wait times
+        """
+        return self.pool_listener.snapshot()
+
 if __name__ == '__main__':
     # Read connection string and database name from environment variables
     connection_string = os.getenv("MONGO_CONNECTION_STRING")
     db_name = os.getenv("DB_NAME")
-    
+
     # Test the connection
     try:
         db_conn = DatabaseConnection(connection_string, db_name)
+        db_conn.client.admin.command('ping')
         print(f"Successfully connected to the database: {db_name}")
         collection = db_conn.get_collection("AnimalShelter")
         print(f"Successfully accessed the collection: AnimalShelter")
-    except ConnectionError as e:
+        print(f"Pool statistics: {db_conn.pool_stats()}")
+    # The constructor reports failures as ConnectionError; the ping raises pymongo's own errors
+    except (ConnectionError, PyMongoError) as e:
         print(e)
@@ -3,15 +3,26 @@ animalShelter.py
 Author: Nathan Wilson
 Contact: nathan.wilson3@outlook.com
 Date: 2024-07-21
-Version: 1.1
+Version: 1.2
 Purpose: This module provides an interface for CRUD operations on the AnimalShelter collection in MongoDB.
 Issues: None known
 """
 
 from DatabaseConnection import DatabaseConnection
-from crudOperations import CreateOperation, ReadOperation, UpdateOperation, DeleteOperation
-import pymongo
+from crudOperations import (CreateOperation, ReadOperation, UpdateOperation, DeleteOperation, BulkOperations,
+                            AggregateOperation, DEFAULT_BATCH_SIZE, PROJECTION_PRESETS, invalidate_cache,
+                            resolve_projection)
+from geoQueries import within_box, within_polygon, near, cluster_pipeline, DETAIL_ZOOM
+from tableQuery import combine_queries
+from rescueQueries import backfill_rescue_tags, ensure_tagged
+from timeQueries import date_range, time_series_pipeline
+from facetQueries import facet_pipeline, facet_results
+from indexManager import ensure_indexes
+from outcomeRollups import OutcomeRollups, ROLLUP_DIMENSIONS
+from writeBuffer import WriteBuffer
+from queryMetrics import track
 import logging
+import pymongo.errors
 
 logging.basicConfig(level=logging.INFO)
 
@@ -20,103 +31,481 @@ class AnimalShelter:
     The AnimalShelter class provides an interface for CRUD operations on the AnimalShelter collection in MongoDB.
     """
 
-    def __init__(self, connection_string, db_name, collection_name):
+    def __init__(self, connection_string, db_name, collection_name, cache=None, pool_options=None, metrics=None,
+                 rollups=False, write_buffer=None):
         """
         Initialize the AnimalShelter with a database connection and collection name.
 
         :param connection_string: MongoDB connection string
         :param db_name: Name of the database
         :param collection_name: Name of the collection
+        :param cache: Optional QueryCache that serves repeated reads and is invalidated by every write
+        :param pool_options: Optional dictionary of max_pool_size, min_pool_size and wait_queue_timeout_ms
+        :param metrics: Optional QueryMetrics that times every operation and samples query plans of slow reads
+        :param rollups: Keep the outcome rollup collection up to date on every write and answer breed counts from it
+        :param write_buffer: Optional dictionary of WriteBuffer settings (max_batch, max_delay_ms, w, j); when given,
+            create, update and delete calls are queued and flushed together as bulk writes
         """
-         # Establish a connection to the database
-        self.db_connection = DatabaseConnection(connection_string, db_name)
+         # Establish a connection to the database (shared with any other shelter using the same settings)
+        self.db_connection = DatabaseConnection(connection_string, db_name, **(pool_options or {}))
          # Access the specified collection
         self.collection = self.db_connection.get_collection(collection_name)
 
+        self.cache = cache
+        self.metrics = metrics
+        self.rollups = OutcomeRollups(self.collection) if rollups else None
+
          # Initialize CRUD operation handlers
-        self.create_operation = CreateOperation(self.collection)
-        self.read_operation = ReadOperation(self.collection)
-        self.update_operation = UpdateOperation(self.collection)
-        self.delete_operation = DeleteOperation(self.collection)
+        self.create_operation = CreateOperation(self.collection, cache, metrics=metrics, rollups=self.rollups)
+        self.read_operation = ReadOperation(self.collection, cache, metrics=metrics)
+        self.update_operation = UpdateOperation(self.collection, cache, metrics=metrics, rollups=self.rollups)
+        self.delete_operation = DeleteOperation(self.collection, cache, metrics=metrics, rollups=self.rollups)
+        self.bulk_operations = BulkOperations(self.collection, cache, metrics=metrics, rollups=self.rollups)
+        self.aggregate_operation = AggregateOperation(self.collection, cache, metrics=metrics)
+        self.write_buffer = (WriteBuffer(self.collection, cache=cache, metrics=metrics, rollups=self.rollups,
+                                         **write_buffer) if write_buffer is not None else None)
 
         # Ensure necessary indexes are created on the collection
         self.ensure_indexes()
+        # Tag outcomes loaded before rescue tags existed, which the rescue filters would otherwise never match
+        if ensure_tagged(self.collection):
+            invalidate_cache(cache)
+        # Build the rollups the first time they are enabled for a collection
+        if self.rollups is not None:
+            self.rollups.ensure_built()
 
     def ensure_indexes(self):
         """
-        Ensure that necessary indexes are created on the collection.
-        Reduced time complexity from O(n) to O (log n)
-        """
-        # Example index creation (add actual index creation code here)
-        # self.collection.create_index([("field_name", pymongo.ASCENDING)], unique=True)
-
-        indexes = self.collection.index_information()
-        if "animal_type_1" not in indexes:
-            self.collection.create_index("animal_type")
-        if "breed_1" not in indexes:
-            self.collection.create_index("breed")
-        if "date_of_birth_1" not in indexes:
-            self.collection.create_index("date_of_birth")
-        if "datetime_1" not in indexes:
-            self.collection.create_index("datetime")
-        if "outcome_type_1" not in indexes:
-            self.collection.create_index("outcome_type")
-        if "location_2dsphere" not in indexes:
-            self.collection.create_index([("location", pymongo.GEOSPHERE)])
-
-        # Compound indexes
-        if "animal_type_breed_idx" not in indexes:
-            self.collection.create_index([("animal_type", pymongo.ASCENDING), ("breed", pymongo.ASCENDING)])
-        if "date_of_birth_animal_id_idx" not in indexes:
-            self.collection.create_index([("date_of_birth", pymongo.ASCENDING), ("animal_id", pymongo.ASCENDING)])
-        if "name_animal_type_idx" not in indexes:
-            self.collection.create_index([("name", pymongo.ASCENDING), ("animal_type", pymongo.ASCENDING)])
-
-    def create(self, data):
+        Ensure that the indexes declared in indexManager.INDEX_SPECS exist on the collection.
+        Missing indexes are built with one create_indexes call, and the check runs once per collection per process.
+        """
+        ensure_indexes(self.collection)
+
+    def create(self, data, wait=True):
         """
         Create a new document in the collection.
+        With a write buffer, the insert is queued and written together with other buffered writes.
 
         Time Complexity: O(1) on average, but O(n) in the worst case if a rehash is needed.
 
         :param data: Dictionary representing the document to be created
-        :return: Boolean indicating success of the operation
+        :param wait: With a write buffer, block until the insert is acknowledged; False returns its Future instead
+        :return: Boolean indicating success of the operation, or a Future of it when wait is False
+        """
+        if self.write_buffer is None:
+            return self.create_operation.execute(data)
+        return self._buffered(self.write_buffer.create(data), wait)
+
+    def _buffered(self, future, wait):
+        """
+        Wait for a buffered write if the caller asked to.
+
+        :param future: Future returned by the write buffer
+        :param wait: Block until the write is acknowledged
+        :return: Result of the write, or the Future when wait is False
         """
-        return self.create_operation.execute(data)
+        return future.result() if wait else future
 
-    def read(self, query, projection=None):
+    def read(self, query, projection=None, sort=None, skip=0, limit=0, start=None, end=None):
         """
         Read documents from the collection based on the query.
         Added the use of projection to make the read operations more efficient by allowing the user to include only the fields
-        that are absolutely necessary
+        that are absolutely necessary. Sort, skip and limit let callers page through results on the server instead of
+        pulling the whole result set. Start and end limit the outcomes to a date range using the datetime index.
 
         Time Complexity: O(log n) when used with well-designed indexes, and O(n) on full collection scans or non-indexed fields
 
         :param query: Dictionary representing the query criteria
-        :param projection: Dictionary representing the fields to include or exclude
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param skip: Number of matching documents to skip
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param start: Optional first outcome date to include
+        :param end: Optional first outcome date to exclude
         :return: List of documents matching the query
         """
-        return self.read_operation.execute(query, projection)
+        return self.read_operation.execute(combine_queries(query, date_range(start, end)), projection, sort=sort,
+                                           skip=skip, limit=limit)
+
+    def read_page(self, query, after=None, limit=100, sort=None, projection=None):
+        """
+        Read one page of documents, continuing after the page that returned the token.
+        Unlike skip, which still walks every skipped document, each page starts with an index range scan, which
+        suits deep dashboard pages and export jobs that walk the whole collection.
+
+        Time Complexity: O(log n + limit) when the sort keys are indexed, whatever the page number
+
+        :param query: Dictionary representing the query criteria
+        :param after: Token returned with the previous page, or None for the first page
+        :param limit: Maximum number of documents in the page
+        :param sort: Optional list of (field, direction) tuples; defaults to date of birth, then animal id
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :return: Tuple of (documents, token for the next page or None after the last page)
+        """
+        return self.read_operation.read_page(query, after=after, limit=limit, sort=sort, projection=projection)
+
+    def stream(self, query, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE, max_time_ms=None,
+               batched=False):
+        """
+        Lazily read documents from the collection based on the query.
+        Documents are pulled from the server batch_size at a time, so arbitrarily large result sets can be
+        processed in constant memory, e.g. for exports or building aggregates in Python.
+
+        Time Complexity: Same as read, but memory use is O(batch_size) instead of O(n)
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param batch_size: Number of documents fetched per round trip, and the size of each yielded batch
+        :param max_time_ms: Optional server-side time limit for the query in milliseconds
+        :param batched: Yield lists of up to batch_size documents instead of single documents
+        :return: Generator of documents, or of document lists when batched is True
+        """
+        return self.read_operation.stream(query, projection, sort=sort, limit=limit, batch_size=batch_size,
+                                          max_time_ms=max_time_ms, batched=batched)
+
+    def read_frame(self, query, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Read documents from the collection into a DataFrame with typed columns (float64 coordinates and ages,
+        datetime64 outcome dates, categorical breed/animal_type/outcome_type).
+        With pymongoarrow installed, results are decoded from BSON straight into Arrow columns, skipping the
+        dictionary per document that pd.DataFrame(read(...)) needs; otherwise documents are streamed in batches
+        into one list per field and the frame is built once from those columns (see columnarRead.read_path).
+
+        Time Complexity: Same as read
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param batch_size: Number of documents decoded per batch when pymongoarrow is not installed
+        :return: pandas DataFrame of the matching documents
+        """
+        # pandas and pyarrow are imported on first use so that processes which never build frames don't load them
+        import columnarRead
+        if columnarRead.find_arrow_all is not None:
+            return self.read_arrow(query, projection, sort=sort, limit=limit).to_pandas()
+        batches = self.stream(query, projection, sort=sort, limit=limit, batch_size=batch_size, batched=True)
+        return columnarRead.read_frame(batches, columnarRead.projected_fields(resolve_projection(projection)))
+
+    def read_arrow(self, query, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Read documents from the collection into an Arrow table (requires pyarrow). Categories are Arrow
+        dictionary arrays.
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude; '_id' should be excluded
+            unless pymongoarrow is installed
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param batch_size: Number of documents decoded per batch when pymongoarrow is not installed
+        :return: pyarrow Table of the matching documents
+        """
+        import columnarRead
+        if columnarRead.find_arrow_all is None:
+            return columnarRead.to_arrow(self.read_frame(query, projection, sort=sort, limit=limit,
+                                                         batch_size=batch_size))
+        try:
+            with track(self.metrics, 'read_arrow', query):
+                return columnarRead.find_arrow(self.collection, query, resolve_projection(projection), sort=sort,
+                                               limit=limit)
+        except pymongo.errors.PyMongoError as e:
+            logging.error(f"Failed to read documents: {e}")
+            raise RuntimeError(f"Failed to read documents: {e}")
+
+    def sample_fields(self, size=100):
+        """
+        List the top-level fields of a random sample of documents, in order of first appearance.
+        Fields holding embedded documents or arrays (such as the GeoJSON 'location') are left out, since they
+        can't be shown as table cells, and so are fields the 'table' projection preset excludes.
+
+        Time Complexity: O(size) with a random cursor, independent of the collection size
+
+        :param size: Number of documents to sample
+        :return: List of field names, excluding '_id'
+        """
+        if size < 1:
+            raise ValueError("Sample size must be a positive integer")
+        fields = {}
+        pipeline = [{'$sample': {'size': size}}, {'$project': PROJECTION_PRESETS['table']}]
+        for document in self.aggregate_operation.execute(pipeline):
+            for field, value in document.items():
+                if isinstance(value, (dict, list)):
+                    fields[field] = False
+                else:
+                    fields.setdefault(field, True)
+        return [field for field, scalar in fields.items() if scalar]
 
-    def update(self, query, update_data):
+    def count(self, query):
+        """
+        Count the documents in the collection that match the query.
+
+        Time Complexity: O(log n) when the query is covered by an index, O(n) otherwise
+
+        :param query: Dictionary representing the query criteria
+        :return: Number of matching documents
+        """
+        return self.read_operation.count(query)
+
+    def breed_counts(self, query, top_n=20):
+        """
+        Count the documents matching the query per breed, computed by the database.
+        Only the top_n breeds and their counts are returned, so charting a breed distribution no longer needs
+        the matching documents themselves. With rollups enabled, queries on the rollup dimensions are answered
+        from the rollup collection instead.
+
+        Time Complexity: O(m) over the m matching documents (found in O(log n) with an index), plus O(b log b)
+        to sort the b distinct breeds
+
+        :param query: Dictionary representing the query criteria
+        :param top_n: Number of most common breeds to return
+        :return: List of dictionaries with 'breed' and 'count' keys, most common first
+        """
+        if top_n < 1:
+            raise ValueError("top_n must be a positive integer")
+        if self.rollups is not None:
+            try:
+                rows = self.rollups.read(query, group_by=('breed',), top_n=top_n)
+                return [{'breed': row['breed'], 'count': row['count']} for row in rows]
+            except ValueError:
+                # The query filters on a field the rollups don't keep
+                pass
+        pipeline = [
+            {'$match': query},
+            {'$project': PROJECTION_PRESETS['breed-chart']},
+            {'$group': {'_id': '$breed', 'count': {'$sum': 1}}},
+            # Break ties on the breed name so the order is stable between calls
+            {'$sort': {'count': -1, '_id': 1}},
+            {'$limit': top_n},
+            {'$project': {'_id': 0, 'breed': '$_id', 'count': 1}},
+        ]
+        return self.aggregate_operation.execute(pipeline)
+
+    def outcome_series(self, query=None, start=None, end=None, unit='month', split_by='outcome_type'):
+        """
+        Count the outcomes matching the query per day, week or month, split by outcome type, computed by the
+        database. The date range is matched on the datetime index, so only the outcomes in it are read.
+
+        Time Complexity: O(log n + m) over the m outcomes in the range, plus O(t log t) to sort the t buckets
+
+        :param query: Optional dictionary representing the query criteria
+        :param start: Optional first outcome date to include
+        :param end: Optional first outcome date to exclude
+        :param unit: Bucket size: 'day', 'week' or 'month'
+        :param split_by: Field whose values get a series each, or None for a single series
+        :return: List of dictionaries with 'period' (start of the bucket), split_by and 'count', in time order
+        """
+        pipeline = time_series_pipeline(combine_queries(query or {}, date_range(start, end)), unit=unit,
+                                         split_by=split_by)
+        return self.aggregate_operation.execute(pipeline)
+
+    def faceted_search(self, query, selected=None, sort=None, skip=0, limit=25, projection=None):
+        """
+        Read a page of results together with the counts behind the dashboard filters, in one aggregation.
+        Each facet (animal type, rescue type, outcome type, sex) is counted with every selection but its own,
+        so the count of an option is the number of results picking it would give.
+
+        Time Complexity: O(log n + m) over the m documents matching the query, once per facet
+
+        :param query: Dictionary of the criteria that aren't facets, such as the table filter and date range
+        :param selected: Dictionary of facet name to selected value, e.g. {'animal_type': 'Dog'}; 'All' doesn't filter
+        :param sort: Optional list of (field, direction) tuples for the page
+        :param skip: Number of matching documents to skip
+        :param limit: Page size; 0 returns the total and counts without documents
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :return: Dictionary with 'documents', 'total' and 'facets', which maps each facet to {'all': count
+            without its selection, 'values': count per option}
+        """
+        pipeline = facet_pipeline(query, selected, sort=sort, skip=skip, limit=limit, projection=projection)
+        return facet_results(self.aggregate_operation.execute(pipeline)[0])
+
+    def outcome_stats(self, query=None, group_by=ROLLUP_DIMENSIONS, top_n=None):
+        """
+        Read outcome counts and average age in weeks from the rollup collection, grouped by any of month,
+        animal_type, outcome_type and breed. Requires the shelter to be created with rollups=True.
+
+        Time Complexity: O(r) over the r rollup rows matching the query, independent of the number of outcomes
+
+        :param query: Optional query on the rollup dimensions, e.g. {'outcome_type': 'Adoption'}
+        :param group_by: Dimensions to group by
+        :param top_n: Return only the top_n groups with the most outcomes
+        :return: List of dictionaries with the group_by dimensions, 'count' and 'avg_age_weeks'
+        """
+        if self.rollups is None:
+            raise RuntimeError("Outcome rollups are not enabled for this shelter")
+        return self.rollups.read(query, group_by=group_by, top_n=top_n)
+
+    def rebuild_rollups(self):
+        """
+        Recompute the outcome rollups from the whole collection with a $merge aggregation.
+
+        Time Complexity: O(n) over every outcome
+
+        :return: Number of rollup rows
+        """
+        if self.rollups is None:
+            raise RuntimeError("Outcome rollups are not enabled for this shelter")
+        try:
+            return self.rollups.rebuild()
+        finally:
+            invalidate_cache(self.cache)
+
+    def read_within_box(self, bounds, query=None, projection=None, limit=0):
+        """
+        Read documents located inside a map viewport, using the location_2dsphere index.
+
+        Time Complexity: O(log n + m) for the m documents inside the box
+
+        :param bounds: Leaflet bounds [[south, west], [north, east]]
+        :param query: Optional dictionary of additional query criteria
+        :param projection: Dictionary representing the fields to include or exclude
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :return: List of documents inside the box
+        """
+        return self.read(combine_queries(query, within_box(bounds)), projection, limit=limit)
+
+    def read_within_polygon(self, coordinates, query=None, projection=None, limit=0):
+        """
+        Read documents located inside a polygon, using the location_2dsphere index.
+
+        Time Complexity: O(log n + m) for the m documents inside the polygon
+
+        :param coordinates: List of [longitude, latitude] pairs describing the polygon
+        :param query: Optional dictionary of additional query criteria
+        :param projection: Dictionary representing the fields to include or exclude
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :return: List of documents inside the polygon
+        """
+        return self.read(combine_queries(query, within_polygon(coordinates)), projection, limit=limit)
+
+    def read_near(self, longitude, latitude, max_distance_m=None, query=None, projection=None, limit=0):
+        """
+        Read documents nearest to a point, closest first, using the location_2dsphere index.
+
+        Time Complexity: O(log n + m) for the m documents within the radius
+
+        :param longitude: Longitude of the centre point
+        :param latitude: Latitude of the centre point
+        :param max_distance_m: Optional search radius in metres
+        :param query: Optional dictionary of additional query criteria
+        :param projection: Dictionary representing the fields to include or exclude
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :return: List of documents ordered by distance
+        """
+        return self.read(combine_queries(query, near(longitude, latitude, max_distance_m)), projection, limit=limit)
+
+    def cluster_markers(self, bounds, zoom, query=None, max_markers=500):
+        """
+        Get the map markers for a viewport. Below DETAIL_ZOOM, locations are grouped into grid cells by the
+        database so the browser draws at most max_markers clusters however many animals are in view; at
+        DETAIL_ZOOM and above, individual animals are returned.
+
+        Time Complexity: O(log n + m) for the m documents in the viewport, returning at most max_markers items
+
+        :param bounds: Leaflet bounds [[south, west], [north, east]]
+        :param zoom: Leaflet zoom level
+        :param query: Optional dictionary of additional query criteria
+        :param max_markers: Maximum number of markers or clusters to return
+        :return: List of dictionaries with 'lat', 'lng', 'count', 'name' and 'breed' keys
+        """
+        query = combine_queries(query, within_box(bounds))
+        if zoom >= DETAIL_ZOOM:
+            return [
+                {'lat': doc.get('location_lat'), 'lng': doc.get('location_long'), 'count': 1,
+                 'name': doc.get('name'), 'breed': doc.get('breed')}
+                for doc in self.read(query, 'map-markers', limit=max_markers)
+            ]
+        pipeline = cluster_pipeline(query, zoom, max_markers)
+        # Only the marker fields move from the match into the grouping
+        pipeline.insert(1, {'$project': PROJECTION_PRESETS['map-markers']})
+        return self.aggregate_operation.execute(pipeline)
+
+    def backfill_locations(self):
+        """
+        Add a GeoJSON 'location' point, built from location_lat/location_long, to documents that don't have one,
+        so they can be found by the geospatial queries.
+
+        :return: Number of documents updated
+        """
+        try:
+            result = self.collection.update_many(
+                {'location': {'$exists': False},
+                 'location_lat': {'$type': 'number'},
+                 'location_long': {'$type': 'number'}},
+                [{'$set': {'location': {'type': 'Point', 'coordinates': ['$location_long', '$location_lat']}}}]
+            )
+            return result.modified_count
+        except Exception as e:
+            raise RuntimeError(f"Failed to backfill locations: {e}")
+        finally:
+            invalidate_cache(self.cache)
+
+    def backfill_rescue_tags(self):
+        """
+        Set the 'rescue_tags' of every document from its breed, for documents written before the tags existed or
+        after the breeds suited to a rescue type changed. New writes are tagged as they are made.
+
+        :return: Number of documents updated
+        """
+        try:
+            return backfill_rescue_tags(self.collection)
+        finally:
+            invalidate_cache(self.cache)
+
+    def update(self, query, update_data, wait=True):
         """
         Update a document in the collection based on the query.
+        With a write buffer the update is queued, and the result only says the update was acknowledged, since a
+        bulk write doesn't report which of its updates changed a document. Updates that move a document between
+        rollup rows, and deletes when rollups are enabled, need the old document and are written directly after
+        flushing the buffer.
 
         Time Complexity: O(log n) When used in conjuction with indexed fields, non-indexed fields is O(n), and the actual modification
          of a document is O(1)
         
+
         :param query: Dictionary representing the query criteria
         :param update_data: Dictionary representing the update data
-        :return: Boolean indicating success of the operation
+        :param wait: With a write buffer, block until the update is acknowledged; False returns its Future instead
+        :return: Boolean indicating success of the operation, or a Future of it when wait is False
         """
-        return self.update_operation.execute(query, update_data)
+        if self.write_buffer is None:
+            return self.update_operation.execute(query, update_data)
+        if self.rollups is not None and self.rollups.touches(update_data):
+            self.write_buffer.flush()
+            return self.update_operation.execute(query, update_data)
+        return self._buffered(self.write_buffer.update(query, update_data), wait)
 
-    def delete(self, query):
+    def delete(self, query, wait=True):
         """
         Delete a document from the collection based on the query.
+        With a write buffer the delete is queued like update.
 
         Time Complexity: Best case is O(log n) when used with indexed fields, worst case is O(n) when used without indexes
 
         :param query: Dictionary representing the query criteria
-        :return: Boolean indicating success of the operation
+        :param wait: With a write buffer, block until the delete is acknowledged; False returns its Future instead
+        :return: Boolean indicating success of the operation, or a Future of it when wait is False
+        """
+        if self.write_buffer is None:
+            return self.delete_operation.execute(query)
+        if self.rollups is not None:
+            self.write_buffer.flush()
+            return self.delete_operation.execute(query)
+        return self._buffered(self.write_buffer.delete(query), wait)
+
+    def flush_writes(self):
+        """
+        Write every buffered write now. Does nothing without a write buffer.
+        """
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
+    def pool_stats(self):
+        """
+        Get statistics for the connection pool shared by this shelter.
+
+        :return: Dictionary with checked out connections, checkout counts and wait times
         """
-        return self.delete_operation.execute(query)
+        return self.db_connection.pool_stats()
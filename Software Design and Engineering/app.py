@@ -3,55 +3,205 @@ app.py
 Author: Nathan Wilson
 Contact: nathan.wilson3@outlook.com
 Date: 2024-07-27
-Version: 1.3
+Version: 1.5
 Purpose: This is the main application file for the CS-340 Dashboard. It provides a web interface for interacting with the AnimalShelter database.
-Issues: None known
+Usage: python app.py starts the development server. In production, serve wsgi.py with several worker processes,
+e.g. gunicorn -c gunicorn.conf.py wsgi:application
+Issues: Operation metrics are collected per worker process, so /metrics reports the worker that served the request.
+Live updates (LIVE_UPDATES=true) keep one server thread per open dashboard. The columnar backend
+(SHELTER_BACKEND=columnar) holds the data in each worker process, so run it with a single worker
 """
 
 import os
+import json
+import tempfile
+import threading
+import time
 from dotenv import load_dotenv
 import logging
 import dash
 import dash_leaflet as dl
 from dash import dcc, html, dash_table
-import plotly.express as px
 from dash.dependencies import Input, Output, State
 import base64
-import pandas as pd
+import flask
 from animalShelter import AnimalShelter
+from changeFeed import ChangeFeed, to_row, parse_row_id
+from crudOperations import page_sort
+from queryCache import QueryCache, SqliteQueryCache, ChangeStreamInvalidator
+from queryMetrics import QueryMetrics
+from geoQueries import marker_radius
+from tableQuery import parse_filter_query, parse_sort_by, page_bounds, combine_queries
+from rescueQueries import construct_query, RESCUE_TYPES
+from facetQueries import ALL_VALUES
+from timeQueries import date_range, end_of_day
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
 # Load environment variables
 load_dotenv()
+# "mongo" serves the dashboard from MongoDB; "columnar" from an in-memory copy of SHELTER_DATA_PATH (CSV or Parquet,
+# defaults to columnarShelter.CSV_PATH)
+SHELTER_BACKEND = os.getenv("SHELTER_BACKEND", "mongo").lower()
+SHELTER_DATA_PATH = os.getenv("SHELTER_DATA_PATH")
 MONGO_CONNECTION_STRING = os.getenv("MONGO_CONNECTION_STRING")
 DB_NAME = os.getenv("DB_NAME")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "128"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+# "memory" keeps cached results per process; "sqlite" shares them between the worker processes on this host
+QUERY_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "memory").lower()
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", os.path.join(tempfile.gettempdir(), 'animal_shelter_cache.sqlite'))
+# Set to "true" when several app workers share the database (requires a replica set)
+QUERY_CACHE_WATCH = os.getenv("QUERY_CACHE_WATCH", "false").lower() == "true"
+# Set to "true" to time every database operation and serve the results on /metrics and /metrics.json
+QUERY_METRICS = os.getenv("QUERY_METRICS", "false").lower() == "true"
+QUERY_METRICS_SLOW_MS = float(os.getenv("QUERY_METRICS_SLOW_MS", "100"))
+QUERY_METRICS_SAMPLE_RATE = float(os.getenv("QUERY_METRICS_SAMPLE_RATE", "0.1"))
+# Set to "true" to keep the outcome rollup collection up to date and draw the breed chart from it
+OUTCOME_ROLLUPS = os.getenv("OUTCOME_ROLLUPS", "false").lower() == "true"
+# Set to "true" to batch single-document writes from concurrent requests into bulk writes
+WRITE_BUFFER = os.getenv("WRITE_BUFFER", "false").lower() == "true"
+WRITE_BUFFER_MAX_BATCH = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "500"))
+WRITE_BUFFER_MAX_DELAY_MS = float(os.getenv("WRITE_BUFFER_MAX_DELAY_MS", "50"))
+# Set to "true" to push other users' changes to open dashboards (requires a replica set)
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "false").lower() == "true"
+# Comma-separated table columns; when unset they are read from the column cache file or a sample of documents
+TABLE_COLUMNS = os.getenv("TABLE_COLUMNS")
+COLUMN_CACHE_PATH = os.getenv("COLUMN_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                '.table_columns.json'))
+COLUMN_CACHE_TTL = float(os.getenv("COLUMN_CACHE_TTL", "86400"))
+SCHEMA_SAMPLE_SIZE = int(os.getenv("SCHEMA_SAMPLE_SIZE", "100"))
 
-if not MONGO_CONNECTION_STRING or not DB_NAME:
+if SHELTER_BACKEND not in ('mongo', 'columnar'):
+    logging.error(f"Unknown shelter backend: {SHELTER_BACKEND}")
+    exit(1)
+
+if SHELTER_BACKEND == 'mongo' and (not MONGO_CONNECTION_STRING or not DB_NAME):
     logging.error("Environment variables for MongoDB connection are not set correctly.")
     exit(1)
 
-# Connect to the AnimalShelter database and collection
-try:
-    shelter = AnimalShelter(MONGO_CONNECTION_STRING, DB_NAME, "AnimalShelter")
-    logging.info("Successfully connected to the database and accessed the collection.")
-except Exception as e:
-    logging.error(f"Failed to connect to the database: {e}")
+if SHELTER_BACKEND == 'columnar' and (LIVE_UPDATES or QUERY_CACHE_WATCH):
+    logging.error("Live updates and cache watching need change streams, which the columnar backend doesn't have.")
     exit(1)
 
-# Fetch data from the database
-try:
-    data = shelter.read({})
-    df = pd.DataFrame(data)
-    if not df.empty:
-        df.drop(columns=['_id'], inplace=True)
-    logging.info("Successfully fetched data from the database.")
-except Exception as e:
-    logging.error(f"Failed to fetch data: {e}")
-    df = pd.DataFrame()  # Use an empty DataFrame to avoid crashing
+if QUERY_CACHE_BACKEND not in ('memory', 'sqlite'):
+    logging.error(f"Unknown query cache backend: {QUERY_CACHE_BACKEND}")
+    exit(1)
+
+# Per-process state. The cache and metrics are created by create_app; the shelter and the table columns are created
+# on first use, so importing the app does no database work
+_configured = False
+query_cache = None
+query_metrics = None
+_shelter = None
+_change_feed = None
+_table_columns = None
+_shelter_lock = threading.Lock()
+_columns_lock = threading.Lock()
+
+# Create the query cache for the configured backend
+def make_query_cache():
+    if QUERY_CACHE_BACKEND == 'sqlite':
+        return SqliteQueryCache(QUERY_CACHE_PATH, max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL)
+    return QueryCache(max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL)
+
+# Create the operation metrics, or None when they are disabled
+def make_query_metrics():
+    if not QUERY_METRICS:
+        return None
+    return QueryMetrics(slow_ms=QUERY_METRICS_SLOW_MS, explain_sample_rate=QUERY_METRICS_SAMPLE_RATE)
+
+# MongoClient, locks and background threads don't survive a fork, so every worker of a preloading server
+# (gunicorn preload_app, uwsgi without lazy-apps) connects on its own and starts with a fresh cache and metrics.
+# The table columns are plain data and are kept.
+def reset_after_fork():
+    global query_cache, query_metrics, _shelter, _change_feed, _shelter_lock, _columns_lock
+    _shelter = None
+    _change_feed = None
+    _shelter_lock = threading.Lock()
+    _columns_lock = threading.Lock()
+    if _configured:
+        query_cache = make_query_cache()
+        query_metrics = make_query_metrics()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+# Connect to the AnimalShelter database and collection on first use, or load the columnar copy of the data
+def get_shelter():
+    global _shelter
+    if _shelter is None:
+        with _shelter_lock:
+            if _shelter is None and SHELTER_BACKEND == 'columnar':
+                # Imported here so processes serving MongoDB never load numpy and pandas
+                from columnarShelter import ColumnarAnimalShelter, CSV_PATH
+                path = SHELTER_DATA_PATH or CSV_PATH
+                try:
+                    shelter = ColumnarAnimalShelter.from_file(path)
+                    logging.info(f"Loaded {shelter.size} outcomes from {path}.")
+                except Exception as e:
+                    logging.error(f"Failed to load {path}: {e}")
+                    raise
+                _shelter = shelter
+            elif _shelter is None:
+                try:
+                    shelter = AnimalShelter(MONGO_CONNECTION_STRING, DB_NAME, "AnimalShelter", cache=query_cache,
+                                            metrics=query_metrics, rollups=OUTCOME_ROLLUPS,
+                                            write_buffer={'max_batch': WRITE_BUFFER_MAX_BATCH,
+                                                          'max_delay_ms': WRITE_BUFFER_MAX_DELAY_MS}
+                                            if WRITE_BUFFER else None)
+                    if QUERY_CACHE_WATCH:
+                        ChangeStreamInvalidator(shelter.collection, query_cache).start()
+                    logging.info("Successfully connected to the database and accessed the collection.")
+                except Exception as e:
+                    logging.error(f"Failed to connect to the database: {e}")
+                    raise
+                _shelter = shelter
+    return _shelter
 
-# Initialize the Dash app
+# Watch the collection for changes to push to this process's dashboards, on first use
+def get_change_feed():
+    global _change_feed
+    if _change_feed is None:
+        with _shelter_lock:
+            if _change_feed is None:
+                _change_feed = ChangeFeed(get_shelter().collection, projection='table-rows', cache=query_cache)
+    return _change_feed
+
+# Read the column list cached by an earlier start, if it is recent enough
+def load_cached_columns():
+    try:
+        if time.time() - os.path.getmtime(COLUMN_CACHE_PATH) > COLUMN_CACHE_TTL:
+            return None
+        with open(COLUMN_CACHE_PATH) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+# Table columns, from TABLE_COLUMNS, the column cache file, or a sample of documents (in that order)
+def table_columns():
+    global _table_columns
+    if _table_columns is None:
+        with _columns_lock:
+            if _table_columns is None:
+                if TABLE_COLUMNS:
+                    columns = [column.strip() for column in TABLE_COLUMNS.split(',') if column.strip()]
+                else:
+                    columns = load_cached_columns()
+                if not columns:
+                    try:
+                        columns = get_shelter().sample_fields(SCHEMA_SAMPLE_SIZE)
+                        logging.info(f"Sampled {len(columns)} table columns from the database.")
+                        with open(COLUMN_CACHE_PATH, 'w') as cache_file:
+                            json.dump(columns, cache_file)
+                    except Exception as e:
+                        logging.error(f"Failed to sample table columns: {e}")
+                        return []
+                _table_columns = columns
+    return _table_columns
+
+# Initialize the Dash app; create_app finishes setting it up
 app = dash.Dash(__name__)
 
 # Load and encode the image
@@ -63,104 +213,266 @@ except Exception as e:
     logging.error(f"Failed to load and encode the image: {e}")
     encoded_image = ""
 
-# Helper function to construct query based on rescue type
-def construct_query(rescue_type):
-    if rescue_type == 'Water Rescue':
-        return {'breed': {'$in': ['Labrador Retriever Mix', 'Chesapeake Bay Retriever', 'Newfoundland']}}
-    elif rescue_type == 'Mountain or Wilderness Rescue':
-        return {'breed': {'$in': ['German Shepherd', 'Alaskan Malamute', 'Old English Sheepdog', 'Siberian Husky', 'Rottweiler']}}
-    elif rescue_type == 'Disaster or Individual Tracking':
-        return {'breed': {'$in': ['Doberman Pinscher', 'German Shepherd', 'Golden Retriever', 'Bloodhound', 'Rottweiler']}}
-    else:
-        return {}
-
-# Define the layout of the app
-app.layout = html.Div([
-    html.Center(html.B(html.H1('Austin Animal Shelter Dashboard'))),
-    html.Hr(),
-    html.Div([
-        html.Img(
-            src=f'data:image/png;base64,{encoded_image}',
-            style={
-                'width': '25%',  # Adjust the width as needed
-                'height': 'auto',
-                'display': 'block',
-                'margin-left': 'auto',
-                'margin-right': 'auto',
-                'margin-top': '10px'  # Adjust this value to move the image down from the top
-            }
-        ),
-        dcc.RadioItems(
-            id='filter-type',
-            options=[
-                {'label': 'All', 'value': 'all'},
-                {'label': 'Cats', 'value': 'Cat'},
-                {'label': 'Dogs', 'value': 'Dog'}
-            ],
-            value='all',
-            labelStyle={'display': 'inline-block'},
-            style={'text-align': 'center', 'margin-top': '20px'}
+# Initial map view over the Austin area
+MAP_CENTER = [30.45, -97.7]
+MAP_ZOOM = 9
+
+# Build the query for the current dashboard filters, shared by the table and the charts.
+# The date picker's end date is the last day shown, so the range runs until the midnight after it.
+def build_query(filter_type, rescue_type, filter_query=None, start_date=None, end_date=None):
+    query = construct_query(rescue_type)
+    if filter_type != 'all':
+        query["animal_type"] = filter_type
+    return combine_queries(query, parse_filter_query(filter_query, allowed_columns=table_columns()),
+                           date_range(start_date, end_of_day(end_date)))
+
+# Labels and values of the filter radio options
+ANIMAL_TYPE_OPTIONS = [('All', 'all'), ('Cats', 'Cat'), ('Dogs', 'Dog')]
+RESCUE_TYPE_OPTIONS = [(label, label) for label in RESCUE_TYPES] + [('All', 'All')]
+
+# Build radio options, with the number of results next to each label once the counts are known
+def radio_options(options, counts=None):
+    if counts is None:
+        return [{'label': label, 'value': value} for label, value in options]
+    return [{'label': f"{label} ({counts['all'] if value in ALL_VALUES else counts['values'].get(value, 0):,})",
+             'value': value} for label, value in options]
+
+# Define the layout of the app for the given table columns
+def build_layout(columns):
+    return html.Div([
+        html.Center(html.B(html.H1('Austin Animal Shelter Dashboard'))),
+        html.Hr(),
+        html.Div([
+            html.Img(
+                src=f'data:image/png;base64,{encoded_image}',
+                style={
+                    'width': '25%',  # Adjust the width as needed
+                    'height': 'auto',
+                    'display': 'block',
+                    'margin-left': 'auto',
+                    'margin-right': 'auto',
+                    'margin-top': '10px'  # Adjust this value to move the image down from the top
+                }
+            ),
+            dcc.RadioItems(
+                id='filter-type',
+                options=radio_options(ANIMAL_TYPE_OPTIONS),
+                value='all',
+                labelStyle={'display': 'inline-block'},
+                style={'text-align': 'center', 'margin-top': '20px'}
+            ),
+            # Add rescue type filter
+            dcc.RadioItems(
+                id='rescue-type-radio',
+                options=radio_options(RESCUE_TYPE_OPTIONS),
+                value='All',
+                labelStyle={'display': 'inline-block'},
+                style={'text-align': 'center', 'margin-top': '20px'}
+            ),
+            # Outcome date range, matched on the datetime index
+            html.Div(
+                dcc.DatePickerRange(id='date-range', clearable=True, start_date_placeholder_text='Outcomes from',
+                                    end_date_placeholder_text='Outcomes until'),
+                style={'text-align': 'center', 'margin-top': '20px'}
+            ),
+        ]),
+        # Input fields for CRUD operations
+        html.Hr(),
+        html.Div([
+            dcc.Input(id='animal_id', type='text', placeholder='Animal ID'),
+            dcc.Input(id='name', type='text', placeholder='Name'),
+            dcc.Input(id='animal_type', type='text', placeholder='Type'),
+            dcc.Input(id='breed', type='text', placeholder='Breed'),
+            dcc.Input(id='color', type='text', placeholder='Color'),
+            dcc.Input(id='age', type='number', placeholder='Age'),
+            dcc.Input(id='adopted', type='text', placeholder='Adopted (True/False)'),
+            html.Button('Create', id='create-button', n_clicks=0),
+            html.Button('Update', id='update-button', n_clicks=0),
+            html.Button('Delete', id='delete-button', n_clicks=0),
+        ], style={'display': 'flex', 'justify-content': 'center'}),
+        html.Hr(),
+        dash_table.DataTable(
+            id='datatable-id',
+            columns=[{"name": i, "id": i, "deletable": False, "selectable": True} for i in columns],
+            data=[],
+            editable=True,
+            # Filtering, sorting and paging are done in MongoDB so only the current page is sent to the browser
+            filter_action="custom",
+            filter_query='',
+            sort_action="custom",
+            sort_mode="multi",
+            sort_by=[],
+            row_selectable="multi",
+            row_deletable=False,
+            selected_rows=[],
+            page_action="custom",
+            page_current=0,
+            page_size=10,
+            page_count=0,
         ),
-        # Add rescue type filter
+        # Continuation tokens of the pages reached by paging forward, keyed by page number
+        dcc.Store(id='page-tokens', data={}),
+        # Event stream the browser subscribes to (None when live updates are off), and the deltas it received
+        dcc.Store(id='change-feed-url', data='/changes' if LIVE_UPDATES else None),
+        dcc.Store(id='change-deltas'),
+        # Bumped whenever the documents change (Create/Update/Delete or the change feed), so the charts and counts
+        # refresh then rather than on every page or sort of the table
+        dcc.Store(id='data-version', data=0),
+        html.Br(),
+        html.Hr(),
+        html.Div(className='row', style={'display': 'flex'}, children=[
+            html.Div(id='graph-id', className='col s12 m6'),
+            html.Div(id='map-id', className='col s12 m6', children=[
+                dl.Map(id='outcome-map', center=MAP_CENTER, zoom=MAP_ZOOM, trackViewport=True,
+                       style={'width': '1000px', 'height': '500px'}, children=[
+                    dl.TileLayer(id="base-layer-id"),
+                    dl.LayerGroup(id='cluster-layer'),
+                    dl.LayerGroup(id='selected-layer'),
+                ])
+            ])
+        ]),
+        html.Hr(),
         dcc.RadioItems(
-            id='rescue-type-radio',
+            id='trend-unit',
             options=[
-                {'label': 'Water Rescue', 'value': 'Water Rescue'},
-                {'label': 'Mountain or Wilderness Rescue', 'value': 'Mountain or Wilderness Rescue'},
-                {'label': 'Disaster or Individual Tracking', 'value': 'Disaster or Individual Tracking'},
-                {'label': 'All', 'value': 'All'}
+                {'label': 'Daily', 'value': 'day'},
+                {'label': 'Weekly', 'value': 'week'},
+                {'label': 'Monthly', 'value': 'month'}
             ],
-            value='All',
+            value='month',
             labelStyle={'display': 'inline-block'},
-            style={'text-align': 'center', 'margin-top': '20px'}
+            style={'text-align': 'center'}
         ),
-    ]),
-    # Input fields for CRUD operations
-    html.Hr(),
-    html.Div([
-        dcc.Input(id='animal_id', type='text', placeholder='Animal ID'),
-        dcc.Input(id='name', type='text', placeholder='Name'),
-        dcc.Input(id='animal_type', type='text', placeholder='Type'),
-        dcc.Input(id='breed', type='text', placeholder='Breed'),
-        dcc.Input(id='color', type='text', placeholder='Color'),
-        dcc.Input(id='age', type='number', placeholder='Age'),
-        dcc.Input(id='adopted', type='text', placeholder='Adopted (True/False)'),
-        html.Button('Create', id='create-button', n_clicks=0),
-        html.Button('Update', id='update-button', n_clicks=0),
-        html.Button('Delete', id='delete-button', n_clicks=0),
-    ], style={'display': 'flex', 'justify-content': 'center'}),
-    html.Hr(),
-    dash_table.DataTable(
-        id='datatable-id',
-        columns=[{"name": i, "id": i, "deletable": False, "selectable": True} for i in df.columns],
-        data=df.to_dict('records'),
-        editable=True,
-        filter_action="native",
-        sort_action="native",
-        sort_mode="multi",
-        row_selectable="multi",
-        row_deletable=False,
-        selected_rows=[],
-        page_action="native",
-        page_current=0,
-        page_size=10,
-    ),
-    html.Br(),
-    html.Hr(),
-    html.Div(className='row', style={'display': 'flex'}, children=[
-        html.Div(id='graph-id', className='col s12 m6'),
-        html.Div(id='map-id', className='col s12 m6')
+        html.Div(id='trend-id')
     ])
-])
 
-# Handle CRUD operations and filter update in a single callback
+# The layout is built per page load, so the table columns are only looked up once the first browser connects.
+# Dash validates callbacks against a column-free copy instead of calling serve_layout at import time.
+def serve_layout():
+    return build_layout(table_columns())
+
+# Inputs that change which documents match, so the table should go back to the first page
+FILTER_INPUTS = {'filter-type', 'rescue-type-radio', 'date-range'}
+# Table properties that change the page boundaries, so earlier page tokens no longer apply
+PAGING_PROPS = {'datatable-id.filter_query', 'datatable-id.sort_by', 'datatable-id.page_size'}
+
+# Index of the row on the current page with the given animal_id, or None
+def find_row(table_data, animal_id):
+    for index, row in enumerate(table_data or []):
+        if row.get('animal_id') == animal_id:
+            return index
+    return None
+
+# Index of the row on the current page with the given row id, or None
+def find_row_id(table_data, row_id):
+    for index, row in enumerate(table_data or []):
+        if row.get('id') == row_id:
+            return index
+    return None
+
+# Read table rows; each keeps its _id as the row id that live updates are matched on
+def read_rows(query, **kwargs):
+    return [to_row(document) for document in get_shelter().read(query, projection='table-rows', **kwargs)]
+
+# Number of pages for the current filters, from an indexed count rather than a page read
+def count_pages(query, page_size):
+    _, limit = page_bounds(0, page_size)
+    return max((get_shelter().count(query) + limit - 1) // limit, 1)
+
+# Append a created document to the current page if it matches the filters and the page has room;
+# otherwise it belongs to a later page and only the page count changes
+def patch_created_row(document, query, table_data, page_size):
+    patched = dash.Patch()
+    _, limit = page_bounds(0, page_size)
+    if len(table_data or []) < limit and get_shelter().count(combine_queries(query, {'_id': document['_id']})):
+        patched.append(to_row(document))
+        return patched, count_pages(query, page_size), dash.no_update
+    return dash.no_update, count_pages(query, page_size), dash.no_update
+
+# Replace an updated row in place, or drop it if the update means it no longer matches the filters
+def patch_updated_row(animal_id, update_data, query, table_data):
+    index = find_row(table_data, animal_id)
+    if index is None:
+        return dash.no_update, dash.no_update, dash.no_update
+    patched = dash.Patch()
+    if get_shelter().count(combine_queries(query, {'animal_id': animal_id})):
+        patched[index] = dict(table_data[index], **update_data)
+    else:
+        del patched[index]
+    return patched, dash.no_update, dash.no_update
+
+# Remove a deleted row from the current page and pull up the first row of the next page to keep it full
+def patch_deleted_row(animal_id, query, table_data, page_current, page_size, sort_by):
+    index = find_row(table_data, animal_id)
+    if index is None:
+        return dash.no_update, count_pages(query, page_size), dash.no_update
+    patched = dash.Patch()
+    del patched[index]
+    skip, limit = page_bounds(page_current, page_size)
+    if len(table_data) == limit:
+        for row in read_rows(query, sort=page_sort(parse_sort_by(sort_by)), skip=skip + limit - 1, limit=1):
+            patched.append(row)
+    return patched, count_pages(query, page_size), dash.no_update
+
+# Apply the inserts, updates and deletes pushed by the change feed to the current page. One read finds which of the
+# changed documents match the filters; rows that stop matching are dropped and the page is topped up from the next.
+# New matching documents are appended while the page has room, like created ones.
+def patch_changed_rows(changes, query, table_data, page_current, page_size, sort_by):
+    latest = {change['id']: change for change in changes}
+    upserted = [parse_row_id(row_id) for row_id, change in latest.items() if change['op'] == 'upsert']
+    matching = set()
+    if upserted:
+        matching = {row['id'] for row in read_rows(combine_queries(query, {'_id': {'$in': upserted}}))}
+    _, limit = page_bounds(0, page_size)
+    rows = list(table_data or [])
+    was_full = len(rows) == limit
+    patched = dash.Patch()
+    resized = False
+    for row_id, change in latest.items():
+        index = find_row_id(rows, row_id)
+        if row_id in matching and index is not None:
+            rows[index] = patched[index] = change['row']
+            continue
+        # Anything but an in-place update can change the number of matching documents
+        resized = True
+        if row_id in matching and len(rows) < limit:
+            rows.append(change['row'])
+            patched.append(change['row'])
+        elif row_id not in matching and index is not None:
+            del rows[index]
+            del patched[index]
+    if was_full and len(rows) < limit:
+        skip, _ = page_bounds(page_current, page_size)
+        for row in read_rows(query, sort=page_sort(parse_sort_by(sort_by)), skip=skip + len(rows),
+                             limit=limit - len(rows)):
+            if find_row_id(rows, row['id']) is None:
+                rows.append(row)
+                patched.append(row)
+    return patched, count_pages(query, page_size) if resized else dash.no_update, dash.no_update
+
+# Handle CRUD operations, filter updates and server-side paging in a single callback.
+# A Create/Update/Delete click patches the affected row of the current page instead of re-reading the whole page.
+# Paging forward continues from the previous page's token, so a deep page costs the same as the first.
+# Changes pushed by the change feed are patched in the same way; a reset from the feed reads the page again.
+# Every change to the documents also bumps the data version.
 @app.callback(
-    Output('datatable-id', 'data'),
+    [Output('datatable-id', 'data'),
+     Output('datatable-id', 'page_count'),
+     Output('datatable-id', 'page_current'),
+     Output('page-tokens', 'data'),
+     Output('data-version', 'data')],
     [Input('create-button', 'n_clicks'),
      Input('update-button', 'n_clicks'),
      Input('delete-button', 'n_clicks'),
      Input('filter-type', 'value'),
-     Input('rescue-type-radio', 'value')],
+     Input('rescue-type-radio', 'value'),
+     Input('datatable-id', 'page_current'),
+     Input('datatable-id', 'page_size'),
+     Input('datatable-id', 'filter_query'),
+     Input('datatable-id', 'sort_by'),
+     Input('change-deltas', 'data'),
+     Input('date-range', 'start_date'),
+     Input('date-range', 'end_date')],
     [State('animal_id', 'value'),
      State('name', 'value'),
      State('animal_type', 'value'),
@@ -168,14 +480,18 @@ app.layout = html.Div([
      State('color', 'value'),
      State('age', 'value'),
      State('adopted', 'value'),
-     State('datatable-id', 'derived_virtual_selected_rows')]
+     State('datatable-id', 'derived_virtual_selected_rows'),
+     State('datatable-id', 'data'),
+     State('page-tokens', 'data'),
+     State('data-version', 'data')]
 )
-def handle_operations_and_update_data(n_create, n_update, n_delete, filter_type, rescue_type, animal_id, name, animal_type, breed, color, age, adopted, selected_rows):
+def handle_operations_and_update_data(n_create, n_update, n_delete, filter_type, rescue_type, page_current, page_size,
+                                      filter_query, sort_by, changes, start_date, end_date, animal_id, name, animal_type,
+                                      breed, color, age, adopted, selected_rows, table_data, page_tokens, version):
     ctx = dash.callback_context
-    if not ctx.triggered:
-        return dash.no_update
-
-    button_id = ctx.triggered[0]['prop_id'].split('.')[0]
+    prop_id = ctx.triggered[0]['prop_id'] if ctx.triggered else '.'
+    button_id = prop_id.split('.')[0]
+    query = build_query(filter_type, rescue_type, filter_query, start_date, end_date)
     
     if button_id == 'create-button' and n_create > 0:
         new_animal = {
@@ -187,11 +503,12 @@ def handle_operations_and_update_data(n_create, n_update, n_delete, filter_type,
             "age": age,
             "adopted": adopted.lower() == 'true'
         }
-        shelter.create(new_animal)
+        if get_shelter().create(new_animal):
+            return *patch_created_row(new_animal, query, table_data, page_size), dash.no_update, (version or 0) + 1
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
     
     elif button_id == 'update-button' and n_update > 0:
         if selected_rows:
-            selected_row = selected_rows[0]
             update_data = {
                 "name": name,
                 "animal_type": animal_type,
@@ -200,83 +517,243 @@ def handle_operations_and_update_data(n_create, n_update, n_delete, filter_type,
                 "age": age,
                 "adopted": adopted.lower() == 'true'
             }
-            query = {"animal_id": animal_id}
-            shelter.update(query, update_data)
+            query_by_id = {"animal_id": animal_id}
+            if get_shelter().update(query_by_id, update_data):
+                return *patch_updated_row(animal_id, update_data, query, table_data), dash.no_update, \
+                    (version or 0) + 1
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
     
     elif button_id == 'delete-button' and n_delete > 0:
         if selected_rows:
-            selected_row = selected_rows[0]
-            query = {"animal_id": animal_id}
-            shelter.delete(query)
-    
-    query = construct_query(rescue_type)
-    if filter_type != 'all':
-        query["animal_type"] = filter_type
-    
-    data = shelter.read(query)
-    return pd.DataFrame(data).drop(columns=['_id']).to_dict('records')
+            if get_shelter().delete({"animal_id": animal_id}):
+                return *patch_deleted_row(animal_id, query, table_data, page_current, page_size, sort_by), \
+                    dash.no_update, (version or 0) + 1
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+    elif button_id == 'change-deltas' and changes and not changes.get('reset'):
+        return *patch_changed_rows(changes['changes'], query, table_data, page_current, page_size, sort_by), \
+            dash.no_update, (version or 0) + 1
+
+    # Any change to the filters invalidates the current page number
+    if button_id in FILTER_INPUTS or prop_id == 'datatable-id.filter_query':
+        page_current = 0
+    if button_id in FILTER_INPUTS or prop_id in PAGING_PROPS or not page_tokens:
+        page_tokens = {}
+
+    skip, limit = page_bounds(page_current, page_size)
+    total = get_shelter().count(query)
+    page_count = max((total + limit - 1) // limit, 1)
+    if skip >= total and total > 0:
+        page_current = page_count - 1
+        skip = page_current * limit
 
-# Update bar graph based on data table
+    sort = page_sort(parse_sort_by(sort_by))
+    token = page_tokens.get(str(page_current))
+    if page_current == 0 or token:
+        documents, next_token = get_shelter().read_page(query, after=token, limit=limit, sort=sort,
+                                                        projection='table-rows')
+        data = [to_row(document) for document in documents]
+        if next_token:
+            page_tokens = dict(page_tokens, **{str(page_current + 1): next_token})
+    else:
+        # A page reached by jumping ahead (e.g. to the last page) has no token yet
+        data = read_rows(query, sort=sort, skip=skip, limit=limit)
+    # A reset from the change feed means any number of documents may have changed
+    return (data, page_count, page_current, page_tokens,
+            (version or 0) + 1 if button_id == 'change-deltas' else dash.no_update)
+
+# Subscribe the browser to the change feed. The deltas it receives are written to change-deltas by
+# assets/changeFeed.js in small batches, which triggers the table callback above.
+app.clientside_callback(
+    dash.ClientsideFunction(namespace='changeFeed', function_name='subscribe'),
+    Output('change-deltas', 'data'),
+    Input('change-feed-url', 'data')
+)
+
+# Number of breeds shown in the breed distribution chart
+TOP_BREEDS = 20
+
+# Update bar graph from breed counts aggregated in MongoDB for the current filters.
+# The data version is an input only so the chart refreshes after the documents change.
 @app.callback(
     Output('graph-id', "children"),
-    [Input('datatable-id', "derived_virtual_data")]
+    [Input('data-version', 'data'),
+     Input('filter-type', 'value'),
+     Input('rescue-type-radio', 'value'),
+     Input('datatable-id', 'filter_query'),
+     Input('date-range', 'start_date'),
+     Input('date-range', 'end_date')]
 )
-def update_graphs(viewData):
+def update_graphs(version, filter_type, rescue_type, filter_query, start_date, end_date):
     try:
-        dff = pd.DataFrame.from_dict(viewData)
-        if dff.empty:
+        counts = get_shelter().breed_counts(build_query(filter_type, rescue_type, filter_query, start_date, end_date),
+                                            top_n=TOP_BREEDS)
+        if not counts:
             return dash.no_update
-        fig = px.bar(dff, x='breed', title='Breed Distribution', labels={'x': 'Breed', 'y': 'Count'})
+        import plotly.express as px
+        fig = px.bar(x=[row['breed'] for row in counts], y=[row['count'] for row in counts],
+                     title='Breed Distribution', labels={'x': 'Breed', 'y': 'Count'})
         fig.update_layout(xaxis_title='Breed', yaxis_title='Count')
         return [dcc.Graph(figure=fig)]
     except Exception as e:
         logging.error(f"Failed to update graphs: {e}")
         return []
 
-# Update map based on selected data entry
+# Draw the number of outcomes per day, week or month for the current filters, one line per outcome type.
+# The buckets are counted by MongoDB over the outcomes in the date range only, again when the documents change.
+@app.callback(
+    Output('trend-id', "children"),
+    [Input('data-version', 'data'),
+     Input('filter-type', 'value'),
+     Input('rescue-type-radio', 'value'),
+     Input('datatable-id', 'filter_query'),
+     Input('date-range', 'start_date'),
+     Input('date-range', 'end_date'),
+     Input('trend-unit', 'value')]
+)
+def update_trend(version, filter_type, rescue_type, filter_query, start_date, end_date, unit):
+    try:
+        series = get_shelter().outcome_series(build_query(filter_type, rescue_type, filter_query),
+                                              start=start_date, end=end_of_day(end_date), unit=unit or 'month')
+        if not series:
+            return []
+        import plotly.express as px
+        fig = px.line(x=[row['period'] for row in series], y=[row['count'] for row in series],
+                      color=[row['outcome_type'] or 'Unknown' for row in series], markers=True,
+                      title='Outcomes Over Time', labels={'x': 'Date', 'y': 'Outcomes', 'color': 'Outcome type'})
+        return [dcc.Graph(figure=fig)]
+    except Exception as e:
+        logging.error(f"Failed to update trend chart: {e}")
+        return []
+
+# Show the number of results next to every filter option. All the counts come from one faceted search, each facet
+# counted without its own selection so the numbers say what picking the option would give.
+# The data version is an input only so the counts refresh after the documents change.
+@app.callback(
+    [Output('filter-type', 'options'),
+     Output('rescue-type-radio', 'options')],
+    [Input('data-version', 'data'),
+     Input('filter-type', 'value'),
+     Input('rescue-type-radio', 'value'),
+     Input('datatable-id', 'filter_query'),
+     Input('date-range', 'start_date'),
+     Input('date-range', 'end_date')]
+)
+def update_filter_counts(version, filter_type, rescue_type, filter_query, start_date, end_date):
+    try:
+        facets = get_shelter().faceted_search(build_query('all', 'All', filter_query, start_date, end_date),
+                                              {'animal_type': filter_type, 'rescue_type': rescue_type},
+                                              limit=0)['facets']
+    except Exception as e:
+        logging.error(f"Failed to count filter options: {e}")
+        return dash.no_update, dash.no_update
+    return (radio_options(ANIMAL_TYPE_OPTIONS, facets['animal_type']),
+            radio_options(RESCUE_TYPE_OPTIONS, facets['rescue_type']))
+
+# Maximum number of markers or clusters drawn on the map at once
+MAX_MAP_MARKERS = 500
+
+# Update the map markers for the current viewport, clustered by MongoDB at low zoom levels.
+# The data version is an input only so the markers refresh after the documents change.
 @app.callback(
-    Output('map-id', "children"),
+    Output('cluster-layer', "children"),
+    [Input('outcome-map', 'bounds'),
+     Input('outcome-map', 'zoom'),
+     Input('data-version', 'data'),
+     Input('filter-type', 'value'),
+     Input('rescue-type-radio', 'value'),
+     Input('datatable-id', 'filter_query'),
+     Input('date-range', 'start_date'),
+     Input('date-range', 'end_date')]
+)
+def update_map_markers(bounds, zoom, version, filter_type, rescue_type, filter_query, start_date, end_date):
+    if bounds is None or zoom is None:
+        return dash.no_update
+    try:
+        clusters = get_shelter().cluster_markers(bounds, zoom,
+                                                 build_query(filter_type, rescue_type, filter_query, start_date,
+                                                             end_date),
+                                                 max_markers=MAX_MAP_MARKERS)
+    except Exception as e:
+        logging.error(f"Failed to update map markers: {e}")
+        return []
+
+    markers = []
+    for cluster in clusters:
+        position = [cluster['lat'], cluster['lng']]
+        if cluster['count'] == 1:
+            markers.append(dl.Marker(position=position, children=[
+                dl.Tooltip(cluster['breed']),
+                dl.Popup([html.H1("Animal Name"), html.P(cluster['name'])])
+            ]))
+        else:
+            markers.append(dl.CircleMarker(center=position, radius=marker_radius(cluster['count']), children=[
+                dl.Tooltip(f"{cluster['count']} animals")
+            ]))
+    return markers
+
+# Highlight the selected table rows on the map and fit the map to them
+@app.callback(
+    [Output('selected-layer', "children"),
+     Output('outcome-map', "viewport")],
     [Input('datatable-id', "derived_virtual_data"),
      Input('datatable-id', "derived_virtual_selected_rows")]
 )
 def update_map(viewData, selected_rows):
     if viewData is None or selected_rows is None or len(selected_rows) == 0:
-        return dash.no_update
-    
-    dff = pd.DataFrame.from_dict(viewData)
-    
-    # Plot multiple markers if multiple rows are selected
-    markers = []
-    lats = []
-    lons = []
-    for row in selected_rows:
-        if 'location_lat' in dff.columns and 'location_long' in dff.columns:
-            lat = dff.iloc[row]['location_lat']
-            lon = dff.iloc[row]['location_long']
-            lats.append(lat)
-            lons.append(lon)
-            marker = dl.Marker(position=[lat, lon], children=[
-                dl.Tooltip(dff.iloc[row]['breed']),
-                dl.Popup([html.H1("Animal Name"), html.P(dff.iloc[row]['name'])])
-            ])
-            markers.append(marker)
-    
-    if not markers:
-        return ["No valid coordinates available"]
+        return [], dash.no_update
 
-    # Calculate the bounds to fit all markers
-    min_lat = min(lats)
-    max_lat = max(lats)
-    min_lon = min(lons)
-    max_lon = max(lons)
-    bounds = [[min_lat, min_lon], [max_lat, max_lon]]
-
-    return [
-        dl.Map(style={'width': '1000px', 'height': '500px'}, bounds=bounds, children=[
-            dl.TileLayer(id="base-layer-id"),
-            *markers  # Unpack all markers into the map
+    # Only rows with coordinates can be plotted
+    rows = [viewData[row] for row in selected_rows if row < len(viewData)]
+    rows = [row for row in rows if row.get('location_lat') is not None and row.get('location_long') is not None]
+    if not rows:
+        return [], dash.no_update
+
+    markers = [
+        dl.Marker(position=[row['location_lat'], row['location_long']], children=[
+            dl.Tooltip(row.get('breed')),
+            dl.Popup([html.H1("Animal Name"), html.P(row.get('name'))])
         ])
+        for row in rows
     ]
 
+    # Calculate the bounds to fit all markers
+    lats = [row['location_lat'] for row in rows]
+    lons = [row['location_long'] for row in rows]
+    bounds = [[min(lats), min(lons)], [max(lats), max(lons)]]
+    return markers, {'bounds': bounds, 'transition': 'flyToBounds'}
+
+# WSGI app factory: sets up the cache, metrics routes and layout on the first call and returns the process's app.
+# Servers load it through wsgi.py; workers forked from a preloaded app get fresh per-process state from
+# reset_after_fork, and workers that import the app themselves get it here.
+def create_app():
+    global _configured, query_cache, query_metrics
+    if _configured:
+        return app
+    query_cache = make_query_cache()
+    query_metrics = make_query_metrics()
+
+    # Expose operation metrics for Prometheus scraping, or as JSON for a quick look in the browser
+    if query_metrics is not None:
+        @app.server.route('/metrics')
+        def metrics():
+            return flask.Response(query_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+        @app.server.route('/metrics.json')
+        def metrics_json():
+            return flask.jsonify(query_metrics.snapshot())
+
+    # Push changes to the dashboards as Server-Sent Events; assets/changeFeed.js applies them to the table
+    if LIVE_UPDATES:
+        @app.server.route('/changes')
+        def changes():
+            stream = get_change_feed().sse(flask.request.headers.get('Last-Event-ID'))
+            return flask.Response(flask.stream_with_context(stream), mimetype='text/event-stream',
+                                  headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    app.validation_layout = build_layout([])
+    app.layout = serve_layout
+    _configured = True
+    return app
+
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,54 @@
+/*
+changeFeed.js
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Served by Dash with the dashboard. Subscribes the browser to the /changes event stream and hands the
+deltas it receives to the change-deltas store in batches, so a burst of writes updates the table once.
+Issues: The browser reconnects on its own after errors, sending the id of the last event it saw
+*/
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    changeFeed: {
+        subscribe: function (url) {
+            const feed = window.dash_clientside.changeFeed;
+            if (!url || feed.source) {
+                return window.dash_clientside.no_update;
+            }
+            // Milliseconds to collect deltas before passing them on
+            const batchDelay = 250;
+            let pending = [];
+            let reset = false;
+            let timer = null;
+
+            const flush = function () {
+                timer = null;
+                window.dash_clientside.set_props('change-deltas', {
+                    data: {changes: pending, reset: reset, received: Date.now()}
+                });
+                pending = [];
+                reset = false;
+            };
+
+            feed.source = new EventSource(url);
+            feed.source.onmessage = function (message) {
+                const delta = JSON.parse(message.data);
+                if (delta.op === 'reset') {
+                    // Some changes were missed, so the page is read again and earlier deltas don't matter
+                    reset = true;
+                    pending = [];
+                } else if (!reset) {
+                    pending.push(delta);
+                }
+                if (timer === null) {
+                    timer = setTimeout(flush, batchDelay);
+                }
+            };
+            feed.source.addEventListener('unavailable', function () {
+                feed.source.close();
+            });
+            return window.dash_clientside.no_update;
+        }
+    }
+});
@@ -0,0 +1,147 @@
+"""
+asyncAnimalShelter.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: This module provides an asyncio interface for CRUD operations on the AnimalShelter collection in MongoDB.
+It keeps the create/read/update/delete contract of AnimalShelter, and adds read_many so that independent reads
+(e.g. the table page, its count and the chart data) run concurrently instead of one round trip after another.
+With rollups=True every write keeps the outcome rollups up to date, as the synchronous AnimalShelter does.
+Issues: Indexes are not created here; they are managed by the synchronous AnimalShelter. Rollups are read with
+AnimalShelter.outcome_stats
+"""
+
+import asyncio
+import logging
+
+from AsyncDatabaseConnection import AsyncDatabaseConnection
+from asyncCrudOperations import (AsyncCreateOperation, AsyncReadOperation, AsyncUpdateOperation,
+                                 AsyncDeleteOperation, AsyncBulkOperations)
+from crudOperations import DEFAULT_BATCH_SIZE, invalidate_cache
+from outcomeRollups import AsyncOutcomeRollups
+
+logging.basicConfig(level=logging.INFO)
+
+
+class AsyncAnimalShelter:
+    """
+    The AsyncAnimalShelter class provides an asyncio interface for CRUD operations on the AnimalShelter collection.
+    """
+
+    def __init__(self, connection_string, db_name, collection_name, cache=None, rollups=False):
+        """
+        Initialize the AsyncAnimalShelter with a database connection and collection name.
+
+        :param connection_string: MongoDB connection string
+        :param db_name: Name of the database
+        :param collection_name: Name of the collection
+        :param cache: Optional QueryCache that serves repeated reads and is invalidated by every write
+        :param rollups: Keep the outcome rollup collection up to date on every write
+        """
+        self.db_connection = AsyncDatabaseConnection(connection_string, db_name)
+        self.collection = self.db_connection.get_collection(collection_name)
+        self.cache = cache
+        self.rollups = AsyncOutcomeRollups(self.collection) if rollups else None
+
+        self.create_operation = AsyncCreateOperation(self.collection, cache, rollups=self.rollups)
+        self.read_operation = AsyncReadOperation(self.collection, cache)
+        self.update_operation = AsyncUpdateOperation(self.collection, cache, rollups=self.rollups)
+        self.delete_operation = AsyncDeleteOperation(self.collection, cache, rollups=self.rollups)
+        self.bulk_operations = AsyncBulkOperations(self.collection, cache, rollups=self.rollups)
+
+    async def create(self, data):
+        """
+        Create a new document in the collection.
+
+        :param data: Dictionary representing the document to be created
+        :return: Boolean indicating success of the operation
+        """
+        return await self.create_operation.execute(data)
+
+    async def read(self, query, projection=None, sort=None, skip=0, limit=0):
+        """
+        Read documents from the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param skip: Number of matching documents to skip
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :return: List of documents matching the query
+        """
+        return await self.read_operation.execute(query, projection, sort=sort, skip=skip, limit=limit)
+
+    async def read_many(self, requests):
+        """
+        Run several independent reads concurrently.
+        The total latency is that of the slowest read rather than the sum of all of them.
+
+        :param requests: List of dictionaries of read keyword arguments (query, projection, sort, skip, limit)
+        :return: List of results in the same order as the requests
+        """
+        return await asyncio.gather(*(self.read(**request) for request in requests))
+
+    def stream(self, query, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE, max_time_ms=None):
+        """
+        Lazily read documents from the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param batch_size: Number of documents fetched per round trip
+        :param max_time_ms: Optional server-side time limit for the query in milliseconds
+        :return: Async generator of documents
+        """
+        return self.read_operation.stream(query, projection, sort=sort, limit=limit, batch_size=batch_size,
+                                          max_time_ms=max_time_ms)
+
+    async def count(self, query):
+        """
+        Count the documents in the collection that match the query.
+
+        :param query: Dictionary representing the query criteria
+        :return: Number of matching documents
+        """
+        return await self.read_operation.count(query)
+
+    async def update(self, query, update_data):
+        """
+        Update a document in the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :param update_data: Dictionary representing the update data
+        :return: Boolean indicating success of the operation
+        """
+        return await self.update_operation.execute(query, update_data)
+
+    async def delete(self, query):
+        """
+        Delete a document from the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :return: Boolean indicating success of the operation
+        """
+        return await self.delete_operation.execute(query)
+
+    async def rebuild_rollups(self):
+        """
+        Recompute the outcome rollups from the whole collection with a $merge aggregation.
+
+        Time Complexity: O(n) over every outcome
+
+        :return: Number of rollup rows
+        """
+        if self.rollups is None:
+            raise RuntimeError("Outcome rollups are not enabled for this shelter")
+        try:
+            return await self.rollups.rebuild()
+        finally:
+            invalidate_cache(self.cache)
+
+    async def close(self):
+        """
+        Close the underlying client.
+        """
+        await self.db_connection.close()
@@ -0,0 +1,430 @@
+"""
+asyncCrudOperations.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.2
+Purpose: This module contains the asyncio versions of the CRUD operations in crudOperations.py. Each class keeps the
+same validation, return values, error handling and rollup updates as its synchronous counterpart; only execute is a
+coroutine.
+Issues: None known
+"""
+
+import logging
+
+import pymongo
+import pymongo.errors
+
+from crudOperations import DEFAULT_BATCH_SIZE, invalidate_cache, resolve_projection, _field_value
+from outcomeRollups import RollupTracker
+from rescueQueries import tag_document, tagged_copy, tag_fields
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def apply_rollups(rollups, added=(), removed=()):
+    """
+    Update the outcome rollups after a write, if they are configured. See crudOperations.apply_rollups.
+
+    :param rollups: AsyncOutcomeRollups or None
+    :param added: Documents that now count towards the rollups
+    :param removed: Documents that no longer count towards the rollups
+    """
+    if rollups is not None:
+        try:
+            await rollups.apply(added, removed)
+        except Exception as e:
+            logging.error(f"Failed to update rollups, rebuild them to recover: {e}")
+
+
+class AsyncBulkOperations:
+    """
+    Handles bulk operations in the MongoDB collection.
+    """
+
+    def __init__(self, collection, cache=None, rollups=None):
+        """
+        Initialize the AsyncBulkOperations with the given collection.
+
+        :param collection: AsyncCollection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param rollups: Optional AsyncOutcomeRollups kept up to date by every write
+        """
+        self.collection = collection
+        self.cache = cache
+        self.rollups = rollups
+
+    async def _track(self, requests):
+        """
+        Read the rollup fields of the documents some requests may move between rollup rows, before they are
+        written. See RollupTracker.
+
+        :param requests: List of pymongo write requests
+        :return: RollupTracker, or None without rollups
+        """
+        if self.rollups is None:
+            return None
+        tracker = RollupTracker(self.rollups)
+        projection = self.rollups.projection()
+        for index, request in enumerate(requests):
+            read = tracker.reads(index, request)
+            if read is not None:
+                query, many = read
+                if many:
+                    tracker.remember(await self.collection.find(query, projection).to_list())
+                else:
+                    tracker.remember(filter(None, [await self.collection.find_one(query, projection)]))
+        return tracker
+
+    async def _apply_tracked(self, tracker, result):
+        """
+        Move the rollups by what a tracked write changed. The write itself has finished, so a failure is logged.
+
+        :param tracker: RollupTracker returned by _track, or None
+        :param result: Bulk API result or BulkWriteError details, or None when the write failed without either
+        """
+        if tracker is None:
+            return
+        added, ids, removed = tracker.settle(result, ordered=True)
+        if not (added or ids or removed):
+            return
+        try:
+            if ids:
+                added = added + await self.collection.find({'_id': {'$in': ids}},
+                                                           self.rollups.projection()).to_list()
+        except pymongo.errors.PyMongoError as e:
+            logging.error(f"Failed to read back a bulk write, rebuild the rollups to recover: {e}")
+            return
+        await apply_rollups(self.rollups, added=added, removed=removed)
+
+    async def bulk_insert(self, data_list):
+        """
+        Insert multiple documents into the collection.
+
+        :param data_list: List of dictionaries representing the documents to be inserted
+        :return: List of inserted IDs
+        """
+        if not data_list or not isinstance(data_list, list):
+            raise ValueError("Data list must be a non-empty list of dictionaries")
+
+        documents = [tag_document(document) for document in data_list]
+        tracker = await self._track([pymongo.InsertOne(document) for document in documents])
+        try:
+            result = await self.collection.insert_many(documents)
+        except pymongo.errors.BulkWriteError as bwe:
+            logging.error(f"BulkWriteError: {bwe.details}")
+            # Part of the input may have been written; the details tell which documents were
+            await self._apply_tracked(tracker, bwe.details)
+            raise
+        except pymongo.errors.PyMongoError as pe:
+            logging.error(f"PyMongoError: {pe}")
+            await self._apply_tracked(tracker, None)
+            raise
+        finally:
+            invalidate_cache(self.cache)
+        await apply_rollups(self.rollups, added=documents)
+        return result.inserted_ids
+
+    async def bulk_update(self, operations_list):
+        """
+        Perform bulk update operations. Updates that set a rollup field move the rollups incrementally.
+
+        :param operations_list: List of update operations (each operation is a dictionary with 'filter' and 'update' keys)
+        :return: The result of the bulk update operation
+        """
+        if not operations_list or not isinstance(operations_list, list):
+            raise ValueError("Operations list must be a non-empty list of update operations")
+
+        for op in operations_list:
+            if not isinstance(op, dict) or 'filter' not in op or 'update' not in op:
+                raise ValueError("Each operation must be a dictionary with 'filter' and 'update' keys")
+
+        tracker = result = None
+        try:
+            bulk_ops = [pymongo.UpdateOne(op['filter'], {'$set': tag_fields(op['update'])})
+                        for op in operations_list]
+            tracker = await self._track(bulk_ops)
+            result = (await self.collection.bulk_write(bulk_ops)).bulk_api_result
+            return result
+        except pymongo.errors.BulkWriteError as bwe:
+            logging.error(f"BulkWriteError during bulk update: {bwe.details}")
+            result = bwe.details
+            raise
+        except pymongo.errors.PyMongoError as pe:
+            logging.error(f"PyMongoError during bulk update: {pe}")
+            raise
+        finally:
+            invalidate_cache(self.cache)
+            await self._apply_tracked(tracker, result)
+
+    async def bulk_delete(self, filter_list):
+        """
+        Perform bulk delete operations. The deleted documents are removed from the rollups incrementally.
+
+        :param filter_list: List of filter criteria for deletion
+        :return: The result of the bulk delete operation
+        """
+        if not filter_list or not isinstance(filter_list, list):
+            raise ValueError("Filter list must be a non-empty list of dictionaries")
+
+        tracker = result = None
+        try:
+            bulk_ops = [pymongo.DeleteOne(filter) for filter in filter_list]
+            tracker = await self._track(bulk_ops)
+            result = (await self.collection.bulk_write(bulk_ops)).bulk_api_result
+            return result
+        except pymongo.errors.BulkWriteError as bwe:
+            logging.error(f"Failed to perform bulk delete: {bwe.details}")
+            result = bwe.details
+            raise
+        except Exception as e:
+            logging.error(f"Failed to perform bulk delete: {e}")
+            raise
+        finally:
+            invalidate_cache(self.cache)
+            await self._apply_tracked(tracker, result)
+
+
+class AsyncCreateOperation:
+    """
+    Handles the creation of documents in the MongoDB collection.
+    """
+
+    def __init__(self, collection, cache=None, rollups=None):
+        """
+        Initialize the AsyncCreateOperation with the given collection.
+
+        :param collection: AsyncCollection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param rollups: Optional AsyncOutcomeRollups updated with every inserted document
+        """
+        self.collection = collection
+        self.cache = cache
+        self.rollups = rollups
+
+    async def execute(self, data):
+        """
+        Insert a document into the collection.
+
+        :param data: Dictionary representing the document to be inserted
+        :return: Boolean indicating success of the operation
+        """
+        if data is None or not isinstance(data, dict):
+            raise ValueError("Data parameter must be a non-empty dictionary")
+        document = tagged_copy(data)
+        try:
+            result = await self.collection.insert_one(document)
+        except pymongo.errors.DuplicateKeyError as e:
+            logging.error(f"Duplicate key error: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Failed to insert document: {e}")
+            raise RuntimeError(f"Failed to insert document: {e}")
+        finally:
+            invalidate_cache(self.cache)
+        await apply_rollups(self.rollups, added=[document])
+        return result.acknowledged
+
+
+class AsyncReadOperation:
+    """
+    Handles the reading of documents from the MongoDB collection.
+    """
+
+    def __init__(self, collection, cache=None):
+        """
+        Initialize the AsyncReadOperation with the given collection.
+
+        :param collection: AsyncCollection object
+        :param cache: Optional QueryCache used to serve repeated reads
+        """
+        self.collection = collection
+        self.cache = cache
+
+    async def execute(self, query, projection=None, sort=None, skip=0, limit=0):
+        """
+        Retrieve documents from the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param skip: Number of matching documents to skip before returning results
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :return: List of documents matching the query
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        if skip < 0 or limit < 0:
+            raise ValueError("Skip and limit must be non-negative integers")
+        projection = resolve_projection(projection)
+        if self.cache is not None:
+            key = self.cache.make_key('find', query, projection, sort=sort, skip=skip, limit=limit)
+            found, cached = self.cache.get(key)
+            if found:
+                return list(cached)
+            generation = self.cache.generation
+        try:
+            cursor = self.collection.find(query, projection, skip=skip, limit=limit)
+            if sort:
+                cursor = cursor.sort(sort)
+            documents = await cursor.to_list()
+        except Exception as e:
+            raise RuntimeError(f"Failed to read documents: {e}")
+        if self.cache is not None:
+            self.cache.put(key, documents, generation)
+            return list(documents)
+        return documents
+
+    async def stream(self, query, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE, max_time_ms=None):
+        """
+        Lazily retrieve documents from the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param batch_size: Number of documents fetched per round trip
+        :param max_time_ms: Optional server-side time limit for the query in milliseconds
+        :return: Async generator of documents
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        projection = resolve_projection(projection)
+        cursor = self.collection.find(query, projection, limit=limit, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort(sort)
+        if max_time_ms is not None:
+            cursor = cursor.max_time_ms(max_time_ms)
+        try:
+            async for document in cursor:
+                yield document
+        except pymongo.errors.ExecutionTimeout as e:
+            raise TimeoutError(f"Query exceeded max_time_ms: {e}")
+        except pymongo.errors.PyMongoError as e:
+            raise RuntimeError(f"Failed to read documents: {e}")
+        finally:
+            await cursor.close()
+
+    async def count(self, query):
+        """
+        Count the documents in the collection that match the query.
+
+        :param query: Dictionary representing the query criteria
+        :return: Number of matching documents
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        if self.cache is not None:
+            key = self.cache.make_key('count', query)
+            found, cached = self.cache.get(key)
+            if found:
+                return cached
+            generation = self.cache.generation
+        try:
+            total = await self.collection.count_documents(query)
+        except Exception as e:
+            raise RuntimeError(f"Failed to count documents: {e}")
+        if self.cache is not None:
+            self.cache.put(key, total, generation)
+        return total
+
+
+class AsyncUpdateOperation:
+    """
+    Handles the updating of documents in the MongoDB collection.
+    """
+
+    def __init__(self, collection, cache=None, rollups=None):
+        """
+        Initialize the AsyncUpdateOperation with the given collection.
+
+        :param collection: AsyncCollection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param rollups: Optional AsyncOutcomeRollups moved along when an update changes a rollup field
+        """
+        self.collection = collection
+        self.cache = cache
+        self.rollups = rollups
+
+    async def execute(self, query, update_data):
+        """
+        Update a document in the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :param update_data: Dictionary representing the update data
+        :return: Boolean indicating success of the operation
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        if update_data is None or not isinstance(update_data, dict):
+            raise ValueError("Update data must be a non-empty dictionary")
+        update_data = tag_fields(update_data)
+        try:
+            if self.rollups is not None and self.rollups.touches(update_data):
+                return await self._update_with_rollups(query, update_data)
+            result = await self.collection.update_one(query, {'$set': update_data})
+            return result.modified_count > 0
+        except Exception as e:
+            raise RuntimeError(f"Failed to update document: {e}")
+        finally:
+            invalidate_cache(self.cache)
+
+    async def _update_with_rollups(self, query, update_data):
+        """
+        Update a document and move it between rollup rows. See UpdateOperation._update_with_rollups.
+
+        :param query: Dictionary representing the query criteria
+        :param update_data: Dictionary of the fields to set
+        :return: Boolean indicating whether the document changed
+        """
+        projection = dict(self.rollups.projection(), **{field.split('.')[0]: 1 for field in update_data})
+        before = await self.collection.find_one_and_update(query, {'$set': update_data}, projection=projection,
+                                                           return_document=pymongo.ReturnDocument.BEFORE)
+        if before is None:
+            return False
+        after = dict(before)
+        after.update((field, value) for field, value in update_data.items() if '.' not in field)
+        await apply_rollups(self.rollups, added=[after], removed=[before])
+        return any(_field_value(before, field) != value for field, value in update_data.items())
+
+
+class AsyncDeleteOperation:
+    """
+    Handles the deletion of documents from the MongoDB collection.
+    """
+
+    def __init__(self, collection, cache=None, rollups=None):
+        """
+        Initialize the AsyncDeleteOperation with the given collection.
+
+        :param collection: AsyncCollection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param rollups: Optional AsyncOutcomeRollups updated with every deleted document
+        """
+        self.collection = collection
+        self.cache = cache
+        self.rollups = rollups
+
+    async def execute(self, query):
+        """
+        Delete a document from the collection based on the query.
+
+        :param query: Dictionary representing the query criteria
+        :return: Boolean indicating success of the operation
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        try:
+            if self.rollups is not None:
+                # The deleted document's rollup fields come back from the same atomic operation
+                removed = await self.collection.find_one_and_delete(query, projection=self.rollups.projection())
+                if removed is None:
+                    return False
+                await apply_rollups(self.rollups, removed=[removed])
+                return True
+            result = await self.collection.delete_one(query)
+            return result.deleted_count > 0
+        except Exception as e:
+            raise RuntimeError(f"Failed to delete document: {e}")
+        finally:
+            invalidate_cache(self.cache)
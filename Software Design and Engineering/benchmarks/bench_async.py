@@ -0,0 +1,125 @@
+"""
+bench_async.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Measures dashboard request latency under concurrent callers for the synchronous AnimalShelter (one thread
+per caller, reads issued one after another) and the AsyncAnimalShelter (one coroutine per caller, reads fanned out
+with read_many). Each request issues the reads a table refresh needs: the page, its count and the chart rows.
+Usage: python benchmarks/bench_async.py --uri mongodb://localhost:27017 --rows 10000
+Issues: Needs a running mongod; the async client cannot be backed by the mongomock stand-in
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import add_connection_arguments, connection_settings, seed_collection
+
+PAGE_QUERY = {'animal_type': 'Dog'}
+CHART_QUERY = {'breed': {'$in': ['German Shepherd', 'Alaskan Malamute', 'Old English Sheepdog', 'Siberian Husky',
+                                 'Rottweiler']}}
+
+
+def summarize(latencies, elapsed):
+    """
+    Summarise request latencies.
+
+    :param latencies: List of per-request latencies in milliseconds
+    :param elapsed: Wall-clock time of the whole run in seconds
+    :return: Dictionary of p50, p95 and requests per second
+    """
+    latencies = sorted(latencies)
+    return {
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1],
+        'req_per_s': len(latencies) / elapsed,
+    }
+
+
+def run_sync(shelter, callers, requests_per_caller):
+    """
+    Issue the table refresh reads sequentially from one thread per caller.
+
+    :return: Summary dictionary
+    """
+    def caller():
+        latencies = []
+        for _ in range(requests_per_caller):
+            start = time.perf_counter()
+            shelter.read(PAGE_QUERY, {'_id': 0}, skip=0, limit=10)
+            shelter.count(PAGE_QUERY)
+            shelter.read(CHART_QUERY, {'_id': 0, 'breed': 1})
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        results = list(pool.map(lambda _: caller(), range(callers)))
+    return summarize([latency for result in results for latency in result], time.perf_counter() - start)
+
+
+async def run_async(shelter, callers, requests_per_caller):
+    """
+    Issue the table refresh reads concurrently from one coroutine per caller.
+
+    :return: Summary dictionary
+    """
+    async def caller():
+        latencies = []
+        for _ in range(requests_per_caller):
+            start = time.perf_counter()
+            await asyncio.gather(
+                shelter.read_many([
+                    {'query': PAGE_QUERY, 'projection': {'_id': 0}, 'skip': 0, 'limit': 10},
+                    {'query': CHART_QUERY, 'projection': {'_id': 0, 'breed': 1}},
+                ]),
+                shelter.count(PAGE_QUERY),
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(caller() for _ in range(callers)))
+    return summarize([latency for result in results for latency in result], time.perf_counter() - start)
+
+
+async def main_async(args, connection_string, db_name):
+    from animalShelter import AnimalShelter
+    from asyncAnimalShelter import AsyncAnimalShelter
+
+    shelter = AnimalShelter(connection_string, db_name, args.collection)
+    print(f"Seeded {seed_collection(shelter.collection, args.rows)} documents\n")
+    async_shelter = AsyncAnimalShelter(connection_string, db_name, args.collection)
+
+    print(f"{'callers':>8}{'backend':>8}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}")
+    for callers in args.callers:
+        for backend, result in (
+            ('sync', run_sync(shelter, callers, args.requests)),
+            ('async', await run_async(async_shelter, callers, args.requests)),
+        ):
+            print(f"{callers:>8}{backend:>8}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                  f"{result['req_per_s']:>10.1f}")
+
+    await async_shelter.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency of sync vs async AnimalShelter under concurrent callers')
+    add_connection_arguments(parser)
+    parser.add_argument('--rows', type=int, default=10_000, help='Number of documents to seed')
+    parser.add_argument('--callers', type=int, nargs='+', default=[1, 4, 16, 64], help='Concurrent callers')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per caller')
+    args = parser.parse_args()
+    if args.mongomock:
+        parser.error("The async client needs a real mongod; pass --uri instead of --mongomock")
+
+    connection_string, db_name = connection_settings(args)
+    asyncio.run(main_async(args, connection_string, db_name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+bench_columnar_read.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.2
+Purpose: Compares the dict -> DataFrame read path used by app.py (pd.DataFrame(shelter.read(...))) against the
+typed AnimalShelter.read_frame path on data seeded from aac_shelter_outcomes.csv, reporting time, peak
+allocation and the resulting DataFrame size.
+Usage: python benchmarks/bench_columnar_read.py --rows 100000
+Issues: read_frame only decodes BSON straight into Arrow ('arrow' rows) with pymongoarrow installed and a real
+server; with --mongomock or without pymongoarrow it measures the per-field list fallback ('columns' rows). The path
+measured is printed before the results
+"""
+
+import argparse
+import tracemalloc
+
+from common import add_connection_arguments, connection_settings, seed_collection, timed
+
+QUERIES = {
+    'all': {},
+    'dogs': {'animal_type': 'Dog'},
+    'water_rescue': {'breed': {'$in': ['Labrador Retriever Mix', 'Chesapeake Bay Retriever', 'Newfoundland']}},
+}
+
+
+def peak_allocation_mb(func):
+    """
+    Measure the peak Python memory allocated while running a function.
+
+    :param func: Zero-argument callable
+    :return: Peak allocation in megabytes
+    """
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return round(peak / 2**20, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('Purpose: ')[1].split('\n')[0])
+    add_connection_arguments(parser)
+    parser.add_argument('--rows', type=int, default=10_000, help='Number of documents to seed')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    args = parser.parse_args()
+
+    connection_string, db_name = connection_settings(args)
+
+    import pandas as pd
+    import columnarRead
+    from animalShelter import AnimalShelter
+
+    shelter = AnimalShelter(connection_string, db_name, args.collection)
+    seeded = seed_collection(shelter.collection, args.rows)
+    print(f"Seeded {seeded} documents")
+    print(f"read_frame path: {columnarRead.read_path()} "
+          f"({'pymongoarrow' if columnarRead.read_path() == 'arrow' else 'per-field lists, pymongoarrow not installed'})\n")
+    print(f"{'query':<14}{'path':<10}{'best ms':>10}{'mean ms':>10}{'peak MB':>10}{'frame MB':>10}")
+
+    for name, query in QUERIES.items():
+        paths = {
+            'dict': lambda: pd.DataFrame(shelter.read(query)).drop(columns=['_id']),
+            columnarRead.read_path(): lambda: shelter.read_frame(query, projection={'_id': 0}),
+        }
+        for path, func in paths.items():
+            timing = timed(func, args.repeat)
+            frame_mb = func().memory_usage(deep=True).sum() / 2**20
+            print(f"{name:<14}{path:<10}{timing['best_ms']:>10.1f}{timing['mean_ms']:>10.1f}"
+                  f"{peak_allocation_mb(func):>10.2f}{frame_mb:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+bench_engines.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Compares the MongoDB AnimalShelter against the in-memory ColumnarAnimalShelter on the dashboard's query mix
+(counts, keyset and skip pages, the breed chart, map clusters, the outcome trend and the filter counts), both holding
+the same documents seeded from aac_shelter_outcomes.csv, and checks that both return the same results.
+Usage: python benchmarks/bench_engines.py --mongomock --rows 10000
+Issues: mongomock supports neither $geoWithin nor $dateTrunc, so the map and trend rows are only timed for the
+columnar engine with --mongomock
+"""
+
+import argparse
+
+from common import add_connection_arguments, connection_settings, seed_collection, timed
+
+# Dashboard filter combinations: animal type and rescue type radio buttons
+FILTERS = {
+    'all': ('all', 'All'),
+    'dogs': ('Dog', 'All'),
+    'water_dogs': ('Dog', 'Water Rescue'),
+    'mountain': ('all', 'Mountain or Wilderness Rescue'),
+}
+# Map viewport around Austin, at a clustering zoom level
+AUSTIN_BOUNDS = [[30.0, -98.2], [30.6, -97.4]]
+CLUSTER_ZOOM = 11
+
+
+def build_query(animal_type, rescue_type):
+    """
+    Build the query the dashboard issues for a filter combination.
+
+    :param animal_type: 'all', 'Cat' or 'Dog'
+    :param rescue_type: Rescue type label or 'All'
+    :return: Query dictionary
+    """
+    from rescueQueries import construct_query
+    query = construct_query(rescue_type)
+    if animal_type != 'all':
+        query['animal_type'] = animal_type
+    return query
+
+
+def operations(shelter, query, selected):
+    """
+    List the reads one dashboard refresh makes for a query.
+
+    :param shelter: AnimalShelter or ColumnarAnimalShelter
+    :param query: Query dictionary
+    :param selected: Facet selections of the same filters, for the filter counts
+    :return: Dictionary of operation name to zero-argument callable
+    """
+    from crudOperations import page_sort
+    sort = page_sort([('age_upon_outcome_in_weeks', -1)])
+    return {
+        'count': lambda: shelter.count(query),
+        'first_page': lambda: shelter.read_page(query, limit=100, projection='table'),
+        'sorted_skip': lambda: shelter.read(query, 'table', sort=sort, skip=1000, limit=100),
+        'breed_counts': lambda: shelter.breed_counts(query, top_n=20),
+        'clusters': lambda: shelter.cluster_markers(AUSTIN_BOUNDS, CLUSTER_ZOOM, query=query),
+        'outcome_trend': lambda: shelter.outcome_series(query, unit='month'),
+        'filter_counts': lambda: shelter.faceted_search({}, selected, limit=0),
+    }
+
+
+def cluster_keys(clusters):
+    """
+    Reduce clusters to their sizes and positions, in a fixed order.
+    """
+    return sorted((cluster['count'], round(cluster['lat'], 6), round(cluster['lng'], 6)) for cluster in clusters)
+
+
+def run(func):
+    """
+    Run an operation, returning None when the database doesn't support it.
+    """
+    try:
+        return func()
+    except RuntimeError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('Purpose: ')[1].split('\n')[0])
+    add_connection_arguments(parser)
+    parser.add_argument('--rows', type=int, default=10_000, help='Number of documents to seed')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    args = parser.parse_args()
+
+    connection_string, db_name = connection_settings(args)
+
+    from animalShelter import AnimalShelter
+    from columnarShelter import ColumnarAnimalShelter
+
+    mongo = AnimalShelter(connection_string, db_name, args.collection)
+    seeded = seed_collection(mongo.collection, args.rows)
+    timing = timed(lambda: ColumnarAnimalShelter(mongo.collection.find({})), 1)
+    columnar = ColumnarAnimalShelter(mongo.collection.find({}))
+    print(f"Seeded {seeded} documents; columnar load took {timing['best_ms']:.0f} ms\n")
+    print(f"{'filter':<12}{'operation':<15}{'mongo ms':>10}{'columnar ms':>13}{'speedup':>9}  same")
+
+    for name, (animal_type, rescue_type) in FILTERS.items():
+        query = build_query(animal_type, rescue_type)
+        selected = {'animal_type': animal_type, 'rescue_type': rescue_type}
+        mongo_ops, columnar_ops = operations(mongo, query, selected), operations(columnar, query, selected)
+        for operation, func in columnar_ops.items():
+            columnar_timing = timed(func, args.repeat)
+            expected = run(mongo_ops[operation])
+            if expected is None:
+                print(f"{name:<12}{operation:<15}{'n/a':>10}{columnar_timing['best_ms']:>13.1f}{'':>9}  n/a")
+                continue
+            mongo_timing = timed(mongo_ops[operation], args.repeat)
+            same = expected == func()
+            if operation == 'clusters':
+                # Clusters of equal size come back in any order, and which animal is first in a cluster depends
+                # on the order the database reads them in
+                same = cluster_keys(expected) == cluster_keys(func())
+            speedup = mongo_timing['best_ms'] / max(columnar_timing['best_ms'], 1e-3)
+            print(f"{name:<12}{operation:<15}{mongo_timing['best_ms']:>10.1f}{columnar_timing['best_ms']:>13.1f}"
+                  f"{speedup:>8.1f}x  {'yes' if same else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+bench_suite.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Reproducible benchmark suite for the AnimalShelter CRUD layer and the dashboard. For each data set size
+(aac_shelter_outcomes.csv scaled to 10k, 100k and 1M rows) it measures AnimalShelter.read/count/create/update/
+delete, every BulkOperations method, and the table, chart and map callbacks end to end through the Flask test
+client (request parsing, callback, database round trips and JSON serialisation). Results are saved per git commit
+in benchmarks/results/<sha>.json, and --compare prints the change against an earlier run so regressions between
+commits are visible.
+Usage: python benchmarks/bench_suite.py --mongomock --rows 10000
+       python benchmarks/bench_suite.py --uri mongodb://localhost:27017 --compare HEAD~1
+Issues: The callbacks use the app's 'AnimalShelter' collection, so --collection is ignored by this script
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from common import (BENCHMARK_DIR, APP_DIR, add_connection_arguments, connection_settings, seed_collection,
+                    summarize, timed)
+
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+# The collection the dashboard reads from
+APP_COLLECTION = 'AnimalShelter'
+# Marker field on documents written by the benchmark, so they can be removed afterwards
+BENCH_FIELD = 'bench_run'
+DOGS = {'animal_type': 'Dog'}
+# Query of the Mountain or Wilderness Rescue filter (rescueQueries.construct_query)
+MOUNTAIN_RESCUE = {'rescue_tags': 'mountain'}
+# Leaflet bounds of the initial map view over Austin
+AUSTIN_BOUNDS = [[29.9, -98.3], [31.0, -97.1]]
+
+
+def git_revision():
+    """
+    Identify the commit being benchmarked.
+
+    :return: Tuple of (commit SHA, True if the working tree has uncommitted changes)
+    """
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=APP_DIR, capture_output=True, text=True).stdout.strip()
+
+    sha = git('rev-parse', 'HEAD') or 'unknown'
+    return sha, bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def time_ms(func):
+    """
+    Time one call of a function.
+
+    :param func: Zero-argument callable
+    :return: Elapsed time in milliseconds
+    """
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_crud(shelter, repeat):
+    """
+    Measure the single-document AnimalShelter operations.
+
+    :param shelter: AnimalShelter without a query cache, so every read reaches the database
+    :param repeat: Runs per measurement
+    :return: Dictionary of measurement name to timing
+    """
+    sample = shelter.read(DOGS, projection={'_id': 0, 'animal_id': 1}, limit=1)[0]['animal_id']
+    counter = iter(range(10 ** 9))
+    results = {
+        'read_page': timed(lambda: shelter.read(DOGS, {'_id': 0}, sort=[('name', 1)], skip=100, limit=10), repeat),
+        'read_rescue': timed(lambda: shelter.read(MOUNTAIN_RESCUE, {'_id': 0}), repeat),
+        'read_all': timed(lambda: shelter.read({}, {'_id': 0}), repeat),
+        'count': timed(lambda: shelter.count(DOGS), repeat),
+        'create': timed(lambda: shelter.create({BENCH_FIELD: 'create', 'animal_type': 'Dog'}), repeat),
+        'update': timed(lambda: shelter.update({'animal_id': sample}, {'name': f'Bench {next(counter)}'}), repeat),
+    }
+    shelter.bulk_operations.bulk_insert([{BENCH_FIELD: 'delete'} for _ in range(repeat)])
+    results['delete'] = timed(lambda: shelter.delete({BENCH_FIELD: 'delete'}), repeat)
+    return results
+
+
+def bench_bulk(shelter, batch, repeat):
+    """
+    Measure every BulkOperations method on batches of new documents.
+
+    :param shelter: AnimalShelter without a query cache
+    :param batch: Number of documents or operations per call
+    :param repeat: Runs per measurement
+    :return: Dictionary of measurement name to timing
+    """
+    bulk = shelter.bulk_operations
+    times = {name: [] for name in ('bulk_insert', 'bulk_insert_unordered_x4', 'bulk_update', 'bulk_update_many',
+                                   'bulk_delete')}
+    for run in range(repeat):
+        tag = f'bulk-{run}'
+        times['bulk_insert'].append(time_ms(lambda: bulk.bulk_insert(
+            ({BENCH_FIELD: tag, 'seq': i, 'animal_type': 'Dog'} for i in range(batch)))))
+        times['bulk_insert_unordered_x4'].append(time_ms(lambda: bulk.bulk_insert(
+            ({BENCH_FIELD: f'{tag}-u', 'seq': i} for i in range(batch)), ordered=False, max_workers=4)))
+        times['bulk_update'].append(time_ms(lambda: bulk.bulk_update(
+            {'filter': {BENCH_FIELD: tag, 'seq': i}, 'update': {'name': f'Bench {i}'}} for i in range(batch))))
+        times['bulk_update_many'].append(time_ms(lambda: bulk.bulk_update(
+            [{'filter': {BENCH_FIELD: f'{tag}-u'}, 'update': {'$set': {'animal_type': 'Cat'}}, 'many': True}])))
+        times['bulk_delete'].append(time_ms(lambda: bulk.bulk_delete(
+            {BENCH_FIELD: tag, 'seq': i} for i in range(batch))))
+        shelter.collection.delete_many({BENCH_FIELD: f'{tag}-u'})
+    return {name: summarize(values) for name, values in times.items()}
+
+
+def callback_request(dash_app, output, values, changed):
+    """
+    Build the JSON body the browser sends to /_dash-update-component for a callback.
+
+    :param dash_app: dash.Dash application
+    :param output: Callback output key, e.g. 'graph-id.children'
+    :param values: Dictionary of 'component.property' to value for the callback inputs and state
+    :param changed: List of 'component.property' strings that triggered the callback
+    :return: Request body dictionary
+    """
+    spec = dash_app.callback_map[output]
+    outputs = [{'id': item.component_id, 'property': item.component_property}
+               for item in (spec['output'] if isinstance(spec['output'], list) else [spec['output']])]
+
+    def with_values(items):
+        return [dict(item, value=values.get(f"{item['id']}.{item['property']}")) for item in items]
+
+    return {
+        'output': output,
+        'outputs': outputs if isinstance(spec['output'], list) else outputs[0],
+        'inputs': with_values(spec['inputs']),
+        'state': with_values(spec['state']),
+        'changedPropIds': changed,
+    }
+
+
+def bench_callbacks(app_module, repeat):
+    """
+    Measure the dashboard callbacks end to end through the Flask test client.
+    The query cache is cleared before every request so each one reaches the database.
+
+    :param app_module: Imported app module
+    :param repeat: Runs per measurement
+    :return: Dictionary of measurement name to timing
+    """
+    dash_app = app_module.app
+    client = dash_app.server.test_client()
+    table_key = next(key for key in dash_app.callback_map if 'datatable-id.data' in key)
+    selected_key = next(key for key in dash_app.callback_map if 'selected-layer.children' in key)
+
+    base = {'filter-type.value': 'Dog', 'rescue-type-radio.value': 'Mountain or Wilderness Rescue',
+            'datatable-id.page_current': 0, 'datatable-id.page_size': 10, 'datatable-id.filter_query': '',
+            'datatable-id.sort_by': [], 'create-button.n_clicks': 0, 'update-button.n_clicks': 0,
+            'delete-button.n_clicks': 0}
+    page = client.post('/_dash-update-component',
+                       json=callback_request(dash_app, table_key, base, ['filter-type.value'])).get_json()
+    rows = page['response']['datatable-id']['data'] if page else []
+    edit = dict(base, **{'animal_id.value': f'{BENCH_FIELD}-callback', 'name.value': 'Bench',
+                         'animal_type.value': 'Dog', 'breed.value': 'Rottweiler', 'color.value': 'Black',
+                         'age.value': '1 year', 'adopted.value': 'false',
+                         'datatable-id.derived_virtual_selected_rows': [0]})
+
+    requests = {
+        'table_filter': (table_key, base, ['filter-type.value']),
+        'table_sort': (table_key, dict(base, **{'datatable-id.sort_by': [{'column_id': 'name', 'direction': 'asc'}]}),
+                       ['datatable-id.sort_by']),
+        'table_page': (table_key, dict(base, **{'datatable-id.page_current': 3}), ['datatable-id.page_current']),
+        'table_create': (table_key, dict(edit, **{'create-button.n_clicks': 1}), ['create-button.n_clicks']),
+        'table_update': (table_key, dict(edit, **{'update-button.n_clicks': 1}), ['update-button.n_clicks']),
+        'table_delete': (table_key, dict(edit, **{'delete-button.n_clicks': 1}), ['delete-button.n_clicks']),
+        'update_graphs': ('graph-id.children', dict(base, **{'datatable-id.data': rows}), ['filter-type.value']),
+        'update_map_markers': ('cluster-layer.children',
+                               dict(base, **{'outcome-map.bounds': AUSTIN_BOUNDS, 'outcome-map.zoom': 11,
+                                             'datatable-id.data': rows}), ['outcome-map.bounds']),
+        'update_map': (selected_key, {'datatable-id.derived_virtual_data': rows,
+                                      'datatable-id.derived_virtual_selected_rows': list(range(min(len(rows), 5)))},
+                       ['datatable-id.derived_virtual_selected_rows']),
+    }
+
+    results = {}
+    for name, (output, values, changed) in requests.items():
+        body = callback_request(dash_app, output, values, changed)
+
+        def post():
+            app_module.query_cache.invalidate()
+            response = client.post('/_dash-update-component', json=body)
+            if response.status_code not in (200, 204):
+                raise RuntimeError(f"{name} returned HTTP {response.status_code}")
+
+        results[name] = timed(post, repeat)
+    app_module.get_shelter().collection.delete_many({'animal_id': f'{BENCH_FIELD}-callback'})
+    return results
+
+
+def result_path(sha):
+    """
+    Path of the results file for a commit.
+
+    :param sha: Full commit SHA
+    :return: Path inside RESULTS_DIR
+    """
+    return os.path.join(RESULTS_DIR, f'{sha[:12]}.json')
+
+
+def load_baseline(reference, current_sha):
+    """
+    Load the results of an earlier run.
+
+    :param reference: Git revision (SHA, branch, HEAD~1) or 'latest' for the newest saved run of another commit
+    :param current_sha: SHA of the run being compared, excluded from 'latest'
+    :return: Results dictionary, or None if no saved run matches
+    """
+    if reference == 'latest':
+        paths = [path for path in glob.glob(os.path.join(RESULTS_DIR, '*.json'))
+                 if path != result_path(current_sha)]
+        if not paths:
+            return None
+        path = max(paths, key=os.path.getmtime)
+    else:
+        sha = subprocess.run(['git', 'rev-parse', reference], cwd=APP_DIR, capture_output=True,
+                             text=True).stdout.strip()
+        path = result_path(sha or reference)
+        if not os.path.exists(path):
+            return None
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def print_comparison(baseline, current, threshold):
+    """
+    Print the change in best time for every measurement present in both runs.
+
+    :param baseline: Results of the earlier run
+    :param current: Results of this run
+    :param threshold: Relative slowdown (e.g. 0.1 for 10%) flagged as a regression
+    :return: Number of regressions
+    """
+    print(f"\nCompared with {baseline['sha'][:12]} ({baseline['timestamp']})")
+    print(f"{'rows':>9} {'measurement':<28}{'before ms':>11}{'after ms':>11}{'change':>9}")
+    regressions = 0
+    for rows, measurements in current['results'].items():
+        for name, timing in measurements.items():
+            before = baseline['results'].get(rows, {}).get(name)
+            if before is None or not before['best_ms']:
+                continue
+            change = timing['best_ms'] / before['best_ms'] - 1
+            flag = '  REGRESSION' if change > threshold else ''
+            regressions += bool(flag)
+            print(f"{rows:>9} {name:<28}{before['best_ms']:>11.2f}{timing['best_ms']:>11.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AnimalShelter CRUD layer and dashboard callbacks')
+    add_connection_arguments(parser)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='Data set sizes to benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    parser.add_argument('--batch', type=int, default=1000, help='Documents per bulk operation')
+    parser.add_argument('--compare', metavar='REV', help="Compare with the saved run of a git revision, or 'latest'")
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown reported as a regression')
+    parser.add_argument('--no-save', action='store_true', help='Do not write the results file')
+    args = parser.parse_args()
+
+    connection_string, db_name = connection_settings(args)
+    # app.py reads its connection settings from the environment when it is imported
+    os.environ['MONGO_CONNECTION_STRING'] = connection_string
+    os.environ['DB_NAME'] = db_name
+
+    from animalShelter import AnimalShelter
+    import app as app_module
+    app_module.create_app()
+    shelter = AnimalShelter(connection_string, db_name, APP_COLLECTION)
+
+    sha, dirty = git_revision()
+    report = {
+        'sha': sha,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'backend': 'mongomock' if args.mongomock else 'mongodb',
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'batch': args.batch,
+        'results': {},
+    }
+
+    for rows in args.rows:
+        seeded = seed_collection(shelter.collection, rows)
+        print(f"Seeded {seeded} documents", file=sys.stderr)
+        app_module.query_cache.invalidate()
+
+        results = {}
+        results.update(bench_crud(shelter, args.repeat))
+        results.update(bench_bulk(shelter, args.batch, args.repeat))
+        results.update(bench_callbacks(app_module, args.repeat))
+        shelter.collection.delete_many({BENCH_FIELD: {'$exists': True}})
+        report['results'][str(rows)] = results
+
+        print(f"\n{rows:,} rows")
+        print(f"{'measurement':<28}{'best ms':>10}{'mean ms':>10}")
+        for name, timing in results.items():
+            print(f"{name:<28}{timing['best_ms']:>10.2f}{timing['mean_ms']:>10.2f}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(result_path(sha), 'w') as results_file:
+            json.dump(report, results_file, indent=2)
+        print(f"\nSaved {result_path(sha)}{' (uncommitted changes)' if dirty else ''}")
+
+    if args.compare:
+        baseline = load_baseline(args.compare, sha)
+        if baseline is None:
+            print(f"\nNo saved results for {args.compare}")
+        elif print_comparison(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+bench_workers.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Load test for the production server mode. For each worker count it starts the dashboard under gunicorn
+(wsgi.py, preloaded and forked like gunicorn.conf.py), sends a mix of table, chart and map callback requests from
+concurrent keep-alive clients for a fixed time, and reports requests per second, the speed-up over the first
+worker count and p50/p95 latency.
+Usage: python benchmarks/bench_workers.py --uri mongodb://localhost:27017 --workers 1 2 4 8
+       python benchmarks/bench_workers.py --mongomock --rows 10000 --cache memory
+Issues: Needs gunicorn (Linux/macOS only). With --mongomock every worker reads its own forked copy of the seeded
+data, which is fine for reads but not for writes. The clients share one Python process, so on small machines the
+load generator itself can become the limit; run it from another host for larger worker counts
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_async import summarize
+from bench_suite import APP_COLLECTION, AUSTIN_BOUNDS, callback_request
+from common import APP_DIR, add_connection_arguments, connection_settings, seed_collection
+
+HOST = '127.0.0.1'
+CALLBACK_PATH = '/_dash-update-component'
+FILTER_TYPES = ('all', 'Cat', 'Dog')
+RESCUE_TYPES = ('All', 'Water Rescue', 'Mountain or Wilderness Rescue', 'Disaster or Individual Tracking')
+
+
+def request_mix(dash_app):
+    """
+    Build the callback request bodies the clients cycle through: every filter combination for the table (first
+    five pages), the breed chart and the map markers.
+
+    :param dash_app: dash.Dash application
+    :return: List of encoded JSON request bodies
+    """
+    table_key = next(key for key in dash_app.callback_map if 'datatable-id.data' in key)
+    bodies = []
+    for filter_type, rescue_type in itertools.product(FILTER_TYPES, RESCUE_TYPES):
+        base = {'filter-type.value': filter_type, 'rescue-type-radio.value': rescue_type,
+                'datatable-id.page_current': 0, 'datatable-id.page_size': 10, 'datatable-id.filter_query': '',
+                'datatable-id.sort_by': [], 'create-button.n_clicks': 0, 'update-button.n_clicks': 0,
+                'delete-button.n_clicks': 0, 'datatable-id.data': [],
+                'outcome-map.bounds': AUSTIN_BOUNDS, 'outcome-map.zoom': 11}
+        for page in range(5):
+            bodies.append(callback_request(dash_app, table_key, dict(base, **{'datatable-id.page_current': page}),
+                                           ['datatable-id.page_current']))
+        bodies.append(callback_request(dash_app, 'graph-id.children', base, ['filter-type.value']))
+        bodies.append(callback_request(dash_app, 'cluster-layer.children', base, ['outcome-map.bounds']))
+    return [json.dumps(body).encode() for body in bodies]
+
+
+def serve(args):
+    """
+    Run the dashboard under gunicorn in this process until terminated. Used by start_server through --serve.
+
+    :param args: Parsed arguments
+    """
+    from gunicorn.app.base import BaseApplication
+
+    connection_string, db_name = connection_settings(args)
+    os.environ['MONGO_CONNECTION_STRING'] = connection_string
+    os.environ['DB_NAME'] = db_name
+    if args.mongomock:
+        # The in-memory data only exists in this process, so it is seeded here before the workers are forked
+        from animalShelter import AnimalShelter
+        seed_collection(AnimalShelter(connection_string, db_name, APP_COLLECTION).collection, args.rows)
+
+    class DashboardServer(BaseApplication):
+        def load_config(self):
+            for name, value in {'bind': f'{HOST}:{args.port}', 'workers': args.serve, 'threads': args.threads,
+                                'preload_app': True, 'loglevel': 'warning', 'timeout': 120}.items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            from wsgi import application
+            return application
+
+    DashboardServer().run()
+
+
+def start_server(args, workers, cache_path):
+    """
+    Start a gunicorn server with the given number of workers and wait until it answers.
+
+    :param args: Parsed arguments
+    :param workers: Number of worker processes
+    :param cache_path: SQLite query cache file for this run
+    :return: subprocess.Popen of the server
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--serve', str(workers), '--port', str(args.port),
+               '--threads', str(args.threads), '--rows', str(args.rows), '--db', args.db]
+    if args.mongomock:
+        command.append('--mongomock')
+    elif args.uri:
+        command += ['--uri', args.uri]
+    env = dict(os.environ, QUERY_CACHE_BACKEND=args.cache, QUERY_CACHE_PATH=cache_path)
+    server = subprocess.Popen(command, cwd=APP_DIR, env=env)
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"Server with {workers} workers exited with code {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection(HOST, args.port, timeout=5)
+            connection.request('GET', '/_dash-layout')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return server
+        except OSError:
+            pass
+        time.sleep(0.25)
+    stop_server(server)
+    sys.exit(f"Server with {workers} workers did not start within {args.startup_timeout}s")
+
+
+def stop_server(server):
+    """
+    Shut a gunicorn server down gracefully.
+
+    :param server: subprocess.Popen of the server
+    """
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def run_load(port, bodies, clients, duration, warmup):
+    """
+    Send callback requests from concurrent keep-alive clients for a fixed time.
+
+    :param port: Server port
+    :param bodies: Encoded request bodies to pick from
+    :param clients: Number of concurrent clients
+    :param duration: Measured seconds
+    :param warmup: Seconds of unmeasured requests first, so every worker has connected and filled its cache
+    :return: Tuple of (latencies in milliseconds, error count, measured seconds)
+    """
+    start = time.monotonic() + warmup
+    stop = start + duration
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def client(seed):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection(HOST, port, timeout=60)
+        own_latencies, own_errors = [], 0
+        while True:
+            began = time.monotonic()
+            if began >= stop:
+                break
+            try:
+                connection.request('POST', CALLBACK_PATH, body=rng.choice(bodies),
+                                   headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                failed = response.status not in (200, 204)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(HOST, port, timeout=60)
+                failed = True
+            if began >= start:
+                own_errors += failed
+                if not failed:
+                    own_latencies.append((time.monotonic() - began) * 1000)
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors[0] += own_errors
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure dashboard requests per second against gunicorn worker count')
+    add_connection_arguments(parser)
+    parser.add_argument('--rows', type=int, default=10_000, help='Documents to seed')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to measure')
+    parser.add_argument('--threads', type=int, default=1, help='Threads per worker')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=15, help='Measured seconds per worker count')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before each measurement')
+    parser.add_argument('--cache', choices=('sqlite', 'memory'), default='sqlite', help='Query cache backend')
+    parser.add_argument('--port', type=int, default=8051, help='Port the server listens on')
+    parser.add_argument('--startup-timeout', type=float, default=120, help='Seconds to wait for the server')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    if not args.mongomock:
+        from animalShelter import AnimalShelter
+        connection_string, db_name = connection_settings(args)
+        print(f"Seeded {seed_collection(AnimalShelter(connection_string, db_name, APP_COLLECTION).collection, args.rows)}"
+              f" documents", file=sys.stderr)
+    # Importing the app does no database work; it is only needed here for the callback request layout
+    os.environ.setdefault('MONGO_CONNECTION_STRING', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', args.db)
+    import app as app_module
+    bodies = request_mix(app_module.create_app())
+
+    print(f"\n{args.clients} clients, {args.threads} thread(s) per worker, {args.cache} query cache")
+    print(f"{'workers':>8}{'req/s':>10}{'speed-up':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            server = start_server(args, workers, os.path.join(cache_dir, 'query_cache.sqlite'))
+            try:
+                latencies, errors, elapsed = run_load(args.port, bodies, args.clients, args.duration, args.warmup)
+            finally:
+                stop_server(server)
+        if not latencies:
+            print(f"{workers:>8}{'-':>10}{'-':>10}{'-':>10}{'-':>10}{errors:>8}")
+            continue
+        result = summarize(latencies, elapsed)
+        baseline = baseline or result['req_per_s']
+        print(f"{workers:>8}{result['req_per_s']:>10.1f}{result['req_per_s'] / baseline:>9.2f}x"
+              f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+common.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: Shared helpers for the benchmark scripts: seeding a collection from aac_shelter_outcomes.csv and
+connecting either to a real MongoDB (MONGO_CONNECTION_STRING) or to an in-process mongomock stand-in.
+Issues: mongomock timings are only useful for comparing code paths, not for absolute database latency. mongomock
+4.3 predates the 'sort' option pymongo 4.9 added to UpdateOne, ReplaceOne and DeleteOne, so use_mongomock drops it
+when it is unset; a bulk write that does sort still fails under --mongomock
+"""
+
+import csv
+import os
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCHMARK_DIR)
+CSV_PATH = os.path.join(os.path.dirname(APP_DIR), 'Databases', 'aac_shelter_outcomes.csv')
+MOCK_CONNECTION_STRING = 'mongodb://localhost:27017'
+
+# The application modules live one directory up and use flat imports
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+NUMERIC_COLUMNS = ('location_lat', 'location_long', 'age_upon_outcome_in_weeks')
+
+
+def use_mongomock():
+    """
+    Patch pymongo.MongoClient with mongomock so benchmarks can run without a MongoDB server.
+    Must be called before any application module is imported.
+
+    :return: Connection string that the patched client accepts
+    """
+    import mongomock
+    mongomock.patch(servers=(('localhost', 27017),), on_new='create').start()
+    accept_unset_sort()
+    return MOCK_CONNECTION_STRING
+
+
+def accept_unset_sort():
+    """
+    Let mongomock's bulk writes take the sort=None that pymongo 4.9 and later pass for every UpdateOne, ReplaceOne
+    and DeleteOne, which mongomock 4.3 rejects as an unexpected keyword argument.
+    """
+    from mongomock.collection import BulkOperationBuilder
+    for name in ('add_update', 'add_replace', 'add_delete'):
+        method = getattr(BulkOperationBuilder, name)
+        if getattr(method, 'accepts_unset_sort', False):
+            continue
+
+        def add(self, *args, _method=method, **kwargs):
+            if kwargs.get('sort', 0) is None:
+                del kwargs['sort']
+            return _method(self, *args, **kwargs)
+
+        add.accepts_unset_sort = True
+        setattr(BulkOperationBuilder, name, add)
+
+
+def connection_settings(args):
+    """
+    Resolve the connection string and database name for a benchmark run.
+
+    :param args: Parsed arguments with 'mongomock', 'uri' and 'db' attributes
+    :return: Tuple of (connection string, database name)
+    """
+    if args.mongomock:
+        return use_mongomock(), args.db
+    uri = args.uri or os.getenv('MONGO_CONNECTION_STRING')
+    if not uri:
+        sys.exit("Set MONGO_CONNECTION_STRING, pass --uri, or use --mongomock")
+    return uri, args.db
+
+
+def add_connection_arguments(parser):
+    """
+    Add the connection options shared by every benchmark script.
+
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--uri', help='MongoDB connection string (defaults to MONGO_CONNECTION_STRING)')
+    parser.add_argument('--db', default='AAC_benchmark', help='Database to seed and benchmark against')
+    parser.add_argument('--collection', default='AnimalShelter', help='Collection to seed and benchmark against')
+    parser.add_argument('--mongomock', action='store_true', help='Use an in-process mongomock stand-in')
+
+
+def read_csv_documents(path=CSV_PATH, scale=1):
+    """
+    Read the AAC outcomes CSV as documents shaped the way mongoimport loads them.
+    The file is repeated 'scale' times with distinct animal ids to build larger data sets.
+
+    :param path: Path to the CSV file
+    :param scale: Number of copies of the file to generate
+    :return: Generator of documents
+    """
+    for copy in range(scale):
+        with open(path, newline='') as csv_file:
+            for row in csv.DictReader(csv_file):
+                row['rec_num'] = int(row.pop('')) + copy * 1_000_000
+                for column in NUMERIC_COLUMNS:
+                    row[column] = float(row[column]) if row[column] else None
+                if copy:
+                    row['animal_id'] = f"{row['animal_id']}-{copy}"
+                yield row
+
+
+def seed_collection(collection, rows, batch_size=5000):
+    """
+    Replace the contents of a collection with the first 'rows' documents generated from the CSV, tagged with their
+    rescue types as the application's writes do.
+
+    :param collection: MongoDB collection object
+    :param rows: Number of documents to insert
+    :param batch_size: Number of documents per insert_many call
+    :return: Number of documents inserted
+    """
+    # Imported here so use_mongomock can patch pymongo before any application module is loaded
+    from rescueQueries import tag_document
+
+    collection.delete_many({})
+    scale = max(1, -(-rows // 10_000))
+    batch = []
+    inserted = 0
+    for doc in read_csv_documents(scale=scale):
+        if inserted + len(batch) >= rows:
+            break
+        batch.append(tag_document(doc))
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def timed(func, repeat=5):
+    """
+    Run a function several times and report the best and mean wall-clock time.
+
+    :param func: Zero-argument callable to time
+    :param repeat: Number of runs
+    :return: Dictionary with 'best_ms' and 'mean_ms'
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return summarize(times)
+
+
+def summarize(times):
+    """
+    Reduce a list of run times to the best and mean time.
+
+    :param times: List of run times in milliseconds
+    :return: Dictionary with 'best_ms' and 'mean_ms'
+    """
+    return {'best_ms': round(min(times), 3), 'mean_ms': round(sum(times) / len(times), 3)}
@@ -0,0 +1,253 @@
+"""
+changeFeed.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module pushes documents inserted, updated and deleted in the AnimalShelter collection to connected
+dashboards. One change stream per process feeds a short history of table-row deltas, which is streamed to every
+browser as Server-Sent Events; a browser that reconnects with the id of the last event it saw gets the events it
+missed, or a reset telling it to read its page again when they are no longer in the history.
+Issues: Change streams require a replica set or sharded cluster; on a standalone server the stream reports itself
+unavailable and dashboards only refresh on their own actions. Every open dashboard holds one server thread for its
+event stream, so production workers need threads (gunicorn.conf.py) and streams are closed after max_seconds so
+the browser reconnects and threads are recycled
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+
+import pymongo.errors
+from bson import ObjectId, json_util
+
+from crudOperations import resolve_projection
+from queryCache import CHANGE_STREAM_HISTORY_LOST
+
+logging.basicConfig(level=logging.INFO)
+
+# Operations that change which documents exist or what they hold; drops and renames end the stream instead
+WATCHED_OPERATIONS = ('insert', 'update', 'replace', 'delete')
+
+
+def row_id(value):
+    """
+    Encode a document _id as the id of its table row. Extended JSON keeps ObjectIds and the string _ids written
+    by csvLoader apart, so the id can be turned back into the same _id.
+
+    :param value: Document _id
+    :return: Row id string
+    """
+    return json_util.dumps(value)
+
+
+def parse_row_id(value):
+    """
+    Decode a table row id back into the document _id.
+
+    :param value: Row id string from row_id
+    :return: Document _id
+    """
+    return json_util.loads(value)
+
+
+def to_row(document):
+    """
+    Turn a document into a table row: the _id becomes the row id that deltas are matched on. Embedded documents
+    and arrays are left out, since a table cell can only hold a string, number or boolean.
+
+    :param document: Document read with its _id
+    :return: Dictionary of the document's scalar fields plus 'id'
+    """
+    row = {key: value for key, value in document.items() if key != '_id' and not isinstance(value, (dict, list))}
+    row['id'] = row_id(document['_id'])
+    return row
+
+
+def _json_default(value):
+    """
+    Encode values json can't, the way the dashboard shows them: dates in ISO format, anything else as a string.
+    """
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_projection(projection):
+    """
+    Apply a read projection to the documents in change events.
+
+    :param projection: Projection dictionary, PROJECTION_PRESETS name, or None
+    :return: $project stage fields for the change stream, or None for whole documents
+    """
+    fields = {f'fullDocument.{field}': value for field, value in (resolve_projection(projection) or {}).items()
+              if field != '_id'}
+    if any(fields.values()):
+        # An inclusive projection would otherwise drop the fields every event needs
+        fields.update({'operationType': 1, 'documentKey': 1})
+    return fields or None
+
+
+class ChangeFeed:
+    """
+    Watches the collection's change stream in a background thread and keeps the recent deltas for event streams.
+    """
+
+    def __init__(self, collection, projection=None, cache=None, history=1000, retry_seconds=5):
+        """
+        Initialize the feed. Watching starts with the first subscriber.
+
+        :param collection: MongoDB collection object to watch
+        :param projection: Projection applied to the pushed documents, e.g. the one the table reads with
+        :param cache: Optional QueryCache invalidated on every change, so reads made for a delta see it
+        :param history: Number of recent events kept for browsers that reconnect
+        :param retry_seconds: Delay before reopening the change stream after a transient error
+        """
+        self.collection = collection
+        self.pipeline = [{'$match': {'operationType': {'$in': list(WATCHED_OPERATIONS)}}}]
+        project = stream_projection(projection)
+        if project:
+            self.pipeline.append({'$project': project})
+        self.cache = cache
+        self.retry_seconds = retry_seconds
+        # Event ids are only meaningful to the feed that issued them; another worker or a restarted one has its own
+        self.epoch = str(ObjectId())
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=history)
+        self.seq = 0
+        self.available = True
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start watching in a daemon thread.
+        """
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.stop_event.clear()
+                self.thread = threading.Thread(target=self._watch, name='change-feed', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """
+        Stop watching. The thread exits the next time the change stream returns.
+        """
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def _publish(self, event):
+        """
+        Add an event to the history and wake the event streams.
+
+        :param event: Dictionary with 'op' ('upsert', 'delete' or 'reset') and, for deltas, 'id' and 'row'
+        """
+        if self.cache is not None:
+            self.cache.invalidate()
+        with self.condition:
+            self.seq += 1
+            self.events.append((self.seq, event))
+            self.condition.notify_all()
+
+    @staticmethod
+    def delta(change):
+        """
+        Turn a change event into a table delta.
+
+        :param change: Change stream event
+        :return: Delta dictionary
+        """
+        document = change.get('fullDocument')
+        key = change['documentKey']['_id']
+        if change['operationType'] == 'delete' or document is None:
+            # An update whose document was deleted before the lookup is a delete as far as the table is concerned
+            return {'op': 'delete', 'id': row_id(key)}
+        return {'op': 'upsert', 'id': row_id(key), 'row': to_row(dict(document, _id=key))}
+
+    def _watch(self):
+        """
+        Consume the change stream until stopped, resuming after transient errors. When changes may have been missed,
+        a reset event tells the dashboards to read their page again.
+        """
+        resume_token = None
+        opened = False
+        while not self.stop_event.is_set():
+            try:
+                with self.collection.watch(self.pipeline, full_document='updateLookup', resume_after=resume_token,
+                                           max_await_time_ms=1000) as stream:
+                    if opened and resume_token is None:
+                        self._publish({'op': 'reset'})
+                    opened = True
+                    while not self.stop_event.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            resume_token = stream.resume_token
+                            self._publish(self.delta(change))
+            except pymongo.errors.OperationFailure as e:
+                if resume_token is not None and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    resume_token = None
+                    continue
+                logging.warning(f"Change streams unavailable, dashboards will not receive live updates: {e}")
+                with self.condition:
+                    self.available = False
+                    self.condition.notify_all()
+                return
+            except pymongo.errors.PyMongoError as e:
+                logging.error(f"Change feed error, retrying in {self.retry_seconds}s: {e}")
+                self.stop_event.wait(self.retry_seconds)
+
+    def since(self, last_event_id, timeout):
+        """
+        Wait for the events after the given one.
+
+        :param last_event_id: Id of the last event the browser saw ('epoch:seq'), or None to start from now
+        :param timeout: Seconds to wait when there are no newer events
+        :return: Tuple of (events as (event id, event) pairs, id to continue from); the events are a single reset
+            when the requested ones are no longer available
+        """
+        with self.condition:
+            if last_event_id is None:
+                after = self.seq
+            else:
+                epoch, _, seq = last_event_id.partition(':')
+                first = self.events[0][0] if self.events else self.seq + 1
+                if epoch != self.epoch or not seq.isdigit() or not first - 1 <= int(seq) <= self.seq:
+                    cursor = f'{self.epoch}:{self.seq}'
+                    return [(cursor, {'op': 'reset'})], cursor
+                after = int(seq)
+            if after == self.seq and self.available and not self.stop_event.is_set():
+                self.condition.wait(timeout)
+            first = self.events[0][0] if self.events else self.seq + 1
+            if after < first - 1:
+                cursor = f'{self.epoch}:{self.seq}'
+                return [(cursor, {'op': 'reset'})], cursor
+            events = [(f'{self.epoch}:{seq}', event) for seq, event in self.events if seq > after]
+            return events, f'{self.epoch}:{self.seq}'
+
+    def sse(self, last_event_id=None, keepalive=15, max_seconds=300):
+        """
+        Stream the feed as Server-Sent Events.
+
+        :param last_event_id: Last-Event-ID sent by a reconnecting browser, or None
+        :param keepalive: Seconds between comments that keep idle connections open through proxies
+        :param max_seconds: Seconds after which the stream ends and the browser reconnects
+        :return: Generator of event stream text
+        """
+        self.start()
+        deadline = time.monotonic() + max_seconds
+        cursor = last_event_id
+        # Reconnect delay for the browser, in milliseconds
+        yield f'retry: {self.retry_seconds * 1000}\n\n'
+        while time.monotonic() < deadline:
+            if not self.available:
+                yield 'event: unavailable\ndata: {}\n\n'
+                return
+            events, cursor = self.since(cursor, keepalive)
+            if not events:
+                yield ': keepalive\n\n'
+            for event_id, event in events:
+                yield f'id: {event_id}\ndata: {json.dumps(event, default=_json_default)}\n\n'
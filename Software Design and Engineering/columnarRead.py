@@ -0,0 +1,159 @@
+"""
+columnarRead.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.2
+Purpose: This module builds pandas DataFrames and Arrow tables from MongoDB results. With pymongoarrow installed,
+find results are decoded from raw BSON batches straight into typed Arrow columns in C, so no Python dictionary is
+built per document; breed, animal_type and outcome_type are then dictionary-encoded. Without it, documents are
+streamed in batches and their values appended to one list per field (allocated up front from an inclusion
+projection), and the typed DataFrame is built once from those columns with vectorised conversions.
+Issues: pymongoarrow is optional (pip install pymongoarrow); the fallback still decodes every document into a
+dictionary first, so it saves the per-record DataFrame construction but not the decoding. pymongoarrow needs a real
+MongoDB server (mongomock has no raw batch cursors)
+"""
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.compute
+except ImportError:  # pyarrow is only needed for Arrow output
+    pyarrow = None
+
+try:
+    from pymongoarrow.api import find_arrow_all
+except ImportError:  # Without pymongoarrow, frames are built from decoded documents
+    find_arrow_all = None
+
+# Columns of the AAC outcomes data that have a known type
+FLOAT_COLUMNS = ('location_lat', 'location_long', 'age_upon_outcome_in_weeks')
+DATETIME_COLUMNS = ('datetime',)
+CATEGORY_COLUMNS = ('breed', 'animal_type', 'outcome_type')
+# Format of outcome dates stored as strings, as in the CSV
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def find_arrow(collection, query, projection=None, sort=None, limit=0):
+    """
+    Run a find through pymongoarrow and type the known columns.
+
+    :param collection: MongoDB collection object
+    :param query: Dictionary representing the query criteria
+    :param projection: Projection dictionary or None
+    :param sort: Optional list of (field, direction) tuples
+    :param limit: Maximum number of documents to return (0 means no limit)
+    :return: pyarrow Table
+    :raises ImportError: If pymongoarrow is not installed
+    """
+    if find_arrow_all is None:
+        raise ImportError("pymongoarrow is required for the Arrow read path: pip install pymongoarrow")
+    options = {'limit': limit}
+    if projection:
+        options['projection'] = projection
+    if sort:
+        options['sort'] = sort
+    return type_table(find_arrow_all(collection, query, **options))
+
+
+def type_table(table):
+    """
+    Give the known columns of an Arrow table their types: float64 numbers, timestamps for outcome dates stored
+    as strings, and dictionary-encoded categories.
+
+    :param table: pyarrow Table, with the schema pymongoarrow inferred from the first document
+    :return: pyarrow Table
+    """
+    for index, field in enumerate(table.schema):
+        column = table.column(index)
+        if field.name in FLOAT_COLUMNS and pyarrow.types.is_integer(field.type):
+            column = column.cast(pyarrow.float64())
+        elif field.name in DATETIME_COLUMNS and pyarrow.types.is_string(field.type):
+            column = pyarrow.compute.strptime(column, format=DATETIME_FORMAT, unit='ms', error_is_null=True)
+        elif field.name in CATEGORY_COLUMNS and pyarrow.types.is_string(field.type):
+            column = column.dictionary_encode()
+        else:
+            continue
+        table = table.set_column(index, field.name, column)
+    return table
+
+
+def type_frame(frame):
+    """
+    Give the known columns of a DataFrame their types with vectorised conversions.
+
+    :param frame: pandas DataFrame built from documents
+    :return: The same DataFrame with float64, datetime64 and categorical columns
+    """
+    for name in frame.columns.intersection(FLOAT_COLUMNS):
+        frame[name] = pd.to_numeric(frame[name], errors='coerce').astype('float64')
+    for name in frame.columns.intersection(DATETIME_COLUMNS):
+        frame[name] = pd.to_datetime(frame[name], errors='coerce', format='mixed')
+    for name in frame.columns.intersection(CATEGORY_COLUMNS):
+        frame[name] = frame[name].astype('category')
+    return frame
+
+
+def read_path():
+    """
+    Name the path read_frame and read_arrow take in this process, for logs and benchmarks.
+
+    :return: 'arrow' when pymongoarrow decodes BSON straight into Arrow columns, otherwise 'columns'
+    """
+    return 'arrow' if find_arrow_all is not None else 'columns'
+
+
+def projected_fields(projection):
+    """
+    List the fields an inclusion projection returns, so columns can be allocated before the first document.
+
+    :param projection: Projection dictionary or None
+    :return: List of field names, '_id' first unless excluded, or None when the fields are only known from the
+        documents (no projection, an exclusion projection, or embedded fields)
+    """
+    fields = [field for field in projection or () if field != '_id']
+    if not fields or not all(projection[field] for field in fields) or any('.' in field for field in fields):
+        return None
+    return (['_id'] if projection.get('_id', 1) else []) + fields
+
+
+def read_frame(batches, fields=None):
+    """
+    Build a typed DataFrame from an iterable of document batches. Values are appended to one list per field as
+    the batches arrive, and the DataFrame is built once from those columns, without a frame per batch or a
+    record-by-record conversion.
+
+    :param batches: Iterable of document lists, e.g. AnimalShelter.stream(..., batched=True)
+    :param fields: Field names to collect (see projected_fields), or None to collect every field seen, in order of
+        first appearance; fields a document lacks are None
+    :return: pandas DataFrame
+    """
+    columns = {field: [] for field in fields or ()}
+    count = 0
+    for batch in batches:
+        for document in batch:
+            if fields is None:
+                for field in document:
+                    if field not in columns:
+                        columns[field] = [None] * count
+            for field, column in columns.items():
+                column.append(document.get(field))
+            count += 1
+    if not columns:
+        return pd.DataFrame()
+    return type_frame(pd.DataFrame(columns))
+
+
+def to_arrow(frame):
+    """
+    Convert a DataFrame produced by read_frame into an Arrow table.
+    Categorical columns become Arrow dictionary arrays, so the encoding is preserved. Exclude '_id' with a
+    projection first, since Arrow has no ObjectId type.
+
+    :param frame: pandas DataFrame
+    :return: pyarrow Table
+    """
+    if pyarrow is None:
+        raise ImportError("pyarrow is required for Arrow output: pip install pyarrow")
+    return pyarrow.Table.from_pandas(frame, preserve_index=False)
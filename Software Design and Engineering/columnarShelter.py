@@ -0,0 +1,1130 @@
+"""
+columnarShelter.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module provides ColumnarAnimalShelter, an in-memory backend with the AnimalShelter methods the
+dashboard uses, for analytics and local development over aac_shelter_outcomes.csv (or a Parquet file) without
+MongoDB. Every field is held as one NumPy column: numbers and dates as float64/datetime64 arrays, strings
+dictionary-encoded as integer codes into a list of distinct values (so animal_type, breed and outcome_type filters
+are integer comparisons and their counts a bincount), and tag lists such as rescue_tags as bitmasks. Queries use the
+MongoDB subset the dashboard issues (equality, $ne, $in, $nin, ranges, $regex, $exists, $and/$or/$nor and a
+$geoWithin polygon), with MongoDB's rule that values of different types never compare.
+Usage: SHELTER_BACKEND=columnar python app.py, or ColumnarAnimalShelter.from_file('outcomes.parquet')
+Issues: Data lives in one process, so run the dashboard with a single worker and expect writes to be lost on exit.
+A missing number or date reads back as null. $geoWithin treats polygon edges as straight lines in degrees, which is
+only the same as MongoDB's great-circle edges at city scale. Updates only set fields, as AnimalShelter.update does
+"""
+
+import csv
+import operator
+import os
+import random
+import re
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pymongo.errors
+from bson import ObjectId
+
+from crudOperations import resolve_projection, keyset_page, PROJECTION_PRESETS
+from facetQueries import FACETS, selection_filters, facet_counts
+from geoQueries import within_box, cell_size, DETAIL_ZOOM
+from rescueQueries import tag_document, tagged_copy, tag_fields
+from tableQuery import combine_queries
+from timeQueries import date_range, STRING_FORMAT, TIME_FIELD, TIME_UNITS
+
+# Default data file, the CSV the MongoDB collection is loaded from
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Databases',
+                        'aac_shelter_outcomes.csv')
+# Numeric fields kept as floats even when every value happens to be whole
+FLOAT_FIELDS = ('location_lat', 'location_long', 'age_upon_outcome_in_weeks')
+# Most distinct tags a bitmask column can hold
+MAX_TAGS = 63
+RANGE_OPERATORS = {'$gt': operator.gt, '$gte': operator.ge, '$lt': operator.lt, '$lte': operator.le}
+
+
+class _Missing:
+    """
+    Marker for a field a document doesn't have, as opposed to one holding null.
+    """
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+def _type_order(value):
+    """
+    Position of a value's type in MongoDB's comparison order. Values only compare with values of the same type.
+
+    :param value: Python value
+    :return: Integer rank
+    """
+    if value is MISSING or value is None:
+        return 1
+    if isinstance(value, (bool, np.bool_)):
+        return 8
+    if _is_number(value):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (list, tuple)):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def _sort_value(value):
+    """
+    Sort key of a value in MongoDB order: by type first, then by value.
+    """
+    rank = _type_order(value)
+    if rank == 1:
+        return (rank, 0)
+    if rank in (4, 5, 10):
+        return (rank, str(value))
+    return (rank, value)
+
+
+def _compile(pattern, options=''):
+    """
+    Compile a $regex operand with its $options.
+    """
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option, flag in (('i', re.IGNORECASE), ('m', re.MULTILINE), ('s', re.DOTALL), ('x', re.VERBOSE)):
+        if option in (options or ''):
+            flags |= flag
+    return re.compile(pattern, flags)
+
+
+def _equals(value, operand):
+    """
+    MongoDB equality of a stored value and a query value. Null matches missing fields and an array matches
+    any of its elements.
+    """
+    if isinstance(operand, re.Pattern):
+        return _regex_matches(value, operand)
+    if operand is None:
+        return value is MISSING or value is None
+    if value is MISSING:
+        return False
+    if isinstance(value, list) and not isinstance(operand, list):
+        return any(_equals(item, operand) for item in value)
+    return _type_order(value) == _type_order(operand) and value == operand
+
+
+def _compares(value, op, operand):
+    """
+    MongoDB range comparison; values of different types never match.
+    """
+    if isinstance(value, list):
+        return any(_compares(item, op, operand) for item in value)
+    if value is MISSING or value is None or operand is None or _type_order(value) != _type_order(operand):
+        return False
+    try:
+        return RANGE_OPERATORS[op](value, operand)
+    except TypeError:
+        return False
+
+
+def _regex_matches(value, pattern):
+    if isinstance(value, list):
+        return any(_regex_matches(item, pattern) for item in value)
+    return isinstance(value, str) and pattern.search(value) is not None
+
+
+def _matches(value, op, operand, options=''):
+    """
+    Evaluate one query operator against one stored value.
+
+    :param value: Stored value, or MISSING
+    :param op: Operator such as '$eq' or '$in'
+    :param operand: Query value of the operator
+    :param options: $options of a $regex
+    :return: True if the value matches
+    :raises ValueError: For operators outside the supported subset
+    """
+    if op == '$eq':
+        return _equals(value, operand)
+    if op == '$ne':
+        return not _equals(value, operand)
+    if op in RANGE_OPERATORS:
+        return _compares(value, op, operand)
+    if op == '$in':
+        return any(_equals(value, item) for item in operand)
+    if op == '$nin':
+        return not any(_equals(value, item) for item in operand)
+    if op == '$regex':
+        return _regex_matches(value, _compile(operand, options))
+    if op == '$exists':
+        return (value is not MISSING) == bool(operand)
+    raise ValueError(f"Unsupported query operator: {op}")
+
+
+class ObjectColumn:
+    """
+    Column of arbitrary Python values. Comparisons run per row, on the rows still in question.
+    """
+    dtype = object
+    fill = MISSING
+
+    def __init__(self, values):
+        self.data = np.empty(max(len(values), 16), dtype=self.dtype)
+        self.data[:] = self.fill
+        for row, value in enumerate(values):
+            self.data[row] = self.encode(value)
+        self.size = len(values)
+        # Bumped by every change, so cached sort keys know when to recompute
+        self.version = 0
+        self._sort_cache = (None, None)
+
+    def accepts(self, value):
+        return True
+
+    def encode(self, value):
+        return value
+
+    def decode(self, raw):
+        return raw
+
+    def get(self, row):
+        return self.decode(self.data[row])
+
+    def take(self, rows):
+        """
+        Decode the values of some rows.
+
+        :param rows: Array of row positions
+        :return: List of values (MISSING for missing fields)
+        """
+        return [self.decode(raw) for raw in self.data[rows]]
+
+    def append(self, value):
+        if self.size == len(self.data):
+            grown = np.empty(len(self.data) * 2, dtype=self.dtype)
+            grown[:] = self.fill
+            grown[:self.size] = self.data
+            self.data = grown
+        self.data[self.size] = self.encode(value)
+        self.size += 1
+        self.version += 1
+
+    def set(self, row, value):
+        self.data[row] = self.encode(value)
+        self.version += 1
+
+    def delete(self, row):
+        self.data[row:self.size - 1] = self.data[row + 1:self.size]
+        self.size -= 1
+        self.data[self.size] = self.fill
+        self.version += 1
+
+    def to_object(self):
+        """
+        Copy the column into an ObjectColumn, for a value this column's type can't hold.
+        """
+        return ObjectColumn(self.take(np.arange(self.size)))
+
+    def compare(self, op, operand, options=''):
+        """
+        Evaluate an operator on every row with array operations.
+
+        :return: Boolean array, or None when the operator needs the per-row fallback
+        """
+        return None
+
+    def sort_key(self):
+        """
+        Ascending sort key of every row in MongoDB order, cached until the column changes.
+
+        :return: float64 array
+        """
+        version, key = self._sort_cache
+        if version != self.version:
+            key = self._sort_key()
+            self._sort_cache = (self.version, key)
+        return key
+
+    def _sort_key(self):
+        values = self.take(np.arange(self.size))
+        keys = [_sort_value(value) for value in values]
+        order = sorted(range(len(values)), key=keys.__getitem__)
+        ranks = np.empty(len(values))
+        rank, previous = -1, None
+        for row in order:
+            if rank < 0 or keys[row] != previous:
+                rank += 1
+                previous = keys[row]
+            ranks[row] = rank
+        return ranks
+
+
+class FloatColumn(ObjectColumn):
+    """
+    Numbers as float64, with NaN for null.
+    """
+    dtype = np.float64
+    fill = np.nan
+
+    def accepts(self, value):
+        return value is MISSING or value is None or _is_number(value)
+
+    def encode(self, value):
+        return np.nan if value is MISSING or value is None else float(value)
+
+    def decode(self, raw):
+        return None if np.isnan(raw) else float(raw)
+
+    def take(self, rows):
+        values = self.data[rows].astype(object)
+        values[np.isnan(self.data[rows])] = None
+        return list(values)
+
+    def compare(self, op, operand, options=''):
+        values = self.data[:self.size]
+        if op in ('$eq', '$ne'):
+            if operand is None:
+                mask = np.isnan(values)
+            elif _is_number(operand):
+                mask = values == operand
+            else:
+                mask = np.zeros(self.size, dtype=bool)
+            return ~mask if op == '$ne' else mask
+        if op in RANGE_OPERATORS:
+            if not _is_number(operand):
+                return np.zeros(self.size, dtype=bool)
+            with np.errstate(invalid='ignore'):
+                return RANGE_OPERATORS[op](values, operand)
+        if op in ('$in', '$nin') and all(item is None or _is_number(item) for item in operand):
+            mask = np.isin(values, [item for item in operand if item is not None])
+            if any(item is None for item in operand):
+                mask |= np.isnan(values)
+            return ~mask if op == '$nin' else mask
+        return None
+
+    def _sort_key(self):
+        # Null sorts before every number
+        return np.where(np.isnan(self.data[:self.size]), -np.inf, self.data[:self.size])
+
+
+class DatetimeColumn(ObjectColumn):
+    """
+    Dates as datetime64 in microseconds, with NaT for null.
+    """
+    dtype = 'datetime64[us]'
+    fill = np.datetime64('NaT')
+
+    def accepts(self, value):
+        return value is MISSING or value is None or isinstance(value, datetime)
+
+    def encode(self, value):
+        if value is MISSING or value is None:
+            return np.datetime64('NaT')
+        if value.tzinfo is not None:
+            # Stored like pymongo stores it: UTC without a time zone
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return np.datetime64(value, 'us')
+
+    def decode(self, raw):
+        return None if np.isnat(raw) else raw.item()
+
+    def compare(self, op, operand, options=''):
+        values = self.data[:self.size]
+        if op in ('$eq', '$ne'):
+            if operand is None:
+                mask = np.isnat(values)
+            elif isinstance(operand, datetime):
+                mask = values == self.encode(operand)
+            else:
+                mask = np.zeros(self.size, dtype=bool)
+            return ~mask if op == '$ne' else mask
+        if op in RANGE_OPERATORS:
+            if not isinstance(operand, datetime):
+                return np.zeros(self.size, dtype=bool)
+            return RANGE_OPERATORS[op](values, self.encode(operand)) & ~np.isnat(values)
+        return None
+
+    def periods(self, rows):
+        """
+        :return: datetime64 values of some rows
+        """
+        return self.data[rows]
+
+    def _sort_key(self):
+        values = self.data[:self.size]
+        return np.where(np.isnat(values), -np.inf, values.view('i8').astype(np.float64))
+
+
+class CategoryColumn(ObjectColumn):
+    """
+    Strings dictionary-encoded as int32 codes into the list of distinct values. -1 is a missing field, -2 null.
+    """
+    dtype = np.int32
+    fill = -1
+    NULL = -2
+
+    def __init__(self, values):
+        self.categories = []
+        self.lookup = {}
+        super().__init__(values)
+
+    def accepts(self, value):
+        return value is MISSING or value is None or isinstance(value, str)
+
+    def encode(self, value):
+        if value is MISSING:
+            return -1
+        if value is None:
+            return self.NULL
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def decode(self, raw):
+        if raw == -1:
+            return MISSING
+        if raw == self.NULL:
+            return None
+        return self.categories[raw]
+
+    def labels(self):
+        """
+        :return: Object array indexed by code, where index -1 is MISSING and -2 is None
+        """
+        return np.array(self.categories + [None, MISSING], dtype=object)
+
+    def take(self, rows):
+        return list(self.labels()[self.data[rows]])
+
+    def codes(self, rows=None):
+        return self.data[:self.size] if rows is None else self.data[rows]
+
+    def _codes_where(self, predicate):
+        return np.array([code for code, value in enumerate(self.categories) if predicate(value)], dtype=np.int32)
+
+    def compare(self, op, operand, options=''):
+        codes = self.data[:self.size]
+        if op in ('$eq', '$ne'):
+            if isinstance(operand, re.Pattern):
+                mask = np.isin(codes, self._codes_where(operand.search))
+            elif operand is None:
+                mask = codes < 0
+            else:
+                code = self.lookup.get(operand) if isinstance(operand, str) else None
+                mask = codes == code if code is not None else np.zeros(self.size, dtype=bool)
+            return ~mask if op == '$ne' else mask
+        if op in ('$in', '$nin'):
+            selected = [self.lookup[item] for item in operand if isinstance(item, str) and item in self.lookup]
+            for item in operand:
+                if isinstance(item, re.Pattern):
+                    selected.extend(self._codes_where(item.search))
+            mask = np.isin(codes, selected)
+            if any(item is None for item in operand):
+                mask |= codes < 0
+            return ~mask if op == '$nin' else mask
+        if op == '$regex':
+            return np.isin(codes, self._codes_where(_compile(operand, options).search))
+        if op in RANGE_OPERATORS:
+            if not isinstance(operand, str):
+                return np.zeros(self.size, dtype=bool)
+            compare = RANGE_OPERATORS[op]
+            return np.isin(codes, self._codes_where(lambda value: compare(value, operand)))
+        if op == '$exists':
+            return (codes != -1) == bool(operand)
+        return None
+
+    def _sort_key(self):
+        ranks = np.empty(len(self.categories) + 2)
+        ranks[np.argsort(np.array(self.categories, dtype=object), kind='stable')] = np.arange(len(self.categories))
+        # Missing and null sort first
+        ranks[-2:] = -1
+        return ranks[self.data[:self.size]]
+
+
+class TagColumn(ObjectColumn):
+    """
+    Sorted lists of distinct strings, such as rescue_tags, as int64 bitmasks over the distinct tags. -1 is a missing
+    field, -2 null.
+    """
+    dtype = np.int64
+    fill = -1
+    NULL = -2
+
+    def __init__(self, values):
+        self.tags = []
+        self.lookup = {}
+        super().__init__(values)
+
+    def accepts(self, value):
+        if value is MISSING or value is None:
+            return True
+        if not _is_tag_list(value):
+            return False
+        return len(self.lookup.keys() | set(value)) <= MAX_TAGS
+
+    def encode(self, value):
+        if value is MISSING:
+            return -1
+        if value is None:
+            return self.NULL
+        bits = 0
+        for tag in value:
+            bit = self.lookup.get(tag)
+            if bit is None:
+                bit = self.lookup[tag] = len(self.tags)
+                self.tags.append(tag)
+            bits |= 1 << bit
+        return bits
+
+    def decode(self, raw):
+        if raw == -1:
+            return MISSING
+        if raw == self.NULL:
+            return None
+        return sorted(tag for bit, tag in enumerate(self.tags) if raw >> bit & 1)
+
+    def _any_of(self, tags):
+        bits = 0
+        for tag in tags:
+            if tag in self.lookup:
+                bits |= 1 << self.lookup[tag]
+        values = self.data[:self.size]
+        return (values >= 0) & (values & bits != 0)
+
+    def compare(self, op, operand, options=''):
+        values = self.data[:self.size]
+        if op in ('$eq', '$ne') and (operand is None or isinstance(operand, str)):
+            mask = values < 0 if operand is None else self._any_of([operand])
+            return ~mask if op == '$ne' else mask
+        if op in ('$in', '$nin') and all(item is None or isinstance(item, str) for item in operand):
+            mask = self._any_of([item for item in operand if item is not None])
+            if any(item is None for item in operand):
+                mask |= values < 0
+            return ~mask if op == '$nin' else mask
+        if op == '$exists':
+            return (values != -1) == bool(operand)
+        return None
+
+
+def _is_tag_list(value):
+    """
+    Whether a value fits a TagColumn, which gives tags back sorted and once each.
+    """
+    return isinstance(value, list) and all(isinstance(tag, str) for tag in value) and value == sorted(set(value))
+
+
+def _make_column(name, values):
+    """
+    Choose the column type that fits every value of a field.
+
+    :param name: Field name
+    :param values: List of the field's values, MISSING where a document doesn't have it
+    :return: Column holding the values
+    """
+    present = [value for value in values if value is not MISSING and value is not None]
+    if present and all(_is_number(value) for value in present) and (
+            name in FLOAT_FIELDS or any(isinstance(value, (float, np.floating)) for value in present)):
+        return FloatColumn(values)
+    if present and all(isinstance(value, datetime) for value in present):
+        return DatetimeColumn(values)
+    if present and all(isinstance(value, str) for value in present):
+        return CategoryColumn(values)
+    if present and all(_is_tag_list(value) for value in present):
+        if len({tag for value in present for tag in value}) <= MAX_TAGS:
+            return TagColumn(values)
+    return ObjectColumn(values)
+
+
+def _within_polygon(longitudes, latitudes, ring):
+    """
+    Test points against a polygon ring by counting edge crossings of a ray towards the east.
+
+    :return: Boolean array, False for points without coordinates
+    """
+    inside = np.zeros(len(longitudes), dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+            straddles = (y1 > latitudes) != (y2 > latitudes)
+            inside ^= straddles & (longitudes < (x2 - x1) * (latitudes - y1) / (y2 - y1) + x1)
+    return inside
+
+
+class ColumnarAnimalShelter:
+    """
+    In-memory, column-oriented stand-in for AnimalShelter.
+    """
+
+    def __init__(self, documents=()):
+        """
+        Load documents into columns. Documents are tagged with their rescue types and given an ObjectId _id when
+        they have none, as they would be when inserted through AnimalShelter.
+
+        :param documents: Iterable of document dictionaries
+        """
+        self.lock = threading.RLock()
+        documents = [tag_document(dict(document)) for document in documents]
+        for document in documents:
+            document.setdefault('_id', ObjectId())
+        self.ids = {document['_id'] for document in documents}
+        if len(self.ids) != len(documents):
+            raise ValueError("Documents must have distinct _id values")
+        names = {}
+        for document in documents:
+            for name in document:
+                names.setdefault(name, None)
+        self.columns = {name: _make_column(name, [document.get(name, MISSING) for document in documents])
+                        for name in names}
+        self.size = len(documents)
+        # Outcome dates parsed from a dictionary-encoded string column, by code
+        self._parsed_dates = (None, None)
+
+    @classmethod
+    def from_csv(cls, path=CSV_PATH):
+        """
+        Load the outcomes CSV, typed the way csvLoader loads it into MongoDB.
+
+        :param path: Path to the CSV file
+        :return: ColumnarAnimalShelter
+        """
+        from csvLoader import coerce_row
+        with open(path, newline='') as csv_file:
+            return cls(coerce_row(row) for row in csv.DictReader(csv_file))
+
+    @classmethod
+    def from_parquet(cls, path):
+        """
+        Load outcomes from a Parquet file (needs pyarrow or fastparquet).
+
+        :param path: Path to the Parquet file
+        :return: ColumnarAnimalShelter
+        """
+        import pandas as pd
+        frame = pd.read_parquet(path)
+        frame = frame.astype(object).where(frame.notna(), None)
+        documents = frame.to_dict('records')
+        for document in documents:
+            for name, value in document.items():
+                # Parquet lists come back as arrays and timestamps as pandas Timestamps
+                if isinstance(value, np.ndarray):
+                    document[name] = value.tolist()
+                elif isinstance(value, pd.Timestamp):
+                    document[name] = value.to_pydatetime()
+        return cls(documents)
+
+    @classmethod
+    def from_file(cls, path=CSV_PATH):
+        """
+        Load outcomes from a CSV or Parquet file, chosen by its extension.
+
+        :param path: Path to the file
+        :return: ColumnarAnimalShelter
+        """
+        if path.lower().endswith(('.parquet', '.pq')):
+            return cls.from_parquet(path)
+        return cls.from_csv(path)
+
+    def _document(self, row, fields):
+        document = {}
+        for name in fields:
+            column = self.columns.get(name)
+            value = column.get(row) if column is not None else MISSING
+            if value is not MISSING:
+                document[name] = value
+        return document
+
+    def _fields(self, projection):
+        """
+        Resolve a projection to the list of fields to return.
+        """
+        projection = resolve_projection(projection)
+        if not projection:
+            return list(self.columns)
+        if any(value for name, value in projection.items() if name != '_id'):
+            fields = [name for name, value in projection.items() if name != '_id' and value]
+            return (['_id'] if projection.get('_id', 1) else []) + fields
+        return [name for name in self.columns if projection.get(name, 1)]
+
+    def _match(self, query, mask=None):
+        """
+        Find the rows matching a query.
+
+        :param query: Query dictionary
+        :param mask: Rows still in question, or None for every row
+        :return: Boolean array over the rows
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        mask = np.ones(self.size, dtype=bool) if mask is None else mask.copy()
+        for field, condition in query.items():
+            if not mask.any():
+                break
+            if field == '$and':
+                for item in condition:
+                    mask = self._match(item, mask)
+            elif field in ('$or', '$nor'):
+                matched = np.zeros(self.size, dtype=bool)
+                for item in condition:
+                    matched |= self._match(item, mask)
+                mask &= matched if field == '$or' else ~matched
+            elif field.startswith('$'):
+                raise ValueError(f"Unsupported query operator: {field}")
+            else:
+                mask &= self._match_field(field, condition, mask)
+        return mask
+
+    def _match_field(self, field, condition, mask):
+        """
+        Evaluate the condition on one field for the rows in mask.
+        """
+        if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+            operators = dict(condition)
+        else:
+            operators = {'$eq': condition}
+        options = operators.pop('$options', '')
+        result = mask.copy()
+        for op, operand in operators.items():
+            if op == '$geoWithin':
+                result &= self._geo_within(operand)
+                continue
+            if op == '$not':
+                operand = operand if isinstance(operand, dict) else {'$regex': operand}
+                result &= ~self._match_field(field, operand, result)
+                continue
+            column = self.columns.get(field)
+            matched = column.compare(op, operand, options) if column is not None else None
+            if matched is None:
+                # Per-row fallback, only on the rows that can still match
+                rows = np.flatnonzero(result)
+                values = column.take(rows) if column is not None else [MISSING] * len(rows)
+                matched = np.zeros(self.size, dtype=bool)
+                matched[rows] = [_matches(value, op, operand, options) for value in values]
+            result &= matched
+        return result
+
+    def _geo_within(self, operand):
+        geometry = operand.get('$geometry') if isinstance(operand, dict) else None
+        if not geometry or geometry.get('type') != 'Polygon':
+            raise ValueError("Only $geoWithin with a $geometry polygon is supported")
+        longitudes, latitudes = self.columns.get('location_long'), self.columns.get('location_lat')
+        if not isinstance(longitudes, FloatColumn) or not isinstance(latitudes, FloatColumn):
+            return np.zeros(self.size, dtype=bool)
+        return _within_polygon(longitudes.data[:self.size], latitudes.data[:self.size],
+                               geometry['coordinates'][0])
+
+    def _rows(self, query, sort=None, skip=0, limit=0, mask=None):
+        """
+        Find the positions of the matching rows, sorted and paged. A mask of rows already matched replaces the query.
+        """
+        rows = np.flatnonzero(self._match(query) if mask is None else mask)
+        if sort:
+            keys = []
+            for field, direction in reversed(sort):
+                column = self.columns.get(field)
+                key = column.sort_key()[rows] if column is not None else np.zeros(len(rows))
+                keys.append(key if direction == 1 else -key)
+            rows = rows[np.lexsort(keys)]
+        return rows[skip:skip + limit] if limit else rows[skip:]
+
+    def create(self, data, wait=True):
+        """
+        Insert a document.
+
+        :param data: Dictionary representing the document to be inserted; it is given an _id like insert_one does
+        :param wait: Accepted for compatibility with AnimalShelter; writes are always immediate
+        :return: True
+        """
+        if data is None or not isinstance(data, dict):
+            raise ValueError("Data parameter must be a non-empty dictionary")
+        document = tagged_copy(data)
+        with self.lock:
+            if document['_id'] in self.ids:
+                raise pymongo.errors.DuplicateKeyError(f"Duplicate _id: {document['_id']}", 11000)
+            for name in document:
+                if name not in self.columns:
+                    self.columns[name] = ObjectColumn([MISSING] * self.size)
+            for name, column in self.columns.items():
+                value = document.get(name, MISSING)
+                if not column.accepts(value):
+                    column = self.columns[name] = column.to_object()
+                column.append(value)
+            self.ids.add(document['_id'])
+            self.size += 1
+        return True
+
+    def read(self, query, projection=None, sort=None, skip=0, limit=0, start=None, end=None):
+        """
+        Read documents matching the query.
+
+        Time Complexity: O(n) array operations over the n rows, plus O(m log m) to sort the m matches
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples
+        :param skip: Number of matching documents to skip
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param start: Optional first outcome date to include
+        :param end: Optional first outcome date to exclude
+        :return: List of documents matching the query
+        """
+        with self.lock:
+            fields = self._fields(projection)
+            rows = self._rows(combine_queries(query, date_range(start, end)), sort=sort, skip=skip, limit=limit)
+            return [self._document(row, fields) for row in rows]
+
+    def read_page(self, query, after=None, limit=100, sort=None, projection=None):
+        """
+        Read one page of documents, continuing after the page that returned the token. Tokens are the same as
+        AnimalShelter.read_page issues.
+
+        :param query: Dictionary representing the query criteria
+        :param after: Token returned with the previous page, or None for the first page
+        :param limit: Maximum number of documents in the page
+        :param sort: Optional list of (field, direction) tuples; defaults to date of birth, then animal id
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :return: Tuple of (documents, token for the next page or None after the last page)
+        """
+        return keyset_page(self.read, query, after=after, limit=limit, sort=sort, projection=projection)
+
+    def count(self, query):
+        """
+        Count the documents matching the query.
+
+        :param query: Dictionary representing the query criteria
+        :return: Number of matching documents
+        """
+        with self.lock:
+            return int(self._match(query).sum())
+
+    def read_frame(self, query, projection=None, sort=None, limit=0):
+        """
+        Read matching documents as a pandas DataFrame straight from the columns. Dictionary-encoded columns become
+        categoricals without decoding a value per row.
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples
+        :param limit: Maximum number of rows (0 means no limit)
+        :return: pandas DataFrame with one column per field
+        """
+        import pandas as pd
+        with self.lock:
+            rows = self._rows(query, sort=sort, limit=limit)
+            frame = {}
+            for name in self._fields(projection):
+                column = self.columns.get(name)
+                if isinstance(column, CategoryColumn):
+                    codes = column.codes(rows)
+                    frame[name] = pd.Categorical.from_codes(np.where(codes < 0, -1, codes), column.categories)
+                elif isinstance(column, (FloatColumn, DatetimeColumn)):
+                    frame[name] = column.data[rows]
+                elif column is not None:
+                    frame[name] = [None if value is MISSING else value for value in column.take(rows)]
+            return pd.DataFrame(frame)
+
+    def sample_fields(self, size=100):
+        """
+        List the top-level fields of a random sample of documents, leaving out '_id', fields the 'table' preset
+        excludes, and fields holding embedded documents or arrays, like AnimalShelter.sample_fields.
+
+        :param size: Number of documents to sample
+        :return: List of field names
+        """
+        if size < 1:
+            raise ValueError("Sample size must be a positive integer")
+        with self.lock:
+            rows = np.array(sorted(random.sample(range(self.size), min(size, self.size))), dtype=np.int64)
+            excluded = {name for name, value in PROJECTION_PRESETS['table'].items() if not value}
+            fields = []
+            for name, column in self.columns.items():
+                if name in excluded or isinstance(column, TagColumn):
+                    continue
+                values = [value for value in column.take(rows) if value is not MISSING]
+                if values and not any(isinstance(value, (dict, list)) for value in values):
+                    fields.append(name)
+            return fields
+
+    def breed_counts(self, query, top_n=20):
+        """
+        Count the documents matching the query per breed, from the breed codes of the matches.
+
+        Time Complexity: O(n) to match plus O(m) for the bincount over the m matches
+
+        :param query: Dictionary representing the query criteria
+        :param top_n: Number of most common breeds to return
+        :return: List of dictionaries with 'breed' and 'count' keys, most common first
+        """
+        if top_n < 1:
+            raise ValueError("top_n must be a positive integer")
+        with self.lock:
+            rows = np.flatnonzero(self._match(query))
+            column = self.columns.get('breed')
+            if isinstance(column, CategoryColumn):
+                codes = column.codes(rows)
+                counts = np.bincount(codes[codes >= 0], minlength=len(column.categories))
+                groups = [(breed, int(count)) for breed, count in zip(column.categories, counts) if count]
+                if (codes < 0).any():
+                    groups.append((None, int((codes < 0).sum())))
+            else:
+                totals = {}
+                for value in (column.take(rows) if column is not None else [MISSING] * len(rows)):
+                    value = None if value is MISSING else value
+                    totals[value] = totals.get(value, 0) + 1
+                groups = list(totals.items())
+        # Ties are broken on the breed name, with null first as in MongoDB
+        groups.sort(key=lambda group: (-group[1], _sort_value(group[0])))
+        return [{'breed': breed, 'count': count} for breed, count in groups[:top_n]]
+
+    def outcome_series(self, query=None, start=None, end=None, unit='month', split_by='outcome_type'):
+        """
+        Count the outcomes matching the query per day, week (starting on Monday) or month, split by outcome type.
+
+        :param query: Optional dictionary representing the query criteria
+        :param start: Optional first outcome date to include
+        :param end: Optional first outcome date to exclude
+        :param unit: Bucket size: 'day', 'week' or 'month'
+        :param split_by: Field whose values get a series each, or None for a single series
+        :return: List of dictionaries with 'period', split_by and 'count', in time order
+        """
+        if unit not in TIME_UNITS:
+            raise ValueError(f"Unknown time unit '{unit}', expected one of {TIME_UNITS}")
+        with self.lock:
+            rows = np.flatnonzero(self._match(combine_queries(query or {}, date_range(start, end))))
+            dates = self._dates(rows)
+            valid = ~np.isnat(dates)
+            rows, dates = rows[valid], dates[valid]
+            if unit == 'month':
+                periods = dates.astype('datetime64[M]').astype('datetime64[D]')
+            else:
+                periods = dates.astype('datetime64[D]')
+                if unit == 'week':
+                    # 1970-01-01 was a Thursday, three days after a Monday
+                    days = periods.view('i8')
+                    periods = (days - (days + 3) % 7).view('datetime64[D]')
+            codes, labels = self._group_codes(split_by, rows)
+            # One integer key per (period, split value) pair, counted in a single pass
+            keys, totals = np.unique(periods.view('i8') * len(labels) + codes, return_counts=True)
+        counts = {}
+        for key, total in zip(keys.tolist(), totals.tolist()):
+            period, split = divmod(key, len(labels))
+            # Missing fields and nulls share a bucket, as with $ifNull
+            bucket = counts.setdefault((np.datetime64(period, 'D').item(), _sort_value(labels[split])),
+                                       [labels[split], 0])
+            bucket[1] += total
+        series = []
+        for (period, _), (split, count) in sorted(counts.items(), key=lambda item: item[0]):
+            row = {'period': datetime(period.year, period.month, period.day)}
+            if split_by:
+                row[split_by] = split
+            row['count'] = count
+            series.append(row)
+        return series
+
+    def _dates(self, rows):
+        """
+        Outcome dates of some rows as datetime64, parsing dates stored as strings.
+        """
+        column = self.columns.get(TIME_FIELD)
+        if isinstance(column, DatetimeColumn):
+            return column.periods(rows)
+        if isinstance(column, CategoryColumn):
+            # Parse each distinct string once, keeping the parsed dates for later calls, and look them up by code
+            cached_column, parsed = self._parsed_dates
+            if cached_column is not column:
+                parsed = self._parse_dates([])
+            if len(parsed) < len(column.categories):
+                parsed = np.concatenate([parsed, self._parse_dates(column.categories[len(parsed):])])
+            self._parsed_dates = (column, parsed)
+            return np.concatenate([parsed, self._parse_dates([None, None])])[column.codes(rows)]
+        return self._parse_dates(column.take(rows) if column is not None else [None] * len(rows))
+
+    @staticmethod
+    def _parse_dates(values):
+        dates = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[us]')
+        for index, value in enumerate(values):
+            if isinstance(value, str):
+                try:
+                    value = datetime.strptime(value, STRING_FORMAT)
+                except ValueError:
+                    continue
+            if isinstance(value, datetime):
+                dates[index] = np.datetime64(value, 'us')
+        return dates
+
+    def _group_codes(self, field, rows):
+        """
+        Number the distinct values of a field over some rows, using the dictionary codes when there are some.
+
+        :return: Tuple of (int64 code per row, list of the value of each code with None for missing fields)
+        """
+        column = self.columns.get(field) if field else None
+        if isinstance(column, CategoryColumn):
+            return column.codes(rows).astype(np.int64) + 2, [None, None] + column.categories
+        if isinstance(column, TagColumn):
+            # Rows with the same tags have the same bitmask
+            distinct, codes = np.unique(column.data[rows], return_inverse=True)
+            labels = [column.decode(raw) for raw in distinct]
+            return codes.reshape(-1).astype(np.int64), [None if label is MISSING else label for label in labels]
+        values = column.take(rows) if column is not None else [None] * len(rows)
+        codes = np.empty(len(rows), dtype=np.int64)
+        labels, lookup = [], {}
+        for index, value in enumerate(values):
+            value = None if value is MISSING else value
+            code = lookup.get(_sort_value(value))
+            if code is None:
+                code = lookup[_sort_value(value)] = len(labels)
+                labels.append(value)
+            codes[index] = code
+        return codes, labels
+
+    def faceted_search(self, query, selected=None, sort=None, skip=0, limit=25, projection=None):
+        """
+        Read a page of results together with the counts behind the dashboard filters, like
+        AnimalShelter.faceted_search. Each facet is matched once and counted from its codes.
+
+        :param query: Dictionary of the criteria that aren't facets, such as the table filter and date range
+        :param selected: Dictionary of facet name to selected value, e.g. {'animal_type': 'Dog'}; 'All' doesn't filter
+        :param sort: Optional list of (field, direction) tuples for the page
+        :param skip: Number of matching documents to skip
+        :param limit: Page size; 0 returns the total and counts without documents
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :return: Dictionary with 'documents', 'total' and 'facets', which maps each facet to {'all': count
+            without its selection, 'values': count per option}
+        """
+        filters = selection_filters(selected)
+        with self.lock:
+            matched = self._match(query)
+            masks = {facet: self._match(condition, matched) for facet, condition in filters.items()}
+            everything = np.logical_and.reduce(list(masks.values()))
+            documents = []
+            if limit:
+                fields = self._fields(projection)
+                documents = [self._document(row, fields)
+                             for row in self._rows(None, sort=sort, skip=skip, limit=limit, mask=everything)]
+            facets = {}
+            for facet, field in FACETS.items():
+                others = np.logical_and.reduce([matched] + [mask for name, mask in masks.items() if name != facet])
+                codes, labels = self._group_codes(field, np.flatnonzero(others))
+                counts = np.bincount(codes, minlength=len(labels))
+                facets[facet] = facet_counts(facet, ((labels[code], int(count)) for code, count in enumerate(counts)
+                                                     if count))
+        return {'documents': documents, 'total': int(everything.sum()), 'facets': facets}
+
+    def cluster_markers(self, bounds, zoom, query=None, max_markers=500):
+        """
+        Get the map markers for a viewport, grouping locations into grid cells below DETAIL_ZOOM the same way
+        geoQueries.cluster_pipeline does.
+
+        :param bounds: Leaflet bounds [[south, west], [north, east]]
+        :param zoom: Leaflet zoom level
+        :param query: Optional dictionary of additional query criteria
+        :param max_markers: Maximum number of markers or clusters to return
+        :return: List of dictionaries with 'lat', 'lng', 'count', 'name' and 'breed' keys
+        """
+        query = combine_queries(query, within_box(bounds))
+        if zoom >= DETAIL_ZOOM:
+            return [
+                {'lat': doc.get('location_lat'), 'lng': doc.get('location_long'), 'count': 1,
+                 'name': doc.get('name'), 'breed': doc.get('breed')}
+                for doc in self.read(query, 'map-markers', limit=max_markers)
+            ]
+        with self.lock:
+            rows = np.flatnonzero(self._match(query))
+            longitudes, latitudes = self.columns.get('location_long'), self.columns.get('location_lat')
+            if not isinstance(longitudes, FloatColumn) or not isinstance(latitudes, FloatColumn) or not len(rows):
+                return []
+            lng, lat = longitudes.data[rows], latitudes.data[rows]
+            located = ~(np.isnan(lng) | np.isnan(lat))
+            rows, lng, lat = rows[located], lng[located], lat[located]
+            size = cell_size(zoom)
+            cells = np.stack([np.floor(lng / size), np.floor(lat / size)], axis=1)
+            _, first, inverse, counts = np.unique(cells, axis=0, return_index=True, return_inverse=True,
+                                                  return_counts=True)
+            inverse = inverse.reshape(-1)
+            mean_lat = np.bincount(inverse, weights=lat) / counts
+            mean_lng = np.bincount(inverse, weights=lng) / counts
+            order = np.argsort(-counts, kind='stable')[:max_markers]
+            name, breed = self.columns.get('name'), self.columns.get('breed')
+            markers = []
+            for cell in order:
+                row = rows[first[cell]]
+                markers.append({
+                    'count': int(counts[cell]), 'lat': float(mean_lat[cell]), 'lng': float(mean_lng[cell]),
+                    'name': None if name is None or name.get(row) is MISSING else name.get(row),
+                    'breed': None if breed is None or breed.get(row) is MISSING else breed.get(row),
+                })
+            return markers
+
+    def update(self, query, update_data, wait=True):
+        """
+        Set fields on the first document matching the query.
+
+        :param query: Dictionary representing the query criteria
+        :param update_data: Dictionary of the fields to set
+        :param wait: Accepted for compatibility with AnimalShelter; writes are always immediate
+        :return: True if the document changed
+        """
+        if update_data is None or not isinstance(update_data, dict):
+            raise ValueError("Update data must be a non-empty dictionary")
+        if '_id' in update_data or any('.' in field or field.startswith('$') for field in update_data):
+            raise ValueError("Only top-level fields other than _id can be set")
+        update_data = tag_fields(update_data)
+        with self.lock:
+            rows = np.flatnonzero(self._match(query))
+            if not len(rows):
+                return False
+            row = rows[0]
+            changed = False
+            for field, value in update_data.items():
+                column = self.columns.get(field)
+                if column is None:
+                    column = self.columns[field] = ObjectColumn([MISSING] * self.size)
+                if not column.accepts(value):
+                    column = self.columns[field] = column.to_object()
+                if not _equals(column.get(row), value) or _type_order(column.get(row)) != _type_order(value):
+                    changed = True
+                    column.set(row, value)
+            return changed
+
+    def delete(self, query, wait=True):
+        """
+        Delete the first document matching the query.
+
+        :param query: Dictionary representing the query criteria
+        :param wait: Accepted for compatibility with AnimalShelter; writes are always immediate
+        :return: True if a document was deleted
+        """
+        with self.lock:
+            rows = np.flatnonzero(self._match(query))
+            if not len(rows):
+                return False
+            row = rows[0]
+            self.ids.discard(self.columns['_id'].get(row))
+            for column in self.columns.values():
+                column.delete(row)
+            self.size -= 1
+            return True
+
+    def flush_writes(self):
+        """
+        Nothing to flush: writes are applied immediately. Kept for compatibility with AnimalShelter.
+        """
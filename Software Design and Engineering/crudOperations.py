@@ -3,114 +3,557 @@ crudOperations.py
 Author: Nathan Wilson
 Contact: nathan.wilson3@outlook.com
 Date: 2024-07-21
-Version: 1.1
+Version: 1.2
 Purpose: This module contains the CRUD operations for the AnimalShelter database.
 Added Bulk operations to enhance the program
+Bulk operations accept any iterable and write it in size-bounded chunks, optionally unordered across a thread pool
+Reads accept named projection presets so each dashboard view fetches only the fields it renders
+read_page pages with a range query on the sort keys and an opaque token, so deep pages cost the same as the first
+Writes keep the optional outcome rollups up to date incrementally; bulk writes read the rollup fields of the
+documents they may move between rollup rows before and after the run
 Issues: None known
 """
 
+import base64
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 
 import pymongo
 import pymongo.errors
+from bson import json_util
+
+from queryMetrics import track
+from tableQuery import combine_queries
+from outcomeRollups import RollupTracker
+from rescueQueries import tag_document, tagged_copy, tag_fields, tag_update
 
 logging.basicConfig(level=logging.INFO)
 
+# Number of documents fetched from the server per round trip when streaming results
+DEFAULT_BATCH_SIZE = 1000
+# Maximum number of write requests sent in one bulk_write call
+DEFAULT_CHUNK_SIZE = 1000
+# Named projections for the dashboard views. '_id' is always excluded by the server, since no view shows it.
+PROJECTION_PRESETS = {
+    # Every table column; monthyear repeats the datetime column
+    # rescue_tags (derived from the breed) and the GeoJSON location (repeating location_lat/location_long) are a
+    # list and an embedded document, which can't be shown in a table cell
+    'table': {'_id': 0, 'monthyear': 0, 'rescue_tags': 0, 'location': 0},
+    # The table columns plus the _id, which identifies a row for the live updates pushed by the change feed
+    'table-rows': {'monthyear': 0, 'rescue_tags': 0, 'location': 0},
+    'breed-chart': {'_id': 0, 'breed': 1},
+    'map-markers': {'_id': 0, 'name': 1, 'breed': 1, 'location_lat': 1, 'location_long': 1},
+}
+# Sort used by read_page when none is given; with the '_id' tie-breaker it matches an index in INDEX_SPECS
+DEFAULT_PAGE_SORT = [('date_of_birth', pymongo.ASCENDING), ('animal_id', pymongo.ASCENDING)]
+
+
+def invalidate_cache(cache):
+    """
+    Invalidate the query cache after a write, if one is configured.
+
+    :param cache: QueryCache or None
+    """
+    if cache is not None:
+        cache.invalidate()
+
+
+def apply_rollups(rollups, added=(), removed=()):
+    """
+    Update the outcome rollups after a write, if they are configured. The write itself has succeeded, so a failure
+    is logged rather than raised; OutcomeRollups.rebuild brings the rollups back in line.
+
+    :param rollups: OutcomeRollups or None
+    :param added: Documents that now count towards the rollups
+    :param removed: Documents that no longer count towards the rollups
+    """
+    if rollups is not None:
+        try:
+            rollups.apply(added, removed)
+        except Exception as e:
+            logging.error(f"Failed to update rollups, rebuild them to recover: {e}")
+
+
+def resolve_projection(projection):
+    """
+    Resolve a projection given as the name of a preset.
+
+    :param projection: Projection dictionary, the name of a PROJECTION_PRESETS entry, or None
+    :return: Projection dictionary, or None
+    """
+    if isinstance(projection, str):
+        preset = PROJECTION_PRESETS.get(projection)
+        if preset is None:
+            raise ValueError(f"Unknown projection preset: {projection}")
+        return dict(preset)
+    return projection
+
+
+def page_sort(sort=None):
+    """
+    Complete a sort for keyset paging. '_id' is appended as a tie-breaker, in the direction of the last key so an
+    index can still be walked backwards, which gives every document a unique position in the order.
+
+    :param sort: List of (field, direction) tuples, or None for DEFAULT_PAGE_SORT
+    :return: List of (field, direction) tuples ending with '_id' unless it was already sorted on
+    """
+    sort = [(field, direction) for field, direction in (sort or DEFAULT_PAGE_SORT)]
+    if all(field != '_id' for field, _ in sort):
+        sort.append(('_id', sort[-1][1]))
+    return sort
+
+
+def _field_value(document, field):
+    """
+    Read a possibly dotted field from a document.
+
+    :param document: Document dictionary
+    :param field: Field name, e.g. 'outcome.type'
+    :return: The value, or None when the field is missing
+    """
+    for part in field.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _encode_page_token(sort, document):
+    """
+    Build the continuation token for the page after a document.
+
+    :param sort: Complete sort from page_sort
+    :param document: Last document of the current page
+    :return: URL-safe token string
+    """
+    state = {'sort': sort, 'values': [_field_value(document, field) for field, _ in sort]}
+    return base64.urlsafe_b64encode(json_util.dumps(state).encode()).decode()
+
+
+def _decode_page_token(token, sort):
+    """
+    Read the sort key values stored in a continuation token.
+
+    :param token: Token from an earlier read_page call
+    :param sort: Complete sort from page_sort, which must be the sort the token was issued for
+    :return: List of sort key values of the last document of the previous page
+    """
+    try:
+        state = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+        token_sort = [(field, direction) for field, direction in state['sort']]
+        values = state['values']
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError("Invalid page token")
+    if token_sort != sort or len(values) != len(sort):
+        raise ValueError("Page token was issued for a different sort order")
+    return values
+
+
+def _keyset_query(sort, values):
+    """
+    Build the range query matching the documents that sort after a position. For sort keys k1..kn it matches
+    k1 after v1, or k1 equal to v1 and k2 after v2, and so on. A missing or null value sorts before every other
+    value: ascending, 'after null' is 'not null'; descending, nothing sorts after null and null sorts after
+    every other value.
+
+    :param sort: Complete sort from page_sort
+    :param values: Sort key values of the position
+    :return: Dictionary representing the query criteria
+    """
+    branches = []
+    for index, (field, direction) in enumerate(sort):
+        value = values[index]
+        if value is None and direction != pymongo.ASCENDING:
+            # Null is the last position in a descending order
+            continue
+        branch = {sort[earlier][0]: values[earlier] for earlier in range(index)}
+        if value is None:
+            branch[field] = {'$ne': None}
+        elif direction == pymongo.ASCENDING or field == '_id':
+            branch[field] = {'$gt' if direction == pymongo.ASCENDING else '$lt': value}
+        else:
+            branch['$or'] = [{field: {'$lt': value}}, {field: None}]
+        branches.append(branch)
+    if not branches:
+        # The position is the very last one in the order
+        return {'_id': {'$in': []}}
+    query = {'$or': branches}
+    field, direction = sort[0]
+    # Bounds the scan on the leading key; the $or alone would leave the index bounds open
+    if values[0] is not None and direction == pymongo.ASCENDING:
+        query[field] = {'$gte': values[0]}
+    elif values[0] is not None:
+        # Missing and null keys come after every value in a descending order, so they stay inside the bound
+        query = {'$and': [query, {'$or': [{field: {'$lte': values[0]}}, {field: None}]}]}
+    return query
+
+
+def _sort_projection(projection, fields):
+    """
+    Make sure a projection returns the sort keys, which the continuation token is built from.
+
+    :param projection: Projection dictionary or None
+    :param fields: Sort key field names
+    :return: Tuple of (projection to send, set of top-level fields to remove from the returned documents)
+    """
+    if not projection:
+        return projection, set()
+    projection = dict(projection)
+    inclusive = any(value for key, value in projection.items() if key != '_id')
+    hidden = set()
+    for field in fields:
+        top = field.split('.')[0]
+        if inclusive and field != '_id':
+            if not projection.get(field) and not projection.get(top):
+                projection[field] = 1
+                hidden.add(top)
+        elif field in projection or top in projection:
+            if not projection.get(field, projection.get(top, 1)):
+                projection.pop(field, None)
+                projection.pop(top, None)
+                hidden.add(top)
+    return projection, hidden
+
+def keyset_page(execute, query, after=None, limit=100, sort=None, projection=None):
+    """
+    Read one page with keyset pagination through a read function, so every backend issues the same page tokens.
+
+    :param execute: Function called as execute(query, projection, sort=sort, limit=limit) returning documents
+    :param query: Dictionary representing the query criteria
+    :param after: Token returned with the previous page, or None for the first page
+    :param limit: Maximum number of documents in the page
+    :param sort: Optional list of (field, direction) tuples, DEFAULT_PAGE_SORT when omitted
+    :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+    :return: Tuple of (documents, token for the next page or None after the last page)
+    """
+    if query is None or not isinstance(query, dict):
+        raise ValueError("Query parameter must be a non-empty dictionary")
+    if limit < 1:
+        raise ValueError("Limit must be a positive integer")
+    sort = page_sort(sort)
+    if after is not None:
+        query = combine_queries(query, _keyset_query(sort, _decode_page_token(after, sort)))
+    projection, hidden = _sort_projection(resolve_projection(projection), [field for field, _ in sort])
+    # One extra document tells whether there is a next page
+    documents = execute(query, projection, sort=sort, limit=limit + 1)
+    token = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        token = _encode_page_token(sort, documents[-1])
+    if hidden:
+        documents = [{key: value for key, value in document.items() if key not in hidden}
+                     for document in documents]
+    return documents, token
+
 class BulkOperations:
     """
     Handles bulk operations in the MongoDB collection.
+    Requests are accepted as any iterable, including generators, and written in chunks of at most chunk_size
+    operations so that no single bulk_write message grows without bound. Ordered runs write the chunks one after
+    another and stop at the first error; unordered runs can spread the chunks over a thread pool and report every
+    error at the end.
     """
 
-    def __init__(self, collection):
+    def __init__(self, collection, cache=None, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=1, metrics=None,
+                 rollups=None):
         """
         Initialize the BulkOperations with the given collection.
 
         :param collection: MongoDB collection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param chunk_size: Default maximum number of operations per bulk_write call
+        :param max_workers: Default number of chunks written concurrently in unordered runs
+        :param metrics: Optional QueryMetrics that times every chunk
+        :param rollups: Optional OutcomeRollups kept up to date by every write
         """
         self.collection = collection
+        self.cache = cache
+        self.metrics = metrics
+        self.rollups = rollups
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
 
-    def bulk_insert(self, data_list):
+    def _write_chunk(self, index, offset, requests, ordered):
         """
-        Insert multiple documents into the collection.
+        Write one chunk and describe the outcome.
 
-        :param data_list: List of dictionaries representing the documents to be inserted
-        :return: List of inserted IDs or None if an error occurred
+        :param index: Position of the chunk in the run
+        :param offset: Position of the chunk's first request in the run, used to report errors by global index
+        :param requests: List of pymongo write requests
+        :param ordered: Stop the chunk at its first failed write
+        :return: Tuple of (bulk API result dictionary, chunk summary dictionary)
         """
-        if not data_list or not isinstance(data_list, list):
-            raise ValueError("Data list must be a non-empty list of dictionaries")
-        
+        start = time.perf_counter()
         try:
-            result = self.collection.insert_many(data_list)
-            return result.inserted_ids
-        # Handle specific exceptions for MongoDB errors
+            with track(self.metrics, 'bulk_write'):
+                result = self.collection.bulk_write(requests, ordered=ordered).bulk_api_result
         except pymongo.errors.BulkWriteError as bwe:
-            logging.error(f"BulkWriteError: {bwe.details}")
-            raise
-        except pymongo.errors.PyMongoError as pe:
-            logging.error(f"PyMongoError: {pe}")
-            raise
-        except Exception as e:
-            logging.error(f"An unexpected error occurred: {e}")
+            result = bwe.details
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        write_errors = [dict(error, index=error['index'] + offset) for error in result.get('writeErrors', [])]
+        upserted = [dict(item, index=item['index'] + offset) for item in result.get('upserted', [])]
+        result = dict(result, writeErrors=write_errors, upserted=upserted)
+        summary = {
+            'chunk': index,
+            'offset': offset,
+            'size': len(requests),
+            'elapsed_ms': round(elapsed_ms, 3),
+            'errors': len(write_errors) + len(result.get('writeConcernErrors', [])),
+        }
+        return result, summary
+
+    def bulk_write(self, requests, ordered=True, chunk_size=None, max_workers=None):
+        """
+        Write pymongo requests (InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany) in chunks.
+        With rollups, requests that may move a document between rollup rows read its rollup fields first, and the
+        rollups are moved by the difference after the run (see RollupTracker); other updates cost nothing extra.
+
+        :param requests: Iterable of pymongo write requests
+        :param ordered: Stop at the first failed write (True) or attempt every request (False)
+        :param chunk_size: Maximum number of requests per bulk_write call (defaults to the instance setting)
+        :param max_workers: Chunks written concurrently when unordered (defaults to the instance setting)
+        :return: Aggregated result with nInserted, nMatched, nModified, nRemoved, nUpserted, upserted, writeErrors,
+            writeConcernErrors, and 'chunks', a list of per-chunk sizes, timings and error counts.
+            Error and upsert indexes refer to the position of the request in the whole input.
+        :raises BulkWriteError: If any write failed; its details hold the aggregated result
+        """
+        if self.rollups is None:
+            return self._write(requests, ordered, chunk_size, max_workers)
+
+        tracker = RollupTracker(self.rollups)
+        projection = self.rollups.projection()
+
+        def tracked():
+            # Chunks are taken from this generator one at a time, so a request is read after the chunks before it
+            # were written
+            for index, request in enumerate(requests):
+                read = tracker.reads(index, request)
+                if read is not None:
+                    query, many = read
+                    if many:
+                        tracker.remember(self.collection.find(query, projection))
+                    else:
+                        tracker.remember(filter(None, [self.collection.find_one(query, projection)]))
+                yield request
+
+        result = None
+        try:
+            result = self._write(tracked(), ordered, chunk_size, max_workers)
+            return result
+        except pymongo.errors.BulkWriteError as bwe:
+            result = bwe.details
             raise
+        finally:
+            self._apply_tracked(tracker, result, ordered)
 
-    def bulk_update(self, operations_list):
+    def _apply_tracked(self, tracker, result, ordered):
         """
-        Perform bulk update operations.
+        Move the rollups by what a tracked run changed. The run itself has finished, so a failure is logged.
 
-        :param operations_list: List of update operations (each operation is a dictionary with 'filter' and 'update' keys)
-        :return: The result of the bulk update operation
+        :param tracker: RollupTracker that watched the run
+        :param result: Aggregated result or BulkWriteError details, or None when the run failed without either
+        :param ordered: Whether the run stopped at its first failed write
         """
-        if not operations_list or not isinstance(operations_list, list):
-            raise ValueError("Operations list must be a non-empty list of update operations")
-        
-        for op in operations_list:
-            if not isinstance(op, dict) or 'filter' not in op or 'update' not in op:
-                raise ValueError("Each operation must be a dictionary with 'filter' and 'update' keys")
-        
+        added, ids, removed = tracker.settle(result, ordered)
+        if not (added or ids or removed):
+            return
         try:
-            bulk_ops = [pymongo.UpdateOne(op['filter'], {'$set': op['update']}) for op in operations_list]
-            result = self.collection.bulk_write(bulk_ops)
-            return result.bulk_api_result
-        except pymongo.errors.BulkWriteError as bwe:
-            logging.error(f"BulkWriteError during bulk update: {bwe.details}")
-            raise
-        except pymongo.errors.PyMongoError as pe:
-            logging.error(f"PyMongoError during bulk update: {pe}")
-            raise
+            if ids:
+                added = added + list(self.collection.find({'_id': {'$in': ids}}, self.rollups.projection()))
+        except pymongo.errors.PyMongoError as e:
+            logging.error(f"Failed to read back a bulk write, rebuild the rollups to recover: {e}")
+            return
+        apply_rollups(self.rollups, added=added, removed=removed)
+
+    def _write(self, requests, ordered, chunk_size, max_workers):
+        """
+        Write requests in chunks without touching the rollups. See bulk_write.
+
+        :param requests: Iterable of pymongo write requests
+        :param ordered: Stop at the first failed write
+        :param chunk_size: Maximum number of requests per bulk_write call, or None for the instance setting
+        :param max_workers: Chunks written concurrently when unordered, or None for the instance setting
+        :return: Aggregated result dictionary
+        """
+        chunk_size = chunk_size or self.chunk_size
+        max_workers = max_workers or self.max_workers
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be a positive integer")
+
+        totals = {'nInserted': 0, 'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0,
+                  'upserted': [], 'writeErrors': [], 'writeConcernErrors': [], 'chunks': []}
+
+        def collect(result, summary):
+            for key in ('nInserted', 'nUpserted', 'nMatched', 'nModified', 'nRemoved'):
+                totals[key] += result.get(key, 0)
+            for key in ('upserted', 'writeErrors', 'writeConcernErrors'):
+                totals[key].extend(result.get(key, []))
+            totals['chunks'].append(summary)
+
+        def chunks():
+            iterator = iter(requests)
+            index = offset = 0
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    return
+                yield index, offset, chunk
+                index += 1
+                offset += len(chunk)
+
+        try:
+            if ordered or max_workers == 1:
+                for index, offset, chunk in chunks():
+                    collect(*self._write_chunk(index, offset, chunk, ordered))
+                    if ordered and totals['writeErrors']:
+                        break
+            else:
+                pending = set()
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    for index, offset, chunk in chunks():
+                        # Bound the number of chunks held in memory while the generator is consumed
+                        if len(pending) >= max_workers * 2:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                collect(*future.result())
+                        pending.add(pool.submit(self._write_chunk, index, offset, chunk, ordered))
+                    for future in pending:
+                        collect(*future.result())
         except Exception as e:
-            logging.error(f"An unexpected error occurred during bulk update: {e}")
+            logging.error(f"Bulk write failed after {len(totals['chunks'])} chunks: {e}")
             raise
+        finally:
+            # Invalidate even on failure, since part of the run may have been written
+            invalidate_cache(self.cache)
+
+        if not totals['chunks']:
+            raise ValueError("Requests must contain at least one write operation")
+        totals['chunks'].sort(key=lambda summary: summary['chunk'])
+        totals['writeErrors'].sort(key=lambda error: error['index'])
+        totals['upserted'].sort(key=lambda item: item['index'])
+
+        if totals['writeErrors'] or totals['writeConcernErrors']:
+            first = (totals['writeErrors'] or totals['writeConcernErrors'])[0]
+            logging.error(f"BulkWriteError: {len(totals['writeErrors'])} write errors and "
+                          f"{len(totals['writeConcernErrors'])} write concern errors in "
+                          f"{sum(summary['errors'] > 0 for summary in totals['chunks'])} of "
+                          f"{len(totals['chunks'])} chunks; first: {first.get('errmsg')}")
+            raise pymongo.errors.BulkWriteError(totals)
+        return totals
+
+    def bulk_insert(self, data_list, ordered=True, chunk_size=None, max_workers=None):
+        """
+        Insert multiple documents into the collection.
 
-    def bulk_delete(self, filter_list):
+        :param data_list: Iterable of dictionaries representing the documents to be inserted
+        :param ordered: Stop at the first failed insert (True) or attempt every document in any order (False)
+        :param chunk_size: Maximum number of documents per bulk_write call
+        :param max_workers: Chunks written concurrently when unordered
+        :return: List of inserted IDs
+        """
+        if data_list is None or isinstance(data_list, (dict, str, bytes)):
+            raise ValueError("Data list must be a non-empty iterable of dictionaries")
+        inserted = []
+
+        def requests():
+            for document in data_list:
+                if not isinstance(document, dict):
+                    raise ValueError("Each document must be a dictionary")
+                inserted.append(tag_document(document))
+                yield pymongo.InsertOne(document)
+
+        self.bulk_write(requests(), ordered, chunk_size, max_workers)
+        # InsertOne assigns an _id to documents that don't have one
+        return [document['_id'] for document in inserted]
+
+    def bulk_update(self, operations_list, ordered=True, chunk_size=None, max_workers=None):
+        """
+        Perform bulk update operations.
+        Each operation is a dictionary with a 'filter' key and either:
+        - 'update': update operators such as {'$inc': ...} or an aggregation pipeline list; a plain dictionary of
+          field values is applied with $set
+        - 'replacement': a whole document that replaces the first match (ReplaceOne)
+        plus the optional flags 'many' (update every match with UpdateMany) and 'upsert' (insert when nothing matches).
+
+        :param operations_list: Iterable of update operation dictionaries
+        :param ordered: Stop at the first failed update (True) or attempt every operation (False)
+        :param chunk_size: Maximum number of operations per bulk_write call
+        :param max_workers: Chunks written concurrently when unordered
+        :return: Aggregated result of the bulk update operation (see bulk_write)
+        """
+        if operations_list is None or isinstance(operations_list, (dict, str, bytes)):
+            raise ValueError("Operations list must be a non-empty iterable of update operations")
+        requests = (self._update_request(op) for op in operations_list)
+        return self.bulk_write(requests, ordered=ordered, chunk_size=chunk_size, max_workers=max_workers)
+
+    @staticmethod
+    def _update_request(op):
+        """
+        Convert an update operation dictionary into a pymongo request.
+
+        :param op: Dictionary described in bulk_update
+        :return: UpdateOne, UpdateMany or ReplaceOne request
+        """
+        if not isinstance(op, dict) or 'filter' not in op or ('update' in op) == ('replacement' in op):
+            raise ValueError("Each operation must be a dictionary with 'filter' and either 'update' or "
+                             "'replacement' keys")
+        upsert = op.get('upsert', False)
+        if 'replacement' in op:
+            if op.get('many'):
+                raise ValueError("A replacement applies to a single document and can't be combined with 'many'")
+            return pymongo.ReplaceOne(op['filter'], tag_document(dict(op['replacement'])), upsert=upsert)
+
+        update = op['update']
+        if isinstance(update, dict) and not any(key.startswith('$') for key in update):
+            update = {'$set': update}
+        update = tag_update(update)
+        request_type = pymongo.UpdateMany if op.get('many') else pymongo.UpdateOne
+        return request_type(op['filter'], update, upsert=upsert)
+
+    def bulk_delete(self, filter_list, ordered=True, many=False, chunk_size=None, max_workers=None):
         """
         Perform bulk delete operations.
 
-        :param filter_list: List of filter criteria for deletion
-        :return: The result of the bulk delete operation
+        :param filter_list: Iterable of filter criteria for deletion
+        :param ordered: Stop at the first failed delete (True) or attempt every filter (False)
+        :param many: Delete every match of each filter (DeleteMany) instead of the first one
+        :param chunk_size: Maximum number of filters per bulk_write call
+        :param max_workers: Chunks written concurrently when unordered
+        :return: Aggregated result of the bulk delete operation (see bulk_write)
         """
-        if not filter_list or not isinstance(filter_list, list):
-            raise ValueError("Filter list must be a non-empty list of dictionaries")
-        
-        try:
-            bulk_ops = [pymongo.DeleteOne(filter) for filter in filter_list]
-            result = self.collection.bulk_write(bulk_ops)
-            return result.bulk_api_result
-        except Exception as e:
-            logging.error(f"Failed to perform bulk delete: {e}")
-            raise
+        if filter_list is None or isinstance(filter_list, (dict, str, bytes)):
+            raise ValueError("Filter list must be a non-empty iterable of dictionaries")
+        request_type = pymongo.DeleteMany if many else pymongo.DeleteOne
+
+        def requests():
+            for query in filter_list:
+                if not isinstance(query, dict):
+                    raise ValueError("Each filter must be a dictionary")
+                yield request_type(query)
+
+        return self.bulk_write(requests(), ordered=ordered, chunk_size=chunk_size, max_workers=max_workers)
 
 class CreateOperation:
     """
     Handles the creation of documents in the MongoDB collection.
     """
 
-    def __init__(self, collection):
+    def __init__(self, collection, cache=None, metrics=None, rollups=None):
         """
         Initialize the CreateOperation with the given collection.
 
         :param collection: MongoDB collection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param metrics: Optional QueryMetrics that times every operation
+        :param rollups: Optional OutcomeRollups updated with every inserted document
         """
         self.collection = collection
+        self.cache = cache
+        self.metrics = metrics
+        self.rollups = rollups
 
     def execute(self, data):
         """
@@ -121,8 +564,11 @@ class CreateOperation:
         """
         if data is None or not isinstance(data, dict):
             raise ValueError("Data parameter must be a non-empty dictionary")
+        document = tagged_copy(data)
         try:
-            result = self.collection.insert_one(data)
+            with track(self.metrics, 'create'):
+                result = self.collection.insert_one(document)
+            apply_rollups(self.rollups, added=[document])
             return result.acknowledged
         except pymongo.errors.DuplicateKeyError as e:
             logging.error(f"Duplicate key error: {e}")
@@ -130,48 +576,228 @@ class CreateOperation:
         except Exception as e:
             logging.error(f"Failed to insert document: {e}")
             raise RuntimeError(f"Failed to insert document: {e}")
+        finally:
+            invalidate_cache(self.cache)
 
 class ReadOperation:
     """
     Handles the reading of documents from the MongoDB collection.
     """
 
-    def __init__(self, collection):
+    def __init__(self, collection, cache=None, metrics=None):
         """
         Initialize the ReadOperation with the given collection.
 
         :param collection: MongoDB collection object
+        :param cache: Optional QueryCache used to serve repeated reads
+        :param metrics: Optional QueryMetrics that times every operation
         """
         self.collection = collection
+        self.cache = cache
+        self.metrics = metrics
 
-    def execute(self, query, projection=None):
+    def execute(self, query, projection=None, sort=None, skip=0, limit=0):
         """
         Retrieve documents from the collection based on the query.
 
         :param query: Dictionary representing the query criteria
-        :param projection: Dictionary representing the fields to include or exclude
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param skip: Number of matching documents to skip before returning results
+        :param limit: Maximum number of documents to return (0 means no limit)
         :return: List of documents matching the query
         """
         if query is None or not isinstance(query, dict):
             raise ValueError("Query parameter must be a non-empty dictionary")
+        if skip < 0 or limit < 0:
+            raise ValueError("Skip and limit must be non-negative integers")
+        projection = resolve_projection(projection)
+        if self.cache is not None:
+            key = self.cache.make_key('find', query, projection, sort=sort, skip=skip, limit=limit)
+            found, cached = self.cache.get(key)
+            if found:
+                # Copy the list so callers can't change the cached entry's length or order
+                return list(cached)
+            generation = self.cache.generation
+        explain = {'find': self.collection.name, 'filter': query, 'skip': skip, 'limit': limit}
+        if projection:
+            explain['projection'] = projection
+        if sort:
+            explain['sort'] = dict(sort)
+        try:
+            with track(self.metrics, 'read', query, self.collection, explain):
+                result = self.collection.find(query, projection, skip=skip, limit=limit)
+                if sort:
+                    result = result.sort(sort)
+                documents = list(result)
+        except Exception as e:
+            raise RuntimeError(f"Failed to read documents: {e}")
+        if self.cache is not None:
+            self.cache.put(key, documents, generation)
+            return list(documents)
+        return documents
+
+    def stream(self, query, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE, max_time_ms=None,
+               batched=False):
+        """
+        Lazily retrieve documents from the collection based on the query.
+        Unlike execute, the results are never materialised as one list, so memory use stays constant no matter
+        how many documents match.
+
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :param sort: Optional list of (field, direction) tuples to order the results by
+        :param limit: Maximum number of documents to return (0 means no limit)
+        :param batch_size: Number of documents fetched per round trip, and the size of each yielded batch
+        :param max_time_ms: Optional server-side time limit for the query in milliseconds
+        :param batched: Yield lists of up to batch_size documents instead of single documents
+        :return: Generator of documents, or of document lists when batched is True
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        if batch_size < 1 or limit < 0:
+            raise ValueError("Batch size must be positive and limit must be non-negative")
+        projection = resolve_projection(projection)
         try:
-            result = self.collection.find(query, projection)
-            return list(result)
+            cursor = self.collection.find(query, projection, limit=limit, batch_size=batch_size)
+            if sort:
+                cursor = cursor.sort(sort)
+            if max_time_ms is not None:
+                cursor = cursor.max_time_ms(max_time_ms)
         except Exception as e:
             raise RuntimeError(f"Failed to read documents: {e}")
+        return self._iterate(cursor, batch_size if batched else None, self.metrics, query)
+
+    @staticmethod
+    def _iterate(cursor, batch_size, metrics=None, query=None):
+        """
+        Yield documents (or batches of documents) from a cursor, closing it when the caller stops iterating.
+
+        :param cursor: MongoDB cursor to read from
+        :param batch_size: Size of each yielded batch, or None to yield single documents
+        :param metrics: Optional QueryMetrics that times the stream from first fetch to close
+        :param query: Query dictionary, used for the metrics query shape
+        :return: Generator of documents or document lists
+        """
+        try:
+            with track(metrics, 'stream', query):
+                if batch_size is None:
+                    yield from cursor
+                else:
+                    while True:
+                        batch = list(islice(cursor, batch_size))
+                        if not batch:
+                            break
+                        yield batch
+        except pymongo.errors.ExecutionTimeout as e:
+            raise TimeoutError(f"Query exceeded max_time_ms: {e}")
+        except pymongo.errors.PyMongoError as e:
+            raise RuntimeError(f"Failed to read documents: {e}")
+        finally:
+            cursor.close()
+
+    def count(self, query):
+        """
+        Count the documents in the collection that match the query.
+
+        :param query: Dictionary representing the query criteria
+        :return: Number of matching documents
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        if self.cache is not None:
+            key = self.cache.make_key('count', query)
+            found, cached = self.cache.get(key)
+            if found:
+                return cached
+            generation = self.cache.generation
+        try:
+            explain = {'count': self.collection.name, 'query': query}
+            with track(self.metrics, 'count', query, self.collection, explain):
+                total = self.collection.count_documents(query)
+        except Exception as e:
+            raise RuntimeError(f"Failed to count documents: {e}")
+        if self.cache is not None:
+            self.cache.put(key, total, generation)
+        return total
+
+    def read_page(self, query, after=None, limit=100, sort=None, projection=None):
+        """
+        Read one page of documents with keyset pagination. Instead of skipping the earlier pages, the page starts
+        with a range query right after the last document of the previous page, so with an index on the sort keys
+        a deep page costs the same as the first.
+
+        :param query: Dictionary representing the query criteria
+        :param after: Token returned with the previous page, or None for the first page
+        :param limit: Maximum number of documents in the page
+        :param sort: Optional list of (field, direction) tuples, DEFAULT_PAGE_SORT when omitted; '_id' is added
+            as a tie-breaker
+        :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+        :return: Tuple of (documents, token for the next page or None after the last page)
+        """
+        return keyset_page(self.execute, query, after=after, limit=limit, sort=sort, projection=projection)
+
+class AggregateOperation:
+    """
+    Handles aggregation pipelines on the MongoDB collection.
+    """
+
+    def __init__(self, collection, cache=None, metrics=None):
+        """
+        Initialize the AggregateOperation with the given collection.
+
+        :param collection: MongoDB collection object
+        :param cache: Optional QueryCache used to serve repeated aggregations
+        :param metrics: Optional QueryMetrics that times every operation
+        """
+        self.collection = collection
+        self.cache = cache
+        self.metrics = metrics
+
+    def execute(self, pipeline):
+        """
+        Run an aggregation pipeline on the collection.
+
+        :param pipeline: List of aggregation stages
+        :return: List of result documents
+        """
+        if not pipeline or not isinstance(pipeline, list):
+            raise ValueError("Pipeline must be a non-empty list of aggregation stages")
+        if self.cache is not None:
+            key = self.cache.make_key('aggregate', pipeline)
+            found, cached = self.cache.get(key)
+            if found:
+                return list(cached)
+            generation = self.cache.generation
+        try:
+            explain = {'aggregate': self.collection.name, 'pipeline': pipeline, 'cursor': {}}
+            with track(self.metrics, 'aggregate', pipeline, self.collection, explain):
+                documents = list(self.collection.aggregate(pipeline))
+        except Exception as e:
+            raise RuntimeError(f"Failed to run aggregation: {e}")
+        if self.cache is not None:
+            self.cache.put(key, documents, generation)
+            return list(documents)
+        return documents
 
 class UpdateOperation:
     """
     Handles the updating of documents in the MongoDB collection.
     """
 
-    def __init__(self, collection):
+    def __init__(self, collection, cache=None, metrics=None, rollups=None):
         """
         Initialize the UpdateOperation with the given collection.
 
         :param collection: MongoDB collection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param metrics: Optional QueryMetrics that times every operation
+        :param rollups: Optional OutcomeRollups moved along when an update changes a rollup field
         """
         self.collection = collection
+        self.cache = cache
+        self.metrics = metrics
+        self.rollups = rollups
 
     def execute(self, query, update_data):
         """
@@ -185,24 +811,56 @@ class UpdateOperation:
             raise ValueError("Query parameter must be a non-empty dictionary")
         if update_data is None or not isinstance(update_data, dict):
             raise ValueError("Update data must be a non-empty dictionary")
+        update_data = tag_fields(update_data)
         try:
-            result = self.collection.update_one(query, {'$set': update_data})
+            if self.rollups is not None and self.rollups.touches(update_data):
+                return self._update_with_rollups(query, update_data)
+            with track(self.metrics, 'update', query):
+                result = self.collection.update_one(query, {'$set': update_data})
             return result.modified_count > 0
         except Exception as e:
             raise RuntimeError(f"Failed to update document: {e}")
+        finally:
+            invalidate_cache(self.cache)
+
+    def _update_with_rollups(self, query, update_data):
+        """
+        Update a document and move it between rollup rows. The old rollup fields are returned by the same atomic
+        find_one_and_update, so a concurrent update can't be counted twice.
+
+        :param query: Dictionary representing the query criteria
+        :param update_data: Dictionary of the fields to set
+        :return: Boolean indicating whether the document changed
+        """
+        projection = dict(self.rollups.projection(), **{field.split('.')[0]: 1 for field in update_data})
+        with track(self.metrics, 'update', query):
+            before = self.collection.find_one_and_update(query, {'$set': update_data}, projection=projection,
+                                                         return_document=pymongo.ReturnDocument.BEFORE)
+        if before is None:
+            return False
+        after = dict(before)
+        after.update((field, value) for field, value in update_data.items() if '.' not in field)
+        apply_rollups(self.rollups, added=[after], removed=[before])
+        return any(_field_value(before, field) != value for field, value in update_data.items())
 
 class DeleteOperation:
     """
     Handles the deletion of documents from the MongoDB collection.
     """
 
-    def __init__(self, collection):
+    def __init__(self, collection, cache=None, metrics=None, rollups=None):
         """
         Initialize the DeleteOperation with the given collection.
 
         :param collection: MongoDB collection object
+        :param cache: Optional QueryCache invalidated after every write
+        :param metrics: Optional QueryMetrics that times every operation
+        :param rollups: Optional OutcomeRollups updated with every deleted document
         """
         self.collection = collection
+        self.cache = cache
+        self.metrics = metrics
+        self.rollups = rollups
 
     def execute(self, query):
         """
@@ -214,7 +872,18 @@ class DeleteOperation:
         if query is None or not isinstance(query, dict):
             raise ValueError("Query parameter must be a non-empty dictionary")
         try:
-            result = self.collection.delete_one(query)
+            if self.rollups is not None:
+                # The deleted document's rollup fields come back from the same atomic operation
+                with track(self.metrics, 'delete', query):
+                    removed = self.collection.find_one_and_delete(query, projection=self.rollups.projection())
+                if removed is None:
+                    return False
+                apply_rollups(self.rollups, removed=[removed])
+                return True
+            with track(self.metrics, 'delete', query):
+                result = self.collection.delete_one(query)
             return result.deleted_count > 0
         except Exception as e:
             raise RuntimeError(f"Failed to delete document: {e}")
+        finally:
+            invalidate_cache(self.cache)
@@ -0,0 +1,263 @@
+"""
+csvLoader.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: This module streams the AAC outcomes CSV into MongoDB. The file is parsed in fixed-size chunks, each row is
+converted to a typed document (dates, float coordinates and ages, and a GeoJSON 'location' point for the
+location_2dsphere index), and chunks are written with unordered insert_many calls on a thread pool. Progress is
+checkpointed per chunk so an interrupted load resumes where it stopped.
+Usage: python csvLoader.py ../Databases/aac_shelter_outcomes.csv --chunk-size 5000 --workers 4
+Issues: Documents use their natural key, the animal_id and outcome datetime, as _id, so neither a resumed chunk
+nor a second file holding some of the same outcomes can insert duplicates. Rows missing either field get an ObjectId
+and would be inserted again by a resumed chunk
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from itertools import islice
+
+import pymongo.errors
+from dotenv import load_dotenv
+
+from DatabaseConnection import DatabaseConnection
+from animalShelter import AnimalShelter
+from crudOperations import BulkOperations
+from geoQueries import location_point
+from tableQuery import NUMERIC_COLUMNS, DATE_COLUMNS
+
+logging.basicConfig(level=logging.INFO)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def outcome_key(row):
+    """
+    Build the _id of an outcome from the animal and the outcome date, as written in the CSV. An animal can leave
+    the shelter more than once, but not twice at the same moment.
+
+    :param row: Dictionary produced by csv.DictReader
+    :return: String such as 'A794011 2016-05-08 18:20:00', or None when either field is missing
+    """
+    animal_id, outcome = (row.get('animal_id') or '').strip(), (row.get('datetime') or '').strip()
+    return f"{animal_id} {outcome}" if animal_id and outcome else None
+
+
+def coerce_row(row):
+    """
+    Convert a CSV row into a typed document.
+    Values that can't be converted are kept as the original string so no data is lost.
+
+    :param row: Dictionary produced by csv.DictReader
+    :return: Document ready to insert
+    """
+    doc = dict(row)
+    # The unnamed first column is the row number, which is only unique within one file
+    rec_num = doc.pop('', None)
+    if rec_num:
+        doc['rec_num'] = int(rec_num)
+    key = outcome_key(row)
+    if key:
+        doc['_id'] = key
+
+    # The typed columns are the ones the table filters build range conditions for
+    for column in NUMERIC_COLUMNS:
+        value = doc.get(column)
+        if value in (None, ''):
+            doc[column] = None
+        else:
+            try:
+                doc[column] = float(value)
+            except ValueError:
+                pass
+
+    for column, date_format in DATE_COLUMNS.items():
+        value = doc.get(column)
+        if value:
+            try:
+                doc[column] = datetime.strptime(value, date_format)
+            except ValueError:
+                pass
+
+    if isinstance(doc.get('location_lat'), float) and isinstance(doc.get('location_long'), float):
+        doc['location'] = location_point(doc['location_lat'], doc['location_long'])
+    return doc
+
+
+def read_chunks(path, chunk_size, skip=frozenset()):
+    """
+    Stream the CSV file as chunks of typed documents, holding only one chunk in memory at a time.
+
+    :param path: Path to the CSV file
+    :param chunk_size: Number of rows per chunk
+    :param skip: Chunk indexes that are already loaded; their rows are read but not converted
+    :return: Generator of (chunk index, list of documents)
+    """
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        reader = csv.DictReader(csv_file)
+        index = 0
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                return
+            if index not in skip:
+                yield index, [coerce_row(row) for row in rows]
+            index += 1
+
+
+class Checkpoint:
+    """
+    Records which chunks of a CSV file have been loaded, in a JSON file next to the CSV.
+    """
+
+    def __init__(self, csv_path, chunk_size, collection_name):
+        """
+        Load the checkpoint for a file, or start a new one.
+        A checkpoint written for a different file version or chunk size is discarded.
+
+        :param csv_path: Path to the CSV file being loaded
+        :param chunk_size: Number of rows per chunk
+        :param collection_name: Name of the target collection
+        """
+        self.path = f"{csv_path}.{collection_name}.progress.json"
+        stat = os.stat(csv_path)
+        self.identity = {'size': stat.st_size, 'mtime': stat.st_mtime, 'chunk_size': chunk_size}
+        self.completed = set()
+        if os.path.exists(self.path):
+            with open(self.path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+            if saved.get('identity') == self.identity:
+                self.completed = set(saved.get('completed', []))
+            else:
+                logging.warning("Checkpoint does not match the CSV file or chunk size; starting from the beginning")
+
+    def mark_done(self, index):
+        """
+        Record a loaded chunk. The file is replaced atomically so a crash never leaves it half written.
+
+        :param index: Chunk index
+        """
+        self.completed.add(index)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump({'identity': self.identity, 'completed': sorted(self.completed)}, checkpoint_file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        """
+        Remove the checkpoint once the whole file is loaded.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def insert_chunk(bulk_operations, docs):
+    """
+    Insert one chunk with an unordered insert_many.
+    Duplicate key errors are expected when a chunk that was partly written before a failure is retried, or when
+    the collection already holds some of the outcomes, so those rows are skipped; any other write error fails the
+    chunk.
+
+    :param bulk_operations: BulkOperations for the target collection
+    :param docs: List of documents
+    :return: Number of documents inserted by this call
+    """
+    try:
+        return len(bulk_operations.bulk_insert(docs, ordered=False))
+    except pymongo.errors.BulkWriteError as bwe:
+        errors = bwe.details.get('writeErrors', [])
+        if any(error.get('code') != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        logging.info(f"Skipped {len(errors)} outcomes already in the collection")
+        return bwe.details.get('nInserted', 0)
+
+
+def load_csv(path, collection, chunk_size=5000, workers=4, resume=True):
+    """
+    Load a CSV file into a collection in parallel chunks.
+
+    :param path: Path to the CSV file
+    :param collection: MongoDB collection object
+    :param chunk_size: Number of rows per insert_many call
+    :param workers: Number of chunks written concurrently
+    :param resume: Skip chunks recorded as loaded by a previous run
+    :return: Dictionary with rows inserted, chunks written, elapsed seconds and rows per second
+    """
+    checkpoint = Checkpoint(path, chunk_size, collection.name)
+    if not resume:
+        checkpoint.completed.clear()
+    elif checkpoint.completed:
+        logging.info(f"Resuming: {len(checkpoint.completed)} chunks already loaded")
+
+    bulk_operations = BulkOperations(collection)
+    inserted = 0
+    chunks = 0
+    start = time.perf_counter()
+
+    def collect(done):
+        nonlocal inserted, chunks
+        for future in done:
+            index = pending.pop(future)
+            inserted += future.result()
+            chunks += 1
+            checkpoint.mark_done(index)
+        elapsed = time.perf_counter() - start
+        logging.info(f"{chunks} chunks, {inserted} rows, {inserted / elapsed:,.0f} rows/sec")
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index, docs in read_chunks(path, chunk_size, skip=frozenset(checkpoint.completed)):
+            # Bound the number of parsed chunks waiting in memory
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(insert_chunk, bulk_operations, docs)] = index
+        if pending:
+            done, _ = wait(pending)
+            collect(done)
+
+    checkpoint.clear()
+    elapsed = time.perf_counter() - start
+    return {'rows': inserted, 'chunks': chunks, 'seconds': round(elapsed, 2),
+            'rows_per_second': round(inserted / elapsed) if elapsed else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream the AAC outcomes CSV into MongoDB')
+    parser.add_argument('csv_path', help='Path to the CSV file')
+    parser.add_argument('--collection', default='AnimalShelter', help='Target collection')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per insert_many call')
+    parser.add_argument('--workers', type=int, default=4, help='Chunks written concurrently')
+    parser.add_argument('--no-resume', action='store_true', help='Ignore any checkpoint from a previous run')
+    args = parser.parse_args()
+
+    load_dotenv()
+    connection_string = os.getenv("MONGO_CONNECTION_STRING")
+    db_name = os.getenv("DB_NAME")
+    if not connection_string or not db_name:
+        logging.error("Environment variables for MongoDB connection are not set correctly.")
+        exit(1)
+
+    db_connection = DatabaseConnection(connection_string, db_name, max_pool_size=max(args.workers, 1) + 2)
+    collection = db_connection.get_collection(args.collection)
+    try:
+        summary = load_csv(args.csv_path, collection, args.chunk_size, args.workers, resume=not args.no_resume)
+    except Exception as e:
+        logging.error(f"Load stopped, rerun the same command to resume: {e}")
+        exit(1)
+    logging.info(f"Loaded {summary['rows']} rows in {summary['seconds']}s ({summary['rows_per_second']:,} rows/sec)")
+
+    # Make sure the dashboard's indexes exist; on a new collection, building them once after the load is
+    # cheaper than maintaining them during it
+    AnimalShelter(connection_string, db_name, args.collection)
+
+
+if __name__ == '__main__':
+    main()
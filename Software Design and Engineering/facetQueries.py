@@ -0,0 +1,128 @@
+"""
+facetQueries.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module builds the faceted search behind the dashboard filter counts: one $facet aggregation that
+returns a page of the filtered outcomes, their total, and counts per animal type, rescue type, outcome type and sex.
+Counts are disjunctive: each facet is counted with every selection except its own, so the number next to an option
+is what the table would show if that option were picked.
+Issues: Only the leading $match can use an index; the facets then run over the documents it matched, and the whole
+result must fit in one 16 MB document, so keep pages small
+"""
+
+from crudOperations import resolve_projection
+from rescueQueries import construct_query, RESCUE_TYPES, TAG_FIELD
+from tableQuery import combine_queries
+
+# Field each facet counts and filters on
+FACETS = {
+    'animal_type': 'animal_type',
+    'rescue_type': TAG_FIELD,
+    'outcome_type': 'outcome_type',
+    'sex_upon_outcome': 'sex_upon_outcome',
+}
+# Selections meaning no filter, as sent by the 'All' radio options
+ALL_VALUES = (None, 'all', 'All')
+
+
+def selection_filters(selected=None):
+    """
+    Build the filter of every facet selection.
+
+    :param selected: Dictionary of facet name to selected value, e.g. {'animal_type': 'Dog',
+        'rescue_type': 'Water Rescue'}; facets left out or set to 'All' don't filter
+    :return: Dictionary of facet name to query dictionary (empty when the facet doesn't filter)
+    :raises ValueError: If a facet is not one of FACETS
+    """
+    selected = selected or {}
+    unknown = set(selected) - set(FACETS)
+    if unknown:
+        raise ValueError(f"Unknown facets {sorted(unknown)}, expected some of {list(FACETS)}")
+    filters = {}
+    for facet, field in FACETS.items():
+        value = selected.get(facet)
+        if value in ALL_VALUES:
+            filters[facet] = {}
+        elif facet == 'rescue_type':
+            filters[facet] = construct_query(value)
+        else:
+            filters[facet] = {field: value}
+    return filters
+
+
+def facet_pipeline(query, selected=None, sort=None, skip=0, limit=25, projection=None):
+    """
+    Build the aggregation returning a page of results and the facet counts in one round trip.
+
+    :param query: Dictionary of the criteria that aren't facets, such as the table filter and date range
+    :param selected: Dictionary of facet name to selected value (see selection_filters)
+    :param sort: Optional list of (field, direction) tuples for the page
+    :param skip: Number of matching documents to skip
+    :param limit: Page size; 0 returns the total and counts without documents
+    :param projection: Dictionary representing the fields to include or exclude, or a PROJECTION_PRESETS name
+    :return: List of aggregation stages producing one document with 'documents', 'total' and one list of
+        {'_id', 'count'} groups per facet
+    """
+    filters = selection_filters(selected)
+    everything = combine_queries(*filters.values())
+    facets = {}
+    if limit:
+        page = [{'$match': everything}]
+        if sort:
+            page.append({'$sort': dict(sort)})
+        if skip:
+            page.append({'$skip': skip})
+        page.append({'$limit': limit})
+        projection = resolve_projection(projection)
+        if projection:
+            page.append({'$project': projection})
+        facets['documents'] = page
+    facets['total'] = [{'$match': everything}, {'$count': 'count'}]
+    for facet, field in FACETS.items():
+        others = combine_queries(*(condition for name, condition in filters.items() if name != facet))
+        # Rescue tags are grouped by the whole array; the few distinct combinations are split up in facet_counts
+        facets[facet] = [{'$match': others}, {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}}]
+    return [{'$match': query}, {'$facet': facets}]
+
+
+def facet_counts(facet, groups):
+    """
+    Turn the groups of one facet into option counts.
+
+    :param facet: Facet name
+    :param groups: Iterable of (value, count) pairs, one per distinct stored value
+    :return: Dictionary with 'all' (the count without this facet's selection) and 'values' (count per option,
+        most common first; rescue types are listed in RESCUE_TYPES order, including those with no matches)
+    """
+    total = 0
+    if facet == 'rescue_type':
+        counts = {label: 0 for label in RESCUE_TYPES}
+        for tags, count in groups:
+            total += count
+            for label, tag in RESCUE_TYPES.items():
+                if isinstance(tags, list) and tag in tags:
+                    counts[label] += count
+        return {'all': total, 'values': counts}
+    counts = {}
+    for value, count in groups:
+        total += count
+        counts[value] = counts.get(value, 0) + count
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0] is not None, str(item[0])))
+    return {'all': total, 'values': dict(ordered)}
+
+
+def facet_results(result):
+    """
+    Read the document produced by facet_pipeline.
+
+    :param result: The single result document of the aggregation
+    :return: Dictionary with 'documents', 'total' and 'facets' (facet name to facet_counts)
+    """
+    return {
+        'documents': result.get('documents', []),
+        'total': result['total'][0]['count'] if result.get('total') else 0,
+        'facets': {facet: facet_counts(facet, ((group['_id'], group['count']) for group in result.get(facet, [])))
+                   for facet in FACETS},
+    }
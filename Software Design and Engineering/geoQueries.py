@@ -0,0 +1,133 @@
+"""
+geoQueries.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module builds geospatial MongoDB filters and the marker clustering pipeline for the dashboard map.
+Every filter targets the GeoJSON 'location' field so the location_2dsphere index is used.
+Issues: Documents need a GeoJSON 'location' point; AnimalShelter.backfill_locations adds it to older documents
+"""
+
+import math
+
+# Zoom level from which individual markers are returned instead of clusters
+DETAIL_ZOOM = 15
+# Custom coordinate reference system that makes MongoDB honour the winding order of a polygon
+STRICT_WINDING_CRS = {'type': 'name', 'properties': {'name': 'urn:x-mongodb:crs:strictwinding:EPSG:4326'}}
+# Grid cells per 256px map tile when clustering; 4 gives clusters roughly 64px apart on screen
+CELLS_PER_TILE = 4
+
+
+def location_point(latitude, longitude):
+    """
+    Build a GeoJSON point. GeoJSON puts longitude first.
+
+    :param latitude: Latitude in degrees
+    :param longitude: Longitude in degrees
+    :return: GeoJSON Point dictionary
+    """
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+
+def within_polygon(coordinates, strict_winding=False):
+    """
+    Build a $geoWithin filter for a polygon.
+
+    :param coordinates: List of [longitude, latitude] pairs; the ring is closed automatically
+    :param strict_winding: Treat the ring as counter-clockwise, which is required for polygons larger than a
+        hemisphere (otherwise MongoDB matches the complement)
+    :return: Query dictionary on the 'location' field
+    """
+    if len(coordinates) < 3:
+        raise ValueError("A polygon needs at least three points")
+    ring = [list(point) for point in coordinates]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    geometry = {'type': 'Polygon', 'coordinates': [ring]}
+    if strict_winding:
+        geometry['crs'] = STRICT_WINDING_CRS
+    return {'location': {'$geoWithin': {'$geometry': geometry}}}
+
+
+def within_box(bounds):
+    """
+    Build a $geoWithin filter for a map viewport.
+    Polygon edges are great-circle arcs, so the box is approximate, which is unnoticeable at city scale.
+    Viewports covering the whole globe or crossing the antimeridian return an empty filter.
+
+    :param bounds: Leaflet bounds [[south, west], [north, east]]
+    :return: Query dictionary on the 'location' field
+    """
+    (south, west), (north, east) = bounds
+    if west < -180 or east > 180 or east <= west:
+        return {}
+    south, north = max(south, -90), min(north, 90)
+    # Counter-clockwise ring, so strict winding keeps the inside of the box for very large viewports
+    return within_polygon([[west, south], [east, south], [east, north], [west, north]], strict_winding=True)
+
+
+def near(longitude, latitude, max_distance_m=None):
+    """
+    Build a $near filter returning documents ordered by distance from a point.
+
+    :param longitude: Longitude of the centre point
+    :param latitude: Latitude of the centre point
+    :param max_distance_m: Optional search radius in metres
+    :return: Query dictionary on the 'location' field
+    """
+    condition = {'$geometry': location_point(latitude, longitude)}
+    if max_distance_m is not None:
+        condition['$maxDistance'] = max_distance_m
+    return {'location': {'$near': condition}}
+
+
+def cell_size(zoom):
+    """
+    Width in degrees of a clustering grid cell at a zoom level.
+
+    :param zoom: Leaflet zoom level
+    :return: Cell size in degrees
+    """
+    return 360 / (2 ** max(zoom, 0)) / CELLS_PER_TILE
+
+
+def cluster_pipeline(query, zoom, max_clusters):
+    """
+    Build an aggregation pipeline that groups matching locations into grid cells for a zoom level.
+    Each cluster reports its size and mean position; single-animal clusters also carry the name and breed
+    so they can be drawn as a regular marker.
+
+    :param query: Dictionary representing the query criteria, including any viewport filter
+    :param zoom: Leaflet zoom level
+    :param max_clusters: Maximum number of clusters to return, largest first
+    :return: List of aggregation stages
+    """
+    size = cell_size(zoom)
+    return [
+        {'$match': query},
+        {'$group': {
+            '_id': {
+                'x': {'$floor': {'$divide': ['$location_long', size]}},
+                'y': {'$floor': {'$divide': ['$location_lat', size]}},
+            },
+            'count': {'$sum': 1},
+            'lat': {'$avg': '$location_lat'},
+            'lng': {'$avg': '$location_long'},
+            'name': {'$first': '$name'},
+            'breed': {'$first': '$breed'},
+        }},
+        {'$sort': {'count': -1}},
+        {'$limit': max_clusters},
+        {'$project': {'_id': 0, 'count': 1, 'lat': 1, 'lng': 1, 'name': 1, 'breed': 1}},
+    ]
+
+
+def marker_radius(count):
+    """
+    Radius in pixels for a cluster marker, growing with the log of its size.
+
+    :param count: Number of animals in the cluster
+    :return: Radius in pixels
+    """
+    return 6 + 4 * math.log10(max(count, 1))
@@ -0,0 +1,25 @@
+"""
+gunicorn.conf.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module is the gunicorn configuration for serving the dashboard with several worker processes.
+The app is imported once in the master and forked into the workers, which connect to MongoDB on their first
+request. Unless QUERY_CACHE_BACKEND is set, the workers share one SQLite query cache.
+Usage: gunicorn -c gunicorn.conf.py wsgi:application
+Issues: None known
+"""
+
+import multiprocessing
+import os
+
+# Read by app.py when the master imports it, before any worker is forked
+os.environ.setdefault('QUERY_CACHE_BACKEND', 'sqlite')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8050')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Callbacks spend most of their time waiting on MongoDB, so each worker serves a few requests at once
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+preload_app = True
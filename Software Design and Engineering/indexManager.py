@@ -0,0 +1,352 @@
+"""
+indexManager.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: This module declares the indexes of the AnimalShelter collection and keeps the collection in line with them.
+Missing indexes are built with a single create_indexes call, and indexes whose options differ from the declaration
+(drift) are reported, matching indexes by key pattern rather than by name. Indexes superseded by a declared one
+are dropped once it exists. The index advisor combines $indexStats
+usage counters, explain plans for the dashboard queries and the database profiler to flag unused or redundant
+indexes and suggest missing ones.
+Usage: python indexManager.py [--collection AnimalShelter] [--apply] [--drop-extra]
+Issues: $indexStats counters reset when mongod restarts, so check the 'since' date before dropping an unused index
+"""
+
+import argparse
+import logging
+import os
+import threading
+
+import pymongo
+import pymongo.errors
+from pymongo import IndexModel, ASCENDING, GEOSPHERE
+from dotenv import load_dotenv
+
+from rescueQueries import dashboard_queries
+
+logging.basicConfig(level=logging.INFO)
+
+# Declared indexes of the AnimalShelter collection. Names match the server defaults so indexes built by earlier
+# versions are recognised. background=True is only honoured by servers older than 4.2; newer servers always use a
+# build that does not block reads or writes.
+INDEX_SPECS = [
+    IndexModel([('animal_type', ASCENDING)], name='animal_type_1', background=True),
+    IndexModel([('breed', ASCENDING)], name='breed_1', background=True),
+    IndexModel([('datetime', ASCENDING)], name='datetime_1', background=True),
+    IndexModel([('outcome_type', ASCENDING)], name='outcome_type_1', background=True),
+    IndexModel([('location', GEOSPHERE)], name='location_2dsphere', background=True),
+    IndexModel([('animal_type', ASCENDING), ('breed', ASCENDING)], name='animal_type_1_breed_1', background=True),
+    # Also serves keyset paging in the default read_page order, with _id as the tie-breaker, and any query or sort
+    # on date_of_birth alone
+    IndexModel([('date_of_birth', ASCENDING), ('animal_id', ASCENDING), ('_id', ASCENDING)],
+               name='date_of_birth_1_animal_id_1__id_1', background=True),
+    IndexModel([('name', ASCENDING), ('animal_type', ASCENDING)], name='name_1_animal_type_1', background=True),
+    # Multikey index for the rescue filters, which match one tag and optionally the animal type
+    IndexModel([('rescue_tags', ASCENDING), ('animal_type', ASCENDING)], name='rescue_tags_1_animal_type_1',
+               background=True),
+]
+# Indexes built by earlier versions that a declared index has replaced, dropped by apply_indexes: date_of_birth_1
+# and date_of_birth_1_animal_id_1 are prefixes of date_of_birth_1_animal_id_1__id_1
+RETIRED_INDEXES = ('date_of_birth_1', 'date_of_birth_1_animal_id_1')
+# Index options compared when detecting drift; anything else (version numbers, namespaces) is ignored
+COMPARED_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds', 'collation', 'hidden')
+# Query operators that select a range of values rather than a single one
+RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte', '$ne', '$nin', '$regex', '$exists', '$not'}
+
+# Namespaces already reconciled by this process, so repeated AnimalShelter construction costs nothing
+_applied = set()
+_applied_lock = threading.Lock()
+
+
+def _key_pattern(key):
+    """
+    Normalise an index key to a hashable tuple of (field, direction) pairs.
+
+    :param key: SON, dictionary or list of (field, direction) pairs
+    :return: Tuple of (field, direction) pairs
+    """
+    items = key.items() if hasattr(key, 'items') else key
+    return tuple((field, direction) for field, direction in items)
+
+
+def _options(document):
+    """
+    Pick the options that matter for drift detection out of an index document.
+
+    :param document: Index document from IndexModel.document or index_information()
+    :return: Dictionary of compared options that are set
+    """
+    return {option: document[option] for option in COMPARED_OPTIONS if document.get(option) not in (None, False)}
+
+
+def index_drift(collection, specs=INDEX_SPECS):
+    """
+    Compare the indexes on a collection with the declared specs, matching them by key pattern.
+
+    :param collection: MongoDB collection object
+    :param specs: List of IndexModel declarations
+    :return: Dictionary with 'missing' (IndexModels to build), 'changed' (list of (existing name, IndexModel) whose
+        options differ), 'retired' (names of RETIRED_INDEXES still present) and 'extra' (names of other indexes that
+        are not declared)
+    """
+    existing = {}
+    for name, info in collection.index_information().items():
+        if name != '_id_':
+            existing[_key_pattern(info['key'])] = (name, info)
+
+    drift = {'missing': [], 'changed': [], 'retired': [], 'extra': []}
+    declared = set()
+    for model in specs:
+        pattern = _key_pattern(model.document['key'])
+        declared.add(pattern)
+        if pattern not in existing:
+            drift['missing'].append(model)
+        elif _options(existing[pattern][1]) != _options(model.document):
+            drift['changed'].append((existing[pattern][0], model))
+    undeclared = [name for pattern, (name, _) in existing.items() if pattern not in declared]
+    drift['retired'] = sorted(name for name in undeclared if name in RETIRED_INDEXES)
+    drift['extra'] = sorted(name for name in undeclared if name not in RETIRED_INDEXES)
+    return drift
+
+
+def apply_indexes(collection, specs=INDEX_SPECS, rebuild_changed=False, drop_extra=False):
+    """
+    Bring the indexes on a collection in line with the declared specs.
+    All missing indexes are built by one create_indexes call, so the collection is scanned once for all of them.
+    Retired indexes are dropped only after that, so the queries they served always have an index.
+
+    :param collection: MongoDB collection object
+    :param specs: List of IndexModel declarations
+    :param rebuild_changed: Drop and rebuild indexes whose options drifted from the declaration
+    :param drop_extra: Drop indexes that are not declared
+    :return: Drift found before the changes were applied (see index_drift)
+    """
+    try:
+        drift = index_drift(collection, specs)
+        to_build = list(drift['missing'])
+        for name, model in drift['changed']:
+            if rebuild_changed:
+                logging.info(f"Rebuilding index {name} to match its declaration")
+                collection.drop_index(name)
+                to_build.append(model)
+            else:
+                logging.warning(f"Index {name} differs from its declaration; rebuild it to apply {model.document}")
+        for name in drift['extra']:
+            if drop_extra:
+                logging.info(f"Dropping undeclared index {name}")
+                collection.drop_index(name)
+            else:
+                logging.warning(f"Index {name} is not declared in INDEX_SPECS")
+        if to_build:
+            names = collection.create_indexes(to_build)
+            logging.info(f"Built indexes: {', '.join(names)}")
+        for name in drift['retired']:
+            logging.info(f"Dropping retired index {name}")
+            collection.drop_index(name)
+        return drift
+    except pymongo.errors.PyMongoError as e:
+        logging.error(f"Failed to apply indexes: {e}")
+        raise RuntimeError(f"Failed to apply indexes: {e}")
+
+
+def ensure_indexes(collection, specs=INDEX_SPECS):
+    """
+    Apply the declared indexes once per collection per process.
+
+    :param collection: MongoDB collection object
+    :param specs: List of IndexModel declarations
+    """
+    namespace = collection.full_name
+    with _applied_lock:
+        if namespace in _applied:
+            return
+        apply_indexes(collection, specs)
+        _applied.add(namespace)
+
+
+def index_usage(collection):
+    """
+    Read how often each index has been used since mongod started.
+
+    :param collection: MongoDB collection object
+    :return: Dictionary of index name to {'ops': count, 'since': datetime}, or an empty dictionary if the server
+        does not support $indexStats
+    """
+    try:
+        stats = collection.aggregate([{'$indexStats': {}}])
+        usage = {}
+        for stat in stats:
+            accesses = stat.get('accesses', {})
+            # Sharded clusters report one document per shard, so counts are summed
+            entry = usage.setdefault(stat['name'], {'ops': 0, 'since': accesses.get('since')})
+            entry['ops'] += int(accesses.get('ops', 0))
+        return usage
+    except pymongo.errors.PyMongoError as e:
+        logging.warning(f"Index usage is unavailable: {e}")
+        return {}
+
+
+def suggest_index(query, sort=None):
+    """
+    Suggest an index for a query using the equality, sort, range rule: fields matched by equality first, then
+    the sort keys, then fields matched by a range.
+
+    :param query: Query dictionary
+    :param sort: Optional list of (field, direction) tuples
+    :return: List of (field, direction) pairs, or an empty list if the query has no indexable fields
+    """
+    equality, ranges = [], []
+    for field, condition in query.items():
+        if field.startswith('$'):
+            continue
+        if isinstance(condition, dict) and any(key in RANGE_OPERATORS for key in condition):
+            ranges.append(field)
+        else:
+            equality.append(field)
+    key = [(field, ASCENDING) for field in sorted(equality)]
+    key += [(field, direction) for field, direction in (sort or []) if field not in equality]
+    key += [(field, ASCENDING) for field in sorted(ranges) if field not in dict(key)]
+    return key
+
+
+def plan_stages(plan):
+    """
+    Collect the stage names of an explain plan, which nests input stages to any depth.
+
+    :param plan: Explain output or a part of it
+    :return: Set of stage names
+    """
+    stages = set()
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.add(plan['stage'])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= plan_stages(value)
+    return stages
+
+
+def _covered(key, patterns):
+    """
+    Check whether an existing index starts with the fields of the suggested key, in any order.
+
+    :param key: List of (field, direction) pairs
+    :param patterns: Key patterns of the existing indexes
+    :return: True if an index already serves the key
+    """
+    fields = {field for field, _ in key}
+    return any({field for field, _ in pattern[:len(key)]} == fields for pattern in patterns)
+
+
+def _profiled_query(entry):
+    """
+    Extract the filter and sort of a profiled command.
+
+    :param entry: Document from system.profile
+    :return: Tuple of (query, sort list), or None for commands that don't filter documents
+    """
+    command = entry.get('command', {})
+    if 'find' in command:
+        return command.get('filter', {}), list(command.get('sort', {}).items())
+    if 'count' in command:
+        return command.get('query', {}), []
+    if 'aggregate' in command:
+        pipeline = command.get('pipeline', [])
+        if pipeline and '$match' in pipeline[0]:
+            return pipeline[0]['$match'], []
+    return None
+
+
+def advise(collection, queries=None, profile_limit=1000):
+    """
+    Review index usage and query plans for a collection.
+
+    :param collection: MongoDB collection object
+    :param queries: Queries to explain (defaults to every query the dashboard filters can issue)
+    :param profile_limit: Number of recent profiler entries to inspect; profiling must be enabled on the database
+        (db.setProfilingLevel(1)) for these to exist
+    :return: Dictionary with 'unused' (names of indexes with no recorded use), 'redundant' (names of indexes that
+        are a prefix of another index) and 'suggested' (list of {'key', 'query', 'source'} for queries that scan the
+        whole collection)
+    """
+    information = collection.index_information()
+    patterns = {name: _key_pattern(info['key']) for name, info in information.items()}
+
+    usage = index_usage(collection)
+    unused = sorted(name for name, stats in usage.items() if name != '_id_' and stats['ops'] == 0)
+    redundant = sorted(
+        name for name, pattern in patterns.items()
+        if name != '_id_' and any(other != pattern and other[:len(pattern)] == pattern for other in patterns.values())
+    )
+
+    suggested = []
+    seen = set()
+
+    def consider(query, sort, source):
+        key = suggest_index(query, sort)
+        if key and not _covered(key, patterns.values()) and tuple(key) not in seen:
+            seen.add(tuple(key))
+            suggested.append({'key': key, 'query': query, 'source': source})
+
+    for query in queries if queries is not None else dashboard_queries():
+        if not query:
+            continue
+        try:
+            plan = collection.find(query).explain()
+        except pymongo.errors.PyMongoError as e:
+            logging.warning(f"Could not explain {query}: {e}")
+            continue
+        if 'COLLSCAN' in plan_stages(plan.get('queryPlanner', plan)):
+            consider(query, [], 'explain')
+
+    profile = collection.database['system.profile']
+    try:
+        entries = profile.find({'ns': collection.full_name, 'planSummary': 'COLLSCAN'}).sort(
+            '$natural', pymongo.DESCENDING).limit(profile_limit)
+        for entry in entries:
+            profiled = _profiled_query(entry)
+            if profiled and profiled[0]:
+                consider(profiled[0], profiled[1], 'profiler')
+    except pymongo.errors.PyMongoError as e:
+        logging.warning(f"Profiler output is unavailable: {e}")
+
+    return {'unused': unused, 'redundant': redundant, 'suggested': suggested}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and apply the declared AnimalShelter indexes')
+    parser.add_argument('--collection', default='AnimalShelter', help='Collection to check')
+    parser.add_argument('--apply', action='store_true', help='Build missing indexes and rebuild drifted ones')
+    parser.add_argument('--drop-extra', action='store_true', help='With --apply, drop undeclared indexes')
+    args = parser.parse_args()
+
+    load_dotenv()
+    connection_string = os.getenv("MONGO_CONNECTION_STRING")
+    db_name = os.getenv("DB_NAME")
+    if not connection_string or not db_name:
+        logging.error("Environment variables for MongoDB connection are not set correctly.")
+        exit(1)
+
+    collection = pymongo.MongoClient(connection_string)[db_name][args.collection]
+    if args.apply:
+        drift = apply_indexes(collection, rebuild_changed=True, drop_extra=args.drop_extra)
+    else:
+        drift = index_drift(collection)
+    print(f"Missing: {[model.document['name'] for model in drift['missing']]}")
+    print(f"Changed: {[name for name, _ in drift['changed']]}")
+    print(f"Retired: {drift['retired']}")
+    print(f"Extra:   {drift['extra']}")
+
+    advice = advise(collection)
+    print(f"Unused since mongod started: {advice['unused']}")
+    print(f"Prefix of another index:     {advice['redundant']}")
+    for suggestion in advice['suggested']:
+        print(f"Suggested index {suggestion['key']} ({suggestion['source']}) for {suggestion['query']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,485 @@
+"""
+outcomeRollups.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.2
+Purpose: This module keeps a materialised rollup of the outcomes collection: one summary document per (month,
+animal_type, outcome_type, breed) holding the number of outcomes and the sum and count of
+age_upon_outcome_in_weeks, from which the average age is derived. Writes update the rollups incrementally with
+$inc; bulk writes read the rollup fields of the documents they change before and after the run (RollupTracker).
+The first build and recovery rebuild them with one aggregation that ends in $merge. Reports then read the small
+summary collection instead of scanning every outcome. AsyncOutcomeRollups does the same writes for the asyncio
+operations.
+Usage: python outcomeRollups.py [--collection AnimalShelter]
+Issues: Rebuilds need MongoDB 4.4 or later ($isNumber, $merge). A rebuild that overlaps with concurrent writes can
+miss or double count those writes; run another rebuild once writes are quiet. A bulk write's deltas are exact only
+if no other writer changes the same documents during the run
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from itertools import chain
+
+import pymongo
+import pymongo.errors
+from bson import ObjectId, json_util
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+
+# Suffix of the summary collection name, e.g. 'AnimalShelter_rollups'
+ROLLUP_SUFFIX = '_rollups'
+# Dimensions of a rollup row, in the order they appear in its _id
+ROLLUP_DIMENSIONS = ('month', 'animal_type', 'outcome_type', 'breed')
+# Source fields a rollup row is computed from
+ROLLUP_FIELDS = ('monthyear', 'animal_type', 'outcome_type', 'breed', 'age_upon_outcome_in_weeks')
+AGE_FIELD = 'age_upon_outcome_in_weeks'
+
+
+def month_of(value):
+    """
+    Reduce a monthyear value to its month, e.g. '2017-04-11T09:00:00' to '2017-04'.
+
+    :param value: monthyear as an ISO string or a datetime
+    :return: Month as 'YYYY-MM', or None when the value is missing or of another type
+    """
+    if isinstance(value, str):
+        return value[:7]
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m')
+    return None
+
+
+def rollup_key(document):
+    """
+    Build the _id of the rollup row a document counts towards.
+
+    :param document: Outcome document, or at least its ROLLUP_FIELDS
+    :return: Dictionary with the ROLLUP_DIMENSIONS in order; missing values are None
+    """
+    return {
+        'month': month_of(document.get('monthyear')),
+        'animal_type': document.get('animal_type'),
+        'outcome_type': document.get('outcome_type'),
+        'breed': document.get('breed'),
+    }
+
+
+def _age(document):
+    """
+    Read the age in weeks of an outcome, if it is a number.
+
+    :param document: Outcome document
+    :return: Age in weeks, or None
+    """
+    age = document.get(AGE_FIELD)
+    if isinstance(age, (int, float)) and not isinstance(age, bool):
+        return age
+    return None
+
+
+def rollup_pipeline(run):
+    """
+    Build the aggregation that recomputes every rollup row from the outcomes and merges it into the summary.
+    The expressions mirror rollup_key and _age, so rebuilt rows carry the same _id as incrementally updated ones.
+
+    :param run: ObjectId stamped on every row written by this rebuild
+    :return: List of aggregation stages without the final $merge
+    """
+    is_age = {'$isNumber': f'${AGE_FIELD}'}
+    return [
+        {'$group': {
+            '_id': {
+                'month': {'$switch': {
+                    'branches': [
+                        {'case': {'$eq': [{'$type': '$monthyear'}, 'string']},
+                         'then': {'$substrCP': ['$monthyear', 0, 7]}},
+                        {'case': {'$eq': [{'$type': '$monthyear'}, 'date']},
+                         'then': {'$dateToString': {'format': '%Y-%m', 'date': '$monthyear'}}},
+                    ],
+                    'default': None,
+                }},
+                # $ifNull keeps a missing field as null instead of dropping it from the _id
+                'animal_type': {'$ifNull': ['$animal_type', None]},
+                'outcome_type': {'$ifNull': ['$outcome_type', None]},
+                'breed': {'$ifNull': ['$breed', None]},
+            },
+            'count': {'$sum': 1},
+            'age_weeks_sum': {'$sum': {'$cond': [is_age, f'${AGE_FIELD}', 0]}},
+            'age_weeks_count': {'$sum': {'$cond': [is_age, 1, 0]}},
+        }},
+        {'$set': {'rebuild': run}},
+    ]
+
+
+def rollup_requests(added=(), removed=()):
+    """
+    Sum the changes of some added and removed outcomes per rollup row, so each row is written once with $inc.
+
+    :param added: Iterable of documents that now count towards the rollups
+    :param removed: Iterable of documents that no longer count towards the rollups
+    :return: List of upserting UpdateOne requests on the summary collection, one per changed row
+    """
+    deltas = {}
+    for document, sign in chain(((document, 1) for document in added), ((document, -1) for document in removed)):
+        key = rollup_key(document)
+        delta = deltas.setdefault(json_util.dumps(key), (key, {'count': 0, 'age_weeks_sum': 0,
+                                                               'age_weeks_count': 0}))[1]
+        delta['count'] += sign
+        age = _age(document)
+        if age is not None:
+            delta['age_weeks_sum'] += sign * age
+            delta['age_weeks_count'] += sign
+    return [pymongo.UpdateOne({'_id': key}, {'$inc': delta}, upsert=True)
+            for key, delta in deltas.values() if any(delta.values())]
+
+
+def rollup_match(query):
+    """
+    Translate a query on the outcomes into the same query on the rollup rows.
+
+    :param query: Query dictionary on animal_type, outcome_type, breed and/or month, combined with $and/$or
+    :return: Query dictionary on the rollup _id fields
+    :raises ValueError: If the query filters on a field the rollups don't keep
+    """
+    translated = {}
+    for field, value in (query or {}).items():
+        if field in ('$and', '$or', '$nor'):
+            translated[field] = [rollup_match(item) for item in value]
+        elif field in ROLLUP_DIMENSIONS:
+            translated[f'_id.{field}'] = value
+        else:
+            raise ValueError(f"Rollups can't filter on '{field}'")
+    return translated
+
+
+def update_fields(update):
+    """
+    List the fields an update document changes.
+
+    :param update: Update operators such as {'$set': ...}, or an aggregation pipeline list
+    :return: List of field names, or None when they can't be known (a pipeline may change any field)
+    """
+    if not isinstance(update, dict):
+        return None
+    fields = []
+    for operator, spec in update.items():
+        if isinstance(spec, dict):
+            fields.extend(spec)
+            if operator == '$rename':
+                fields.extend(value for value in spec.values() if isinstance(value, str))
+    return fields
+
+
+class RollupTracker:
+    """
+    Works out how a bulk write moves outcomes between rollup rows, so the rollups can be updated with $inc instead
+    of rebuilt. The rollup fields of the documents a request may change are read before it is written (see reads)
+    and again after the run, and the difference is applied like a single update. Inserts are counted from the
+    inserted documents, and updates that can't change a rollup field cost nothing.
+    """
+
+    def __init__(self, rollups):
+        """
+        Initialize a tracker for one bulk write.
+
+        :param rollups: OutcomeRollups or AsyncOutcomeRollups, used for touches
+        """
+        self.rollups = rollups
+        # Rollup fields of every document a request may change, as they were before the run, by their JSON _id
+        self.before = {}
+        # List of (index, document, whether the caller gave the _id) per InsertOne
+        self.inserts = []
+        self.changes = False
+
+    def reads(self, index, request):
+        """
+        Record a request before it is written.
+
+        :param index: Position of the request in the run
+        :param request: pymongo InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne or DeleteMany
+        :return: Tuple of (filter, many) selecting the documents to read before the request is written, or None
+            when the request can't move a document between rollup rows
+        """
+        # pymongo keeps the parts of a request in private attributes
+        if isinstance(request, pymongo.InsertOne):
+            self.inserts.append((index, request._doc, '_id' in request._doc))
+            return None
+        if isinstance(request, (pymongo.UpdateOne, pymongo.UpdateMany)) and not request._upsert:
+            fields = update_fields(request._doc)
+            if fields is not None and not self.rollups.touches(fields):
+                return None
+        self.changes = True
+        return request._filter, isinstance(request, (pymongo.UpdateMany, pymongo.DeleteMany))
+
+    def remember(self, documents):
+        """
+        Keep the rollup fields of documents read before a request; the first read of a document wins.
+
+        :param documents: Iterable of documents read with OutcomeRollups.projection
+        """
+        for document in documents:
+            self.before.setdefault(json_util.dumps(document['_id']), document)
+
+    def settle(self, result, ordered):
+        """
+        Split the run into what is already known and what has to be read back.
+
+        :param result: Aggregated bulk API result or BulkWriteError details, or None when the run failed without
+            either
+        :param ordered: Whether the run stopped at its first failed write
+        :return: Tuple of (inserted documents to add, _ids to read back and add, documents to remove)
+        """
+        if result is None:
+            # Only an insert whose _id was generated by the write can't have existed before it
+            written = [document for _, document, given in self.inserts if not given and '_id' in document]
+            if len(written) < len(self.inserts):
+                logging.warning("A failed bulk write may have inserted outcomes the rollups don't count; "
+                                "rebuild them to recover")
+            upserted = []
+        else:
+            failed = {error['index'] for error in result.get('writeErrors', [])}
+            stop = min(failed) if ordered and failed else None
+            written = [document for index, document, _ in self.inserts
+                       if index not in failed and (stop is None or index < stop)]
+            upserted = [item['_id'] for item in result.get('upserted', [])]
+        inserted = {json_util.dumps(document['_id']) for document in written}
+        ids = [document['_id'] for document in self.before.values()] + upserted
+        if self.changes and written:
+            # A later request may have changed or deleted a document inserted earlier in the run
+            ids += [document['_id'] for document in written]
+            written = []
+        removed = [document for key, document in self.before.items() if key not in inserted]
+        return written, ids, removed
+
+
+class OutcomeRollups:
+    """
+    Maintains and reads the outcome rollup collection of an outcomes collection.
+    """
+
+    def __init__(self, collection, summary_name=None):
+        """
+        Initialize the rollups for a collection.
+
+        :param collection: MongoDB collection of outcomes
+        :param summary_name: Name of the summary collection (defaults to the collection name plus ROLLUP_SUFFIX)
+        """
+        self.collection = collection
+        self.summary = collection.database[summary_name or collection.name + ROLLUP_SUFFIX]
+
+    @staticmethod
+    def touches(fields):
+        """
+        Check whether changing some fields can move a document to another rollup row or change its age.
+
+        :param fields: Names of the fields being changed
+        :return: True if any of them is a rollup field
+        """
+        return any(field.split('.')[0] in ROLLUP_FIELDS for field in fields)
+
+    @staticmethod
+    def projection():
+        """
+        Projection that reads just the fields a rollup row is computed from.
+
+        :return: Projection dictionary
+        """
+        return {field: 1 for field in ROLLUP_FIELDS}
+
+    def apply(self, added=(), removed=()):
+        """
+        Update the rollups incrementally for documents added to and removed from the outcomes.
+        An update is applied as the old version removed and the new version added (see rollup_requests).
+
+        :param added: Iterable of documents that now count towards the rollups
+        :param removed: Iterable of documents that no longer count towards the rollups
+        :return: Number of rollup rows changed
+        """
+        requests = rollup_requests(added, removed)
+        if not requests:
+            return 0
+        try:
+            self.summary.bulk_write(requests, ordered=False)
+            # Rows whose last outcome was removed
+            self.summary.delete_many({'count': {'$lte': 0}})
+        except pymongo.errors.PyMongoError as e:
+            raise RuntimeError(f"Failed to update rollups: {e}")
+        return len(requests)
+
+    def rebuild(self):
+        """
+        Recompute every rollup row from the outcomes with one aggregation that merges into the summary collection,
+        then remove rows for combinations that no longer occur. Meant for recovery and the first build; writes keep
+        the rollups current incrementally.
+
+        :return: Number of rollup rows after the rebuild
+        """
+        run = ObjectId()
+        pipeline = rollup_pipeline(run) + [
+            {'$merge': {'into': self.summary.name, 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+        ]
+        try:
+            # Only rows that existed before the rebuild may be stale; rows created meanwhile by apply are kept
+            existing = [row['_id'] for row in self.summary.find({}, {'_id': 1})]
+            self.collection.aggregate(pipeline, allowDiskUse=True)
+            self.summary.delete_many({'_id': {'$in': existing}, 'rebuild': {'$ne': run}})
+            return self.summary.count_documents({})
+        except pymongo.errors.PyMongoError as e:
+            logging.error(f"Failed to rebuild rollups: {e}")
+            raise RuntimeError(f"Failed to rebuild rollups: {e}")
+
+    def ensure_built(self):
+        """
+        Build the rollups if the summary collection is empty but the outcomes are not.
+
+        :return: True if a rebuild ran
+        """
+        if self.summary.find_one({}, {'_id': 1}) is None and self.collection.find_one({}, {'_id': 1}) is not None:
+            self.rebuild()
+            return True
+        return False
+
+    def read(self, query=None, group_by=ROLLUP_DIMENSIONS, top_n=None):
+        """
+        Read outcome statistics from the rollups, grouped by some of the dimensions.
+
+        :param query: Optional query on the dimensions, e.g. {'animal_type': 'Dog', 'month': {'$gte': '2016-01'}}
+        :param group_by: Dimensions to group by; the other dimensions are summed over
+        :param top_n: Return only the top_n groups with the most outcomes, most first (None for every group,
+            ordered by the dimensions)
+        :return: List of dictionaries with the group_by dimensions, 'count' and 'avg_age_weeks'
+        :raises ValueError: If the query or group_by uses a field the rollups don't keep
+        """
+        unknown = [dimension for dimension in group_by if dimension not in ROLLUP_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown rollup dimensions: {unknown}")
+        pipeline = [
+            {'$match': rollup_match(query)},
+            {'$group': {
+                '_id': {dimension: f'$_id.{dimension}' for dimension in group_by},
+                'count': {'$sum': '$count'},
+                'age_weeks_sum': {'$sum': '$age_weeks_sum'},
+                'age_weeks_count': {'$sum': '$age_weeks_count'},
+            }},
+        ]
+        order = {f'_id.{dimension}': 1 for dimension in group_by}
+        if top_n is not None:
+            pipeline += [{'$sort': {'count': -1, **order}}, {'$limit': top_n}]
+        else:
+            pipeline.append({'$sort': order or {'count': -1}})
+        pipeline.append({'$project': {
+            '_id': 0,
+            **{dimension: f'$_id.{dimension}' for dimension in group_by},
+            'count': 1,
+            'avg_age_weeks': {'$cond': [{'$gt': ['$age_weeks_count', 0]},
+                                        {'$divide': ['$age_weeks_sum', '$age_weeks_count']}, None]},
+        }})
+        try:
+            return list(self.summary.aggregate(pipeline))
+        except pymongo.errors.PyMongoError as e:
+            raise RuntimeError(f"Failed to read rollups: {e}")
+
+
+class AsyncOutcomeRollups:
+    """
+    Maintains the outcome rollup collection of an asyncio outcomes collection; reading it is left to OutcomeRollups.
+    """
+
+    touches = staticmethod(OutcomeRollups.touches)
+    projection = staticmethod(OutcomeRollups.projection)
+
+    def __init__(self, collection, summary_name=None):
+        """
+        Initialize the rollups for a collection. The rollups are built, if they are empty, before the first change
+        is applied, since a constructor can't wait for the database.
+
+        :param collection: AsyncCollection of outcomes
+        :param summary_name: Name of the summary collection (defaults to the collection name plus ROLLUP_SUFFIX)
+        """
+        self.collection = collection
+        self.summary = collection.database[summary_name or collection.name + ROLLUP_SUFFIX]
+        self.built = False
+        self._build_lock = asyncio.Lock()
+
+    async def apply(self, added=(), removed=()):
+        """
+        Update the rollups incrementally for documents added to and removed from the outcomes.
+        See OutcomeRollups.apply.
+
+        :param added: Iterable of documents that now count towards the rollups
+        :param removed: Iterable of documents that no longer count towards the rollups
+        :return: Number of rollup rows changed
+        """
+        await self.ensure_built()
+        requests = rollup_requests(added, removed)
+        if not requests:
+            return 0
+        try:
+            await self.summary.bulk_write(requests, ordered=False)
+            await self.summary.delete_many({'count': {'$lte': 0}})
+        except pymongo.errors.PyMongoError as e:
+            raise RuntimeError(f"Failed to update rollups: {e}")
+        return len(requests)
+
+    async def rebuild(self):
+        """
+        Recompute every rollup row from the outcomes. See OutcomeRollups.rebuild.
+
+        :return: Number of rollup rows after the rebuild
+        """
+        run = ObjectId()
+        pipeline = rollup_pipeline(run) + [
+            {'$merge': {'into': self.summary.name, 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+        ]
+        try:
+            existing = [row['_id'] async for row in self.summary.find({}, {'_id': 1})]
+            await (await self.collection.aggregate(pipeline, allowDiskUse=True)).to_list()
+            await self.summary.delete_many({'_id': {'$in': existing}, 'rebuild': {'$ne': run}})
+            self.built = True
+            return await self.summary.count_documents({})
+        except pymongo.errors.PyMongoError as e:
+            logging.error(f"Failed to rebuild rollups: {e}")
+            raise RuntimeError(f"Failed to rebuild rollups: {e}")
+
+    async def ensure_built(self):
+        """
+        Build the rollups once per instance if the summary collection is empty but the outcomes are not.
+
+        :return: True if a rebuild ran
+        """
+        if self.built:
+            return False
+        async with self._build_lock:
+            if self.built:
+                return False
+            if (await self.summary.find_one({}, {'_id': 1}) is None
+                    and await self.collection.find_one({}, {'_id': 1}) is not None):
+                await self.rebuild()
+                return True
+            self.built = True
+            return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the outcome rollups of a collection')
+    parser.add_argument('--collection', default='AnimalShelter', help='Outcomes collection')
+    args = parser.parse_args()
+
+    load_dotenv()
+    connection_string = os.getenv("MONGO_CONNECTION_STRING")
+    db_name = os.getenv("DB_NAME")
+    if not connection_string or not db_name:
+        logging.error("Environment variables for MongoDB connection are not set correctly.")
+        exit(1)
+
+    rollups = OutcomeRollups(pymongo.MongoClient(connection_string)[db_name][args.collection])
+    print(f"Rebuilt {rollups.rebuild()} rollup rows in {rollups.summary.name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""
+queryCache.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.2
+Purpose: This module provides a read-through cache for AnimalShelter reads. Results are keyed on the normalised
+query, projection and paging options, evicted least-recently-used once the cache is full or an entry outlives its
+TTL, and invalidated by every write. An optional change stream watcher also invalidates the cache when another
+process writes to the collection. SqliteQueryCache keeps the same interface in a local SQLite file, so the worker
+processes of a production server on one host share cached results and see each other's invalidations.
+Issues: Change streams require a replica set or sharded cluster; on a standalone server only local writes and the
+TTL keep the cache fresh. The SQLite cache is shared per host only; workers on other hosts still need the change
+stream watcher. Results BSON can't encode, such as integers over 64 bits, are read but not cached
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+import bson.errors
+import pymongo.errors
+from bson import json_util
+
+logging.basicConfig(level=logging.INFO)
+
+# Server error code returned when a resume token is older than the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Operators whose list order does not change the meaning of the query
+UNORDERED_LIST_OPERATORS = ('$in', '$nin', '$all')
+
+
+def normalize(value):
+    """
+    Put a query value into a canonical form so equivalent queries produce the same cache key.
+
+    :param value: Query, projection or option value
+    :return: Normalised value
+    """
+    if isinstance(value, dict):
+        normalized = {}
+        for key in sorted(value):
+            item = normalize(value[key])
+            if key in UNORDERED_LIST_OPERATORS and isinstance(item, list):
+                item = sorted(item, key=json_util.dumps)
+            normalized[key] = item
+        return normalized
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of query results with a time-to-live and write-driven invalidation.
+    """
+
+    def __init__(self, max_entries=128, ttl_seconds=300):
+        """
+        Initialize the cache.
+
+        :param max_entries: Maximum number of results kept before the least recently used is evicted
+        :param ttl_seconds: Number of seconds a result stays valid (None to only expire on writes)
+        """
+        if max_entries < 1:
+            raise ValueError("Cache must hold at least one entry")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Incremented by every invalidation so a read that raced with a write is never cached
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind, query, projection=None, **options):
+        """
+        Build a cache key from the normalised query, projection and options.
+
+        :param kind: Name of the operation being cached, e.g. 'find' or 'count'
+        :param query: Dictionary representing the query criteria
+        :param projection: Dictionary representing the fields to include or exclude
+        :param options: Any other arguments that change the result, e.g. sort, skip and limit
+        :return: String cache key
+        """
+        return json_util.dumps([kind, normalize(query), normalize(projection), normalize(options)])
+
+    def get(self, key):
+        """
+        Look up a cached result.
+
+        :param key: Cache key from make_key
+        :return: Tuple of (found, value)
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (self.ttl_seconds is not None and time.monotonic() - entry[0] > self.ttl_seconds):
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key, value, generation):
+        """
+        Store a result, unless the cache was invalidated after the read started.
+
+        :param key: Cache key from make_key
+        :param value: Result to cache
+        :param generation: Value of self.generation captured before the read was issued
+        """
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Drop every cached result. Called after any write to the collection.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        """
+        Report cache usage.
+
+        :return: Dictionary with entry count, hits, misses and generation
+        """
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'generation': self.generation}
+
+
+class SqliteQueryCache:
+    """
+    Query cache stored in a local SQLite file and shared by every process that opens the same path.
+    Values are stored as BSON, so cached documents keep their ObjectId and datetime values.
+    """
+
+    def __init__(self, path, max_entries=1024, ttl_seconds=300):
+        """
+        Initialize the cache, creating its tables if the file is new.
+
+        :param path: Path of the SQLite database file
+        :param max_entries: Maximum number of results kept before the oldest is evicted
+        :param ttl_seconds: Number of seconds a result stays valid (None to only expire on writes)
+        """
+        if max_entries < 1:
+            raise ValueError("Cache must hold at least one entry")
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.local = threading.local()
+        # Hit and miss counts are kept per process
+        self.hits = 0
+        self.misses = 0
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                           '(key TEXT PRIMARY KEY, stored REAL NOT NULL, value BLOB NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS entries_stored ON entries (stored)')
+        connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        connection.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+
+    def _connection(self):
+        """
+        Get the SQLite connection of the calling thread. Connections are never shared across threads or inherited
+        across a fork, so a forked worker opens its own on first use.
+
+        :return: sqlite3.Connection in autocommit mode
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # WAL lets readers in other processes carry on while one process writes
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    make_key = staticmethod(QueryCache.make_key)
+
+    @property
+    def generation(self):
+        """
+        Invalidation counter shared by every process using the cache file.
+
+        :return: Current generation
+        """
+        try:
+            row = self._connection().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logging.warning(f"Query cache unavailable: {e}")
+            return -1
+
+    def get(self, key):
+        """
+        Look up a cached result. A cache file that can't be read is treated as a miss.
+
+        :param key: Cache key from make_key
+        :return: Tuple of (found, value)
+        """
+        try:
+            row = self._connection().execute('SELECT stored, value FROM entries WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Query cache unavailable: {e}")
+            row = None
+        if row is None or (self.ttl_seconds is not None and time.time() - row[0] > self.ttl_seconds):
+            self.misses += 1
+            return False, None
+        try:
+            value = bson.decode(row[1])['value']
+        except (bson.errors.BSONError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable query cache entry: {e}")
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, value
+
+    def put(self, key, value, generation):
+        """
+        Store a result, unless any process invalidated the cache after the read started. A result that can't be
+        encoded or stored is skipped, so caching never fails the read it follows.
+
+        :param key: Cache key from make_key
+        :param value: Result to cache
+        :param generation: Value of self.generation captured before the read was issued
+        """
+        try:
+            encoded = bson.encode({'value': value})
+        except (bson.errors.BSONError, OverflowError, TypeError) as e:
+            logging.warning(f"Not caching a result BSON can't encode: {e}")
+            return
+        connection = self._connection()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                if generation == self.generation:
+                    connection.execute('INSERT OR REPLACE INTO entries (key, stored, value) VALUES (?, ?, ?)',
+                                       (key, time.time(), encoded))
+                    connection.execute('DELETE FROM entries WHERE key NOT IN '
+                                       '(SELECT key FROM entries ORDER BY stored DESC LIMIT ?)', (self.max_entries,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to store query cache entry: {e}")
+
+    def invalidate(self):
+        """
+        Drop every cached result in every process. Called after any write to the collection.
+        """
+        connection = self._connection()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM entries')
+            connection.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            connection.execute('COMMIT')
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            # The write itself succeeded; other processes fall back to the TTL
+            logging.error(f"Failed to invalidate query cache: {e}")
+
+    def stats(self):
+        """
+        Report cache usage.
+
+        :return: Dictionary with entry count, hits and misses of this process, and generation
+        """
+        entries = self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses, 'generation': self.generation}
+
+
+class ChangeStreamInvalidator:
+    """
+    Watches the collection's change stream in a background thread and invalidates the cache on every change,
+    so writes made by other app workers are seen immediately.
+    """
+
+    def __init__(self, collection, cache, retry_seconds=5):
+        """
+        Initialize the watcher.
+
+        :param collection: MongoDB collection object to watch
+        :param cache: QueryCache to invalidate
+        :param retry_seconds: Delay before reopening the change stream after a transient error
+        """
+        self.collection = collection
+        self.cache = cache
+        self.retry_seconds = retry_seconds
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start watching in a daemon thread.
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._watch, name='query-cache-invalidator', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stop watching. The thread exits the next time the change stream returns.
+        """
+        self.stop_event.set()
+
+    def _watch(self):
+        """
+        Consume the change stream until stopped, resuming after transient errors.
+        """
+        resume_token = None
+        while not self.stop_event.is_set():
+            try:
+                with self.collection.watch(resume_after=resume_token, max_await_time_ms=1000) as stream:
+                    # A change may have been missed while the stream was closed
+                    self.cache.invalidate()
+                    while not self.stop_event.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            resume_token = stream.resume_token
+                            self.cache.invalidate()
+            except pymongo.errors.OperationFailure as e:
+                if resume_token is not None and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    resume_token = None
+                    continue
+                logging.warning(f"Change streams unavailable, cache relies on local writes and TTL: {e}")
+                return
+            except pymongo.errors.PyMongoError as e:
+                logging.error(f"Change stream error, retrying in {self.retry_seconds}s: {e}")
+                self.stop_event.wait(self.retry_seconds)
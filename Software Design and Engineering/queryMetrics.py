@@ -0,0 +1,356 @@
+"""
+queryMetrics.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module provides opt-in instrumentation for the CRUD operation classes. Every operation is timed into a
+latency histogram per operation and query shape (the query with its values removed). A sample of slow reads is
+re-run through explain("executionStats") on a background thread, recording documents and keys examined, the
+indexes used and whether the plan scanned the whole collection (COLLSCAN). Metrics are exported in the Prometheus
+text format or as a JSON-ready dictionary.
+Issues: Explains run against the live collection, so keep the sample rate low on busy servers
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pymongo.errors
+
+from indexManager import plan_stages
+
+logging.basicConfig(level=logging.INFO)
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Shape label used once max_shapes distinct shapes have been seen, to bound the number of exported series
+OTHER_SHAPE = 'other'
+# Prefix of every exported metric name
+METRIC_PREFIX = 'animal_shelter'
+# Plan statistics exported as counters, with their help text
+PLAN_COUNTERS = (
+    ('explains', 'Slow reads explained'),
+    ('collscans', 'Explained reads that scanned the whole collection'),
+    ('docs_examined', 'Documents examined by explained reads'),
+    ('keys_examined', 'Index keys examined by explained reads'),
+    ('returned', 'Documents returned by explained reads'),
+)
+
+
+def query_shape(query):
+    """
+    Reduce a query to its shape: field names and operators are kept, values are replaced with '?'.
+    Queries that differ only in their values share a shape, e.g. {'breed': {'$in': ['A', 'B']}} and
+    {'breed': {'$in': ['C']}} are both {"breed": {"$in": ["?"]}}.
+
+    :param query: Query dictionary or aggregation pipeline
+    :return: Shape as a compact JSON string
+    """
+    def strip(value):
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            # Stages of a pipeline keep their structure; lists of values collapse to one placeholder
+            if value and all(isinstance(item, dict) for item in value):
+                return [strip(item) for item in value]
+            return ['?']
+        return '?'
+
+    if query is None:
+        return ''
+    return json.dumps(strip(query), sort_keys=True, separators=(',', ':'))
+
+
+def _find_value(document, key):
+    """
+    Find the first value stored under a key anywhere in a nested explain document.
+
+    :param document: Explain output or a part of it
+    :param key: Key to look for
+    :return: The value, or None if the key is not present
+    """
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        children = document.values()
+    elif isinstance(document, list):
+        children = document
+    else:
+        return None
+    for child in children:
+        value = _find_value(child, key)
+        if value is not None:
+            return value
+    return None
+
+
+def _index_names(plan):
+    """
+    Collect the names of the indexes scanned by an explain plan.
+
+    :param plan: Explain output or a part of it
+    :return: Set of index names
+    """
+    names = set()
+    if isinstance(plan, dict):
+        if 'indexName' in plan:
+            names.add(plan['indexName'])
+        for value in plan.values():
+            names |= _index_names(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            names |= _index_names(value)
+    return names
+
+
+class Histogram:
+    """
+    Cumulative latency histogram in the Prometheus layout.
+    """
+
+    def __init__(self, buckets):
+        """
+        Initialize an empty histogram.
+
+        :param buckets: Sorted upper bounds of the buckets in seconds
+        """
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        """
+        Add one observation.
+
+        :param seconds: Observed duration in seconds
+        """
+        self.count += 1
+        self.sum += seconds
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        """
+        Bucket counts as Prometheus expects them, each including every smaller bucket.
+
+        :return: List of (upper bound, count) pairs ending with ('+Inf', total count)
+        """
+        pairs, running = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            pairs.append((bound, running))
+        pairs.append(('+Inf', self.count))
+        return pairs
+
+
+class QueryMetrics:
+    """
+    Collects operation latencies and sampled query plans.
+    """
+
+    def __init__(self, slow_ms=100, explain_sample_rate=0.1, buckets=DEFAULT_BUCKETS, max_shapes=200):
+        """
+        Initialize the metrics.
+
+        :param slow_ms: Reads taking at least this long are candidates for an explain
+        :param explain_sample_rate: Fraction of slow reads that are explained (0 disables explains)
+        :param buckets: Upper bounds of the latency histogram buckets in seconds
+        :param max_shapes: Maximum number of distinct query shapes tracked; later shapes are grouped as 'other'
+        """
+        self.slow_ms = slow_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.buckets = tuple(sorted(buckets))
+        self.max_shapes = max_shapes
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.plans = {}
+        self.shapes = set()
+        self.explaining = set()
+        self.executor = None
+
+    def _shape_label(self, shape):
+        """
+        Limit the number of distinct shapes so the exported series stay bounded.
+
+        :param shape: Query shape
+        :return: The shape, or OTHER_SHAPE once max_shapes is reached
+        """
+        if shape in self.shapes:
+            return shape
+        if len(self.shapes) >= self.max_shapes:
+            return OTHER_SHAPE
+        self.shapes.add(shape)
+        return shape
+
+    def observe(self, operation, shape, seconds, failed=False):
+        """
+        Record the duration of one operation.
+
+        :param operation: Operation name, e.g. 'read' or 'update'
+        :param shape: Query shape from query_shape
+        :param seconds: Duration in seconds
+        :param failed: Whether the operation raised an error
+        """
+        with self.lock:
+            key = (operation, self._shape_label(shape))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if failed:
+                histogram.errors += 1
+
+    def sample_explain(self, collection, command, operation, shape, seconds):
+        """
+        Explain a slow read on the background thread, if it is sampled and its shape isn't already being explained.
+
+        :param collection: MongoDB collection the read ran against
+        :param command: Read command to explain, e.g. {'find': name, 'filter': query}
+        :param operation: Operation name
+        :param shape: Query shape
+        :param seconds: Duration of the read in seconds
+        """
+        if seconds * 1000 < self.slow_ms or random.random() >= self.explain_sample_rate:
+            return
+        with self.lock:
+            key = (operation, self._shape_label(shape))
+            if key in self.explaining:
+                return
+            self.explaining.add(key)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='query-explain')
+        self.executor.submit(self._explain, collection, command, key)
+
+    def _explain(self, collection, command, key):
+        """
+        Run explain("executionStats") for a command and record the plan statistics.
+
+        :param collection: MongoDB collection the read ran against
+        :param command: Read command to explain
+        :param key: Tuple of (operation, shape label)
+        """
+        try:
+            explained = collection.database.command({'explain': command, 'verbosity': 'executionStats'})
+            stages = plan_stages(_find_value(explained, 'queryPlanner') or explained)
+            collscan = 'COLLSCAN' in stages
+            with self.lock:
+                plan = self.plans.setdefault(key, {'explains': 0, 'collscans': 0, 'docs_examined': 0,
+                                                   'keys_examined': 0, 'returned': 0, 'indexes': set()})
+                plan['explains'] += 1
+                plan['collscans'] += int(collscan)
+                plan['docs_examined'] += _find_value(explained, 'totalDocsExamined') or 0
+                plan['keys_examined'] += _find_value(explained, 'totalKeysExamined') or 0
+                plan['returned'] += _find_value(explained, 'nReturned') or 0
+                plan['indexes'] |= _index_names(explained)
+            if collscan:
+                logging.warning(f"Collection scan for {key[0]} with shape {key[1]}")
+        except pymongo.errors.PyMongoError as e:
+            logging.warning(f"Failed to explain {key[0]}: {e}")
+        finally:
+            with self.lock:
+                self.explaining.discard(key)
+
+    def snapshot(self):
+        """
+        Report every histogram and sampled plan.
+
+        :return: JSON-ready dictionary keyed by operation, then by query shape
+        """
+        report = {}
+        with self.lock:
+            for (operation, shape), histogram in self.histograms.items():
+                entry = {
+                    'count': histogram.count,
+                    'errors': histogram.errors,
+                    'sum_seconds': round(histogram.sum, 6),
+                    'mean_ms': round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0.0,
+                    'buckets': {str(bound): count for bound, count in histogram.cumulative()},
+                }
+                plan = self.plans.get((operation, shape))
+                if plan is not None:
+                    entry['plan'] = dict(plan, indexes=sorted(plan['indexes']))
+                report.setdefault(operation, {})[shape] = entry
+        return report
+
+    def prometheus(self):
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        :return: Metrics text
+        """
+        def labels(operation, shape, **extra):
+            escaped = shape.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs = [f'operation="{operation}"', f'shape="{escaped}"']
+            pairs += [f'{name}="{value}"' for name, value in extra.items()]
+            return '{' + ','.join(pairs) + '}'
+
+        duration = f'{METRIC_PREFIX}_operation_duration_seconds'
+        errors = f'{METRIC_PREFIX}_operation_errors_total'
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            lines = [f'# HELP {duration} Duration of MongoDB operations by operation and query shape',
+                     f'# TYPE {duration} histogram']
+            for (operation, shape), histogram in histograms:
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{duration}_bucket{labels(operation, shape, le=bound)} {count}')
+                lines.append(f'{duration}_sum{labels(operation, shape)} {histogram.sum}')
+                lines.append(f'{duration}_count{labels(operation, shape)} {histogram.count}')
+
+            lines += [f'# HELP {errors} Failed MongoDB operations', f'# TYPE {errors} counter']
+            for (operation, shape), histogram in histograms:
+                lines.append(f'{errors}{labels(operation, shape)} {histogram.errors}')
+
+            for field, help_text in PLAN_COUNTERS:
+                metric = f'{METRIC_PREFIX}_{field}_total'
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                for (operation, shape), plan in sorted(self.plans.items()):
+                    lines.append(f'{metric}{labels(operation, shape)} {plan[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        """
+        Stop the background explain thread.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+@contextmanager
+def track(metrics, operation, query=None, collection=None, explain=None):
+    """
+    Time the enclosed block as one operation. Does nothing when metrics is None, so instrumentation stays opt-in.
+
+    :param metrics: QueryMetrics or None
+    :param operation: Operation name, e.g. 'read' or 'update'
+    :param query: Query dictionary or pipeline used to derive the query shape
+    :param collection: MongoDB collection, needed when explain is given
+    :param explain: Optional read command to explain if the block is slow
+    """
+    if metrics is None:
+        yield
+        return
+    shape = query_shape(query)
+    failed = False
+    start = time.perf_counter()
+    try:
+        yield
+    except GeneratorExit:
+        # A caller that stops reading a stream early hasn't hit an error
+        raise
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe(operation, shape, seconds, failed)
+        if explain is not None and not failed:
+            metrics.sample_explain(collection, explain, operation, shape, seconds)
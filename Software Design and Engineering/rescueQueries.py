@@ -0,0 +1,238 @@
+"""
+rescueQueries.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.2
+Purpose: This module builds the rescue type queries used by the dashboard filters. It is shared by the app and the
+index advisor, so the advisor checks exactly the queries the dashboard issues. Rescue suitability is stored on every
+outcome as a 'rescue_tags' array computed from its breed when the document is written, so a rescue filter is one
+equality match on the rescue_tags/animal_type index. Mixed breeds such as 'Labrador Retriever/Pit Bull' or
+'Labrador Retriever Mix' are split into their parts first.
+Usage: python rescueQueries.py [--collection AnimalShelter] tags documents written before rescue tags existed, or
+after TAG_BREEDS changed. AnimalShelter runs the same backfill on startup when it finds untagged documents.
+Issues: Writes through raw pymongo requests (BulkOperations.bulk_write) or update pipelines that change a breed are
+not tagged; run the backfill after them, or after TAG_BREEDS changed, since startup only looks for missing tags
+"""
+
+import argparse
+import logging
+import os
+import re
+import threading
+
+import pymongo
+import pymongo.errors
+from bson import ObjectId
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+
+# Field holding the rescue tags of an outcome
+TAG_FIELD = 'rescue_tags'
+# Tag of each rescue type offered by the dashboard
+RESCUE_TYPES = {
+    'Water Rescue': 'water',
+    'Mountain or Wilderness Rescue': 'mountain',
+    'Disaster or Individual Tracking': 'disaster',
+}
+# Breeds suited to each tag, in normalised form (see split_breed)
+TAG_BREEDS = {
+    'water': {'labrador retriever', 'chesapeake bay retriever', 'newfoundland'},
+    'mountain': {'german shepherd', 'alaskan malamute', 'old english sheepdog', 'siberian husky', 'rottweiler'},
+    'disaster': {'doberman pinscher', 'german shepherd', 'golden retriever', 'bloodhound', 'rottweiler'},
+}
+# Values of the animal type filter other than 'all'
+ANIMAL_TYPES = ('Cat', 'Dog')
+# Field holding the age of an outcome in weeks, used by the optional age criteria
+AGE_FIELD = 'age_upon_outcome_in_weeks'
+
+# Suffix marking a breed of unknown mix
+_MIX_SUFFIX = re.compile(r'\s+mix$')
+
+
+def split_breed(breed):
+    """
+    Split a breed into the normalised names of its parts, e.g. 'Labrador Retriever/Pit Bull' into
+    ['labrador retriever', 'pit bull'] and 'Labrador Retriever Mix' into ['labrador retriever'].
+
+    :param breed: Breed as stored in the outcome
+    :return: List of lower-case breed names (empty if the breed is missing)
+    """
+    if not isinstance(breed, str):
+        return []
+    parts = (_MIX_SUFFIX.sub('', ' '.join(part.lower().split())) for part in breed.split('/'))
+    return [part for part in parts if part]
+
+
+def rescue_tags(breed):
+    """
+    Work out the rescue types a breed is suited to. A mixed breed qualifies through any of its parts.
+
+    :param breed: Breed as stored in the outcome
+    :return: Sorted list of tags
+    """
+    parts = set(split_breed(breed))
+    return sorted(tag for tag, breeds in TAG_BREEDS.items() if parts & breeds)
+
+
+def tag_document(document):
+    """
+    Store the rescue tags of a document about to be inserted. Documents without a breed are left alone.
+    The document is changed in place, like insert_one does with the _id, so callers keep their reference.
+
+    :param document: Document dictionary
+    :return: The same document
+    """
+    if 'breed' in document:
+        document[TAG_FIELD] = rescue_tags(document['breed'])
+    return document
+
+
+def tagged_copy(document):
+    """
+    Copy a document a caller asked to insert and tag the copy, so the caller's dictionary (which may go on to be
+    shown as a table row) doesn't gain the rescue tags. The _id is given to both, as insert_one gives it to the
+    document it inserts.
+
+    :param document: Document dictionary
+    :return: Tagged copy to insert
+    """
+    document.setdefault('_id', ObjectId())
+    return tag_document(dict(document))
+
+
+def tag_fields(fields):
+    """
+    Add the rescue tags to a dictionary of fields to $set when the breed is one of them.
+
+    :param fields: Dictionary of field values
+    :return: The fields, copied with TAG_FIELD added if the breed changes
+    """
+    if 'breed' not in fields:
+        return fields
+    return dict(fields, **{TAG_FIELD: rescue_tags(fields['breed'])})
+
+
+def tag_update(update):
+    """
+    Add the rescue tags to an update document that sets the breed. Update pipelines are returned unchanged.
+
+    :param update: Update document such as {'$set': {...}}, or an aggregation pipeline list
+    :return: The update, copied with the tags added to its $set if the breed changes
+    """
+    if isinstance(update, dict) and isinstance(update.get('$set'), dict) and 'breed' in update['$set']:
+        return dict(update, **{'$set': tag_fields(update['$set'])})
+    return update
+
+
+def construct_query(rescue_type, sex=None, min_age_weeks=None, max_age_weeks=None):
+    """
+    Build the query for a rescue type, optionally narrowed to a sex and an age range.
+
+    :param rescue_type: Rescue type selected in the dashboard, or 'All'
+    :param sex: Optional sex_upon_outcome value, e.g. 'Intact Female'
+    :param min_age_weeks: Optional minimum age upon outcome in weeks
+    :param max_age_weeks: Optional maximum age upon outcome in weeks
+    :return: Query dictionary (without the rescue condition for 'All' or an unknown rescue type)
+    """
+    query = {}
+    tag = RESCUE_TYPES.get(rescue_type)
+    if tag is not None:
+        query[TAG_FIELD] = tag
+    if sex is not None:
+        query['sex_upon_outcome'] = sex
+    age = {}
+    if min_age_weeks is not None:
+        age['$gte'] = min_age_weeks
+    if max_age_weeks is not None:
+        age['$lte'] = max_age_weeks
+    if age:
+        query[AGE_FIELD] = age
+    return query
+
+
+def dashboard_queries():
+    """
+    List every query the dashboard radio buttons can produce.
+
+    :return: List of query dictionaries
+    """
+    queries = []
+    for rescue_type in list(RESCUE_TYPES) + ['All']:
+        for animal_type in (None,) + ANIMAL_TYPES:
+            query = construct_query(rescue_type)
+            if animal_type is not None:
+                query['animal_type'] = animal_type
+            queries.append(query)
+    return queries
+
+
+def backfill_rescue_tags(collection):
+    """
+    Set the rescue tags of every document from its breed. The tags only depend on the breed, so there is one
+    UpdateMany per distinct breed, found through the breed index, instead of one write per document.
+
+    :param collection: MongoDB collection object
+    :return: Number of documents whose tags changed
+    """
+    try:
+        requests = [pymongo.UpdateMany({'breed': breed, TAG_FIELD: {'$ne': tags}}, {'$set': {TAG_FIELD: tags}})
+                    for breed in collection.distinct('breed')
+                    for tags in [rescue_tags(breed)]]
+        if not requests:
+            return 0
+        return collection.bulk_write(requests, ordered=False).modified_count
+    except pymongo.errors.PyMongoError as e:
+        logging.error(f"Failed to backfill rescue tags: {e}")
+        raise RuntimeError(f"Failed to backfill rescue tags: {e}")
+
+
+# Namespaces checked for untagged documents by this process, so repeated AnimalShelter construction costs nothing
+_checked = set()
+_checked_lock = threading.Lock()
+
+
+def ensure_tagged(collection):
+    """
+    Backfill the rescue tags once per collection per process if any document has none, e.g. one loaded before rescue
+    tags existed. Rescue filters match on the tags alone, so untagged documents would never be found by them.
+
+    :param collection: MongoDB collection object
+    :return: Number of documents whose tags changed
+    """
+    namespace = collection.full_name
+    with _checked_lock:
+        if namespace in _checked:
+            return 0
+        try:
+            untagged = collection.find_one({TAG_FIELD: {'$exists': False}}, {'_id': 1}) is not None
+        except pymongo.errors.PyMongoError as e:
+            logging.error(f"Failed to check for untagged documents: {e}")
+            raise RuntimeError(f"Failed to check for untagged documents: {e}")
+        tagged = 0
+        if untagged:
+            logging.warning(f"{namespace} has outcomes without rescue tags; backfilling them from their breeds")
+            tagged = backfill_rescue_tags(collection)
+        _checked.add(namespace)
+        return tagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tag outcomes with the rescue types their breed is suited to')
+    parser.add_argument('--collection', default='AnimalShelter', help='Outcomes collection')
+    args = parser.parse_args()
+
+    load_dotenv()
+    connection_string = os.getenv("MONGO_CONNECTION_STRING")
+    db_name = os.getenv("DB_NAME")
+    if not connection_string or not db_name:
+        logging.error("Environment variables for MongoDB connection are not set correctly.")
+        exit(1)
+
+    collection = pymongo.MongoClient(connection_string)[db_name][args.collection]
+    print(f"Updated the rescue tags of {backfill_rescue_tags(collection)} documents")
+
+
+if __name__ == '__main__':
+    main()
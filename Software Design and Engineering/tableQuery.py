@@ -0,0 +1,232 @@
+"""
+tableQuery.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: This module translates the Dash DataTable custom filter, sort and paging properties into MongoDB query
+arguments so that filtering, sorting and paging happen in the database and only one page is sent to the browser.
+Filters on the columns csvLoader stores as numbers and dates become equality and range conditions, matched against
+both the typed value and the string mongoimport leaves, so they keep working whichever loader filled the collection.
+Issues: Only the comparison, "contains" and "datestartswith" filter operators are supported. On a date column,
+"contains" only matches dates when the value is the start of a date such as "2016-01"; otherwise it only matches
+dates stored as strings
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+
+import pymongo
+
+logging.basicConfig(level=logging.INFO)
+
+# Maps the DataTable filter operators (symbol and word forms) to MongoDB operators
+COMPARISON_OPERATORS = {
+    '=': '$eq', 'eq': '$eq',
+    '!=': '$ne', 'ne': '$ne',
+    '<': '$lt', 'lt': '$lt',
+    '<=': '$lte', 'le': '$lte',
+    '>': '$gt', 'gt': '$gt',
+    '>=': '$gte', 'ge': '$gte',
+}
+TEXT_OPERATORS = ('contains', 'datestartswith')
+
+# Columns csvLoader stores as numbers, and as dates with the format they have as strings in the CSV
+NUMERIC_COLUMNS = ('location_lat', 'location_long', 'age_upon_outcome_in_weeks')
+DATE_COLUMNS = {'date_of_birth': '%Y-%m-%d', 'datetime': '%Y-%m-%d %H:%M:%S'}
+
+# A single filter expression such as "{breed} icontains Lab" or "{age_upon_outcome_in_weeks} >= 52"
+FILTER_PART = re.compile(r'^\{(?P<column>[^}]+)\}\s+(?P<operator>\S+)\s*(?P<value>.*)$')
+NUMBER = re.compile(r'^-?\d+(\.\d+)?$')
+# The start of a date: a year, a month or a day
+DATE_PREFIX = re.compile(r'^(?P<year>\d{4})(-(?P<month>\d{1,2})(-(?P<day>\d{1,2}))?)?$')
+
+
+def split_operator(operator):
+    """
+    Split a DataTable operator into the base operator and its case sensitivity.
+    The DataTable prefixes operators with 's' (sensitive) or 'i' (insensitive), e.g. "icontains" or "s=".
+
+    :param operator: Operator token taken from the filter query
+    :return: Tuple of (base operator, case sensitive flag)
+    """
+    if operator in COMPARISON_OPERATORS or operator in TEXT_OPERATORS:
+        return operator, True
+    if operator[:1] in ('s', 'i'):
+        base = operator[1:]
+        if base in COMPARISON_OPERATORS or base in TEXT_OPERATORS:
+            return base, operator[0] == 's'
+    return None, True
+
+
+def parse_value(value):
+    """
+    Strip the quoting the DataTable adds around string values and convert numbers.
+
+    :param value: Raw value text taken from the filter query
+    :return: Value as a string, int or float
+    """
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'", '`'):
+        return value[1:-1]
+    if NUMBER.match(value):
+        return float(value) if '.' in value else int(value)
+    return value
+
+
+def date_span(value):
+    """
+    Find the dates a filter value stands for: a year, month or day such as "2016", "2016-01" or "2016-01-31",
+    or a single second such as "2016-01-31 12:00:00".
+
+    :param value: Value taken from the filter query
+    :return: Tuple of (first datetime included, first datetime excluded), or None when the value isn't a date
+    """
+    text = str(value).strip()
+    match = DATE_PREFIX.match(text)
+    try:
+        if not match:
+            start = datetime.fromisoformat(text)
+            return start, start + timedelta(seconds=1)
+        year, month, day = int(match['year']), int(match['month'] or 1), int(match['day'] or 1)
+        start = datetime(year, month, day)
+    except ValueError:
+        return None
+    if match['day']:
+        return start, start + timedelta(days=1)
+    if match['month']:
+        return start, datetime(year + month // 12, month % 12 + 1, 1)
+    return start, datetime(year + 1, 1, 1)
+
+
+def date_condition(column, operator, span, string_format):
+    """
+    Build the condition a date filter stands for, as one range on dates and the same range on dates stored as
+    strings. MongoDB only compares values of the same type, so both are needed; each can use an index on the column.
+
+    :param column: Date column
+    :param operator: MongoDB comparison operator, or '$eq' for the text operators
+    :param span: Tuple of (start, end) from date_span
+    :param string_format: Format of the column's dates stored as strings
+    :return: Query dictionary
+    """
+    start, end = span
+    if operator == '$lt':
+        bounds = {'$lt': start}
+    elif operator == '$lte':
+        bounds = {'$lt': end}
+    elif operator == '$gt':
+        bounds = {'$gte': end}
+    elif operator == '$gte':
+        bounds = {'$gte': start}
+    else:
+        bounds = {'$gte': start, '$lt': end}
+    as_strings = {bound: value.strftime(string_format) for bound, value in bounds.items()}
+    branches = [{column: bounds}, {column: as_strings}]
+    return {'$nor': branches} if operator == '$ne' else {'$or': branches}
+
+
+def parse_filter_query(filter_query, allowed_columns=None):
+    """
+    Convert a DataTable filter_query string into a MongoDB query dictionary.
+    Expressions are joined with "&&" by the DataTable, which maps to an implicit AND in MongoDB.
+
+    :param filter_query: DataTable filter_query property (may be None or empty)
+    :param allowed_columns: Optional collection of column ids that may be filtered on
+    :return: Dictionary representing the query criteria
+    """
+    query = {}
+    # Conditions on typed columns that need their own $or, combined with the rest at the end
+    typed = []
+    if not filter_query:
+        return query
+
+    for part in filter_query.split(' && '):
+        match = FILTER_PART.match(part.strip())
+        if not match:
+            logging.warning(f"Ignoring unsupported filter expression: {part}")
+            continue
+
+        column = match.group('column')
+        operator, case_sensitive = split_operator(match.group('operator'))
+        value = parse_value(match.group('value'))
+
+        # Never let a column name smuggle in an operator such as $where
+        if column.startswith('$') or (allowed_columns is not None and column not in allowed_columns):
+            logging.warning(f"Ignoring filter on unknown column: {column}")
+            continue
+        if operator is None:
+            logging.warning(f"Ignoring unsupported filter operator: {match.group('operator')}")
+            continue
+
+        mongo_operator = COMPARISON_OPERATORS.get(operator, '$eq')
+        span = date_span(value) if column in DATE_COLUMNS else None
+        if span is not None:
+            typed.append(date_condition(column, mongo_operator, span, DATE_COLUMNS[column]))
+            continue
+        if column in NUMERIC_COLUMNS and NUMBER.match(str(value)):
+            # A number typed into a numeric column; "contains" and quoted values would otherwise never match
+            query.setdefault(column, {})[mongo_operator] = parse_value(str(value))
+            continue
+
+        if operator in COMPARISON_OPERATORS:
+            condition = {mongo_operator: value}
+            if not case_sensitive and isinstance(value, str):
+                condition = {'$regex': f'^{re.escape(value)}$', '$options': 'i'}
+        elif operator == 'contains':
+            condition = {'$regex': re.escape(str(value))}
+            if not case_sensitive:
+                condition['$options'] = 'i'
+        else:
+            # Anchored regex so an index on the column can still be used for the prefix match
+            condition = {'$regex': f'^{re.escape(str(value))}'}
+
+        query.setdefault(column, {}).update(condition)
+
+    return combine_queries(query, *typed)
+
+
+def parse_sort_by(sort_by):
+    """
+    Convert the DataTable sort_by property into a MongoDB sort specification.
+
+    :param sort_by: List of dictionaries with 'column_id' and 'direction' keys
+    :return: List of (field, direction) tuples, or None when no sort is requested
+    """
+    if not sort_by:
+        return None
+    return [
+        (col['column_id'], pymongo.ASCENDING if col['direction'] == 'asc' else pymongo.DESCENDING)
+        for col in sort_by
+        if not col['column_id'].startswith('$')
+    ] or None
+
+
+def page_bounds(page_current, page_size):
+    """
+    Convert the DataTable page number and size into skip and limit values.
+
+    :param page_current: Zero-based page number
+    :param page_size: Number of rows per page
+    :return: Tuple of (skip, limit)
+    """
+    page_current = max(page_current or 0, 0)
+    page_size = max(page_size or 1, 1)
+    return page_current * page_size, page_size
+
+
+def combine_queries(*queries):
+    """
+    Combine several query dictionaries into one, using $and only when two queries filter the same field.
+
+    :param queries: Query dictionaries to combine
+    :return: Dictionary representing the combined query criteria
+    """
+    queries = [query for query in queries if query]
+    combined = {}
+    for query in queries:
+        if any(field in combined for field in query):
+            return {'$and': queries}
+        combined.update(query)
+    return combined
@@ -0,0 +1,30 @@
+"""
+conftest.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Shared pytest setup. The application modules live one directory up and use flat imports.
+Usage: python -m pytest -q from the Software Design and Engineering directory
+Issues: Tests that need a database use mongomock and are skipped when it isn't installed
+"""
+
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture
+def mongo_client():
+    """
+    In-process mongomock client, patched the way the benchmarks' --mongomock mode is so bulk writes work.
+    """
+    mongomock = pytest.importorskip('mongomock')
+    from benchmarks.common import accept_unset_sort
+    accept_unset_sort()
+    return mongomock.MongoClient()
@@ -0,0 +1,42 @@
+"""
+test_columnarRead.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Tests for the DataFrame fallback of the columnar reads: the fields an inclusion projection allocates and the
+per-field collection of document batches.
+Issues: The pymongoarrow path needs a real MongoDB server and isn't tested here
+"""
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from columnarRead import projected_fields, read_frame
+
+
+@pytest.mark.parametrize('projection, expected', [
+    ({'breed': 1, 'animal_type': 1}, ['_id', 'breed', 'animal_type']),
+    ({'_id': 0, 'breed': 1}, ['breed']),
+    ({'_id': 0, 'location': 0}, None),
+    ({'location.type': 1}, None),
+    (None, None),
+])
+def test_projected_fields(projection, expected):
+    assert projected_fields(projection) == expected
+
+
+def test_read_frame_collects_fields_in_order_of_first_appearance():
+    batches = [[{'name': 'Max', 'age_upon_outcome_in_weeks': 10}], [{'breed': 'Beagle', 'name': 'Rex'}], []]
+    frame = read_frame(batches)
+    assert list(frame.columns) == ['name', 'age_upon_outcome_in_weeks', 'breed']
+    assert frame['name'].tolist() == ['Max', 'Rex']
+    assert frame['breed'].dtype == 'category' and frame['breed'].isna().tolist() == [True, False]
+    assert frame['age_upon_outcome_in_weeks'].dtype == 'float64'
+
+
+def test_read_frame_allocates_projected_fields():
+    frame = read_frame([[{'breed': 'Beagle'}]], fields=['breed', 'animal_type'])
+    assert list(frame.columns) == ['breed', 'animal_type']
+    assert read_frame([]).empty
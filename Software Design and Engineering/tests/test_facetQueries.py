@@ -0,0 +1,111 @@
+"""
+test_facetQueries.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Tests for the faceted search: the $facet pipeline, the disjunctive counts of each facet, and agreement
+between the MongoDB pipeline and the columnar backend.
+Issues: None known
+"""
+
+import pytest
+
+from columnarShelter import ColumnarAnimalShelter
+from facetQueries import FACETS, facet_counts, facet_pipeline, facet_results, selection_filters
+from rescueQueries import tag_document
+
+
+def make_documents():
+    breeds = ['Labrador Retriever', 'German Shepherd', 'Beagle', 'Domestic Shorthair', 'Rottweiler Mix']
+    documents = []
+    for number in range(60):
+        breed = breeds[number % len(breeds)]
+        documents.append(tag_document({
+            '_id': number,
+            'animal_id': f'A{number:04d}',
+            'animal_type': 'Cat' if breed == 'Domestic Shorthair' else 'Dog',
+            'breed': breed,
+            'outcome_type': ['Adoption', 'Transfer', 'Return to Owner'][number % 3],
+            'sex_upon_outcome': ['Neutered Male', 'Spayed Female'][number % 2],
+        }))
+    return documents
+
+
+def test_selection_filters():
+    filters = selection_filters({'animal_type': 'Dog', 'rescue_type': 'Water Rescue', 'outcome_type': 'All'})
+    assert filters == {'animal_type': {'animal_type': 'Dog'}, 'rescue_type': {'rescue_tags': 'water'},
+                       'outcome_type': {}, 'sex_upon_outcome': {}}
+
+
+def test_selection_filters_reject_unknown_facets():
+    with pytest.raises(ValueError):
+        selection_filters({'colour': 'Black'})
+
+
+def test_each_facet_is_counted_without_its_own_selection():
+    pipeline = facet_pipeline({'breed': {'$exists': True}}, {'animal_type': 'Dog', 'rescue_type': 'Water Rescue'},
+                              sort=[('animal_id', 1)], skip=10, limit=5, projection={'_id': 0})
+    assert pipeline[0] == {'$match': {'breed': {'$exists': True}}}
+    facets = pipeline[1]['$facet']
+    assert facets['documents'] == [
+        {'$match': {'animal_type': 'Dog', 'rescue_tags': 'water'}},
+        {'$sort': {'animal_id': 1}}, {'$skip': 10}, {'$limit': 5}, {'$project': {'_id': 0}},
+    ]
+    assert facets['animal_type'][0] == {'$match': {'rescue_tags': 'water'}}
+    assert facets['rescue_type'][0] == {'$match': {'animal_type': 'Dog'}}
+    assert facets['outcome_type'][0] == {'$match': {'animal_type': 'Dog', 'rescue_tags': 'water'}}
+
+
+def test_counts_only_pipeline_has_no_documents():
+    facets = facet_pipeline({}, limit=0)[1]['$facet']
+    assert 'documents' not in facets
+    assert set(facets) == {'total', *FACETS}
+
+
+def test_facet_counts_orders_by_count():
+    counts = facet_counts('outcome_type', [('Transfer', 2), (None, 1), ('Adoption', 5), ('Transfer', 1)])
+    assert counts == {'all': 9, 'values': {'Adoption': 5, 'Transfer': 3, None: 1}}
+    assert list(counts['values']) == ['Adoption', 'Transfer', None]
+
+
+def test_rescue_counts_split_tag_combinations():
+    counts = facet_counts('rescue_type', [(['disaster', 'mountain'], 4), (['water'], 3), ([], 5), (None, 1)])
+    assert counts == {'all': 13, 'values': {'Water Rescue': 3, 'Mountain or Wilderness Rescue': 4,
+                                            'Disaster or Individual Tracking': 4}}
+
+
+def test_facet_results_of_an_empty_match():
+    results = facet_results({'total': [], 'animal_type': []})
+    assert results['documents'] == [] and results['total'] == 0
+    assert results['facets']['animal_type'] == {'all': 0, 'values': {}}
+
+
+def test_columnar_counts_match_a_manual_count():
+    documents = make_documents()
+    shelter = ColumnarAnimalShelter([dict(document) for document in documents])
+    result = shelter.faceted_search({}, {'animal_type': 'Dog', 'rescue_type': 'Mountain or Wilderness Rescue'},
+                                    limit=0)
+    mountain = [document for document in documents if 'mountain' in document['rescue_tags']]
+    dogs = [document for document in documents if document['animal_type'] == 'Dog']
+    assert result['total'] == len(mountain)
+    assert result['facets']['animal_type']['values'] == {'Dog': len(mountain)}
+    assert result['facets']['rescue_type']['all'] == len(dogs)
+    assert result['facets']['rescue_type']['values']['Water Rescue'] == sum(
+        'water' in document['rescue_tags'] for document in dogs)
+
+
+def test_mongo_pipeline_matches_columnar():
+    mongomock = pytest.importorskip('mongomock')
+    documents = make_documents()
+    collection = mongomock.MongoClient().db.outcomes
+    collection.insert_many([dict(document) for document in documents])
+    shelter = ColumnarAnimalShelter([dict(document) for document in documents])
+    selected = {'animal_type': 'Dog', 'sex_upon_outcome': 'Spayed Female'}
+    pipeline = facet_pipeline({}, selected, sort=[('_id', 1)], limit=5)
+    results = facet_results(next(collection.aggregate(pipeline)))
+    expected = shelter.faceted_search({}, selected, sort=[('_id', 1)], limit=5)
+    assert results['total'] == expected['total']
+    assert results['facets'] == expected['facets']
+    assert [document['_id'] for document in results['documents']] == [
+        document['_id'] for document in expected['documents']]
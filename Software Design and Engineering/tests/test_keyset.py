@@ -0,0 +1,83 @@
+"""
+test_keyset.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Tests for keyset pagination: every document is returned exactly once whatever the sort direction, including
+documents whose sort key is missing or null.
+Issues: None known
+"""
+
+import pytest
+from bson import ObjectId
+
+from columnarShelter import ColumnarAnimalShelter
+from crudOperations import _keyset_query, keyset_page
+
+
+def make_documents(count=100, missing_every=7):
+    documents = []
+    for number in range(count):
+        document = {'_id': ObjectId(), 'animal_id': f'A{number:04d}', 'breed': 'Beagle'}
+        if number % missing_every:
+            document['name'] = f'name {number % 13}'
+        elif number % 2:
+            document['name'] = None
+        documents.append(document)
+    return documents
+
+
+def read_all(shelter, sort, limit=9):
+    seen, token = [], None
+    while True:
+        page, token = shelter.read_page({}, after=token, limit=limit, sort=sort)
+        seen.extend(document['_id'] for document in page)
+        if token is None:
+            return seen
+
+
+@pytest.mark.parametrize('direction', [1, -1])
+def test_columnar_pages_cover_missing_sort_keys(direction):
+    documents = make_documents()
+    shelter = ColumnarAnimalShelter(documents)
+    seen = read_all(shelter, [('name', direction)])
+    assert sorted(seen) == sorted(document['_id'] for document in documents)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.parametrize('direction', [1, -1])
+def test_mongo_pages_cover_missing_sort_keys(direction):
+    mongomock = pytest.importorskip('mongomock')
+    collection = mongomock.MongoClient().db.outcomes
+    documents = make_documents(300)
+    collection.insert_many(documents)
+
+    def execute(query, projection, sort=None, limit=0):
+        return list(collection.find(query, projection, sort=sort, limit=limit))
+
+    seen, token = [], None
+    while True:
+        page, token = keyset_page(execute, {}, after=token, limit=25, sort=[('name', direction)])
+        seen.extend(document['_id'] for document in page)
+        if token is None:
+            break
+    assert sorted(seen) == sorted(document['_id'] for document in documents)
+    assert len(seen) == len(set(seen))
+
+
+def test_descending_position_keeps_nulls_after_it():
+    query = _keyset_query([('name', -1), ('_id', -1)], ['Rex', 5])
+    assert query == {'$and': [
+        {'$or': [{'$or': [{'name': {'$lt': 'Rex'}}, {'name': None}]}, {'name': 'Rex', '_id': {'$lt': 5}}]},
+        {'$or': [{'name': {'$lte': 'Rex'}}, {'name': None}]},
+    ]}
+
+
+def test_descending_null_position_only_continues_among_nulls():
+    query = _keyset_query([('name', -1), ('_id', -1)], [None, 5])
+    assert query == {'$or': [{'name': None, '_id': {'$lt': 5}}]}
+
+
+def test_last_position_matches_nothing():
+    assert _keyset_query([('name', -1), ('_id', -1)], [None, None]) == {'_id': {'$in': []}}
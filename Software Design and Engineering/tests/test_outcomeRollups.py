@@ -0,0 +1,128 @@
+"""
+test_outcomeRollups.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: Tests for the outcome rollups: row keys, the per-row $inc deltas of incremental updates, the deltas of
+bulk writes, and the translation of outcome queries into rollup queries.
+Issues: Rebuilds use $merge, which mongomock doesn't support, so they aren't tested here
+"""
+
+from datetime import datetime
+
+import pymongo
+import pymongo.errors
+import pytest
+
+from crudOperations import BulkOperations
+from outcomeRollups import month_of, rollup_key, rollup_match, rollup_requests, update_fields, OutcomeRollups
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2017-04-11T09:00:00', '2017-04'), (datetime(2016, 12, 31), '2016-12'), (None, None), (201704, None),
+])
+def test_month_of(value, expected):
+    assert month_of(value) == expected
+
+
+def test_rollup_key_keeps_missing_dimensions_as_null():
+    assert rollup_key({'monthyear': '2016-01-05T00:00:00', 'animal_type': 'Dog'}) == {
+        'month': '2016-01', 'animal_type': 'Dog', 'outcome_type': None, 'breed': None}
+
+
+def test_rollup_requests_sum_changes_per_row():
+    dog = {'monthyear': '2016-01-05', 'animal_type': 'Dog', 'outcome_type': 'Adoption', 'breed': 'Beagle'}
+    added = [dict(dog, age_upon_outcome_in_weeks=10), dict(dog, age_upon_outcome_in_weeks='?')]
+    removed = [dict(dog, outcome_type='Transfer', age_upon_outcome_in_weeks=4)]
+    requests = rollup_requests(added=added, removed=removed)
+    deltas = {request._filter['_id']['outcome_type']: request._doc['$inc'] for request in requests}
+    assert deltas == {
+        'Adoption': {'count': 2, 'age_weeks_sum': 10, 'age_weeks_count': 1},
+        'Transfer': {'count': -1, 'age_weeks_sum': -4, 'age_weeks_count': -1},
+    }
+    assert all(request._upsert for request in requests)
+
+
+def test_rollup_requests_skip_rows_that_cancel_out():
+    document = {'animal_type': 'Cat', 'age_upon_outcome_in_weeks': 3}
+    assert rollup_requests(added=[document], removed=[document]) == []
+
+
+def test_rollup_match_translates_dimensions():
+    query = {'animal_type': 'Dog', '$or': [{'breed': 'Beagle'}, {'month': {'$gte': '2016-01'}}]}
+    assert rollup_match(query) == {'_id.animal_type': 'Dog',
+                                   '$or': [{'_id.breed': 'Beagle'}, {'_id.month': {'$gte': '2016-01'}}]}
+    assert rollup_match(None) == {}
+
+
+def test_rollup_match_rejects_fields_the_rollups_dont_keep():
+    with pytest.raises(ValueError):
+        rollup_match({'name': 'Max'})
+
+
+def test_touches():
+    assert OutcomeRollups.touches(['breed', 'name'])
+    assert not OutcomeRollups.touches(['name', 'color'])
+
+
+def test_apply_and_read(mongo_client):
+    rollups = OutcomeRollups(mongo_client.db.outcomes)
+    dog = {'monthyear': '2016-01-05', 'animal_type': 'Dog', 'outcome_type': 'Adoption', 'breed': 'Beagle',
+           'age_upon_outcome_in_weeks': 10}
+    rollups.apply(added=[dog, dict(dog, age_upon_outcome_in_weeks=20), dict(dog, animal_type='Cat')])
+    rollups.apply(removed=[dict(dog, animal_type='Cat')])
+    assert rollups.read(group_by=('animal_type',)) == [{'animal_type': 'Dog', 'count': 2, 'avg_age_weeks': 15}]
+
+
+def test_update_fields():
+    assert update_fields({'$set': {'breed': 'Beagle'}, '$rename': {'color': 'outcome_type'}}) == [
+        'breed', 'color', 'outcome_type']
+    assert update_fields([{'$set': {'name': 'Max'}}]) is None
+
+
+def _outcome(name, **fields):
+    return dict({'name': name, 'monthyear': '2016-01-05', 'animal_type': 'Dog', 'outcome_type': 'Adoption',
+                 'breed': 'Beagle', 'age_upon_outcome_in_weeks': 10}, **fields)
+
+
+def _tracked_bulk(mongo_client):
+    collection = mongo_client.db.outcomes
+    collection.insert_many([_outcome('A'), _outcome('B', animal_type='Cat'), _outcome('C', breed='Poodle')])
+    rollups = OutcomeRollups(collection)
+    rollups.apply(added=collection.find())
+    return collection, rollups, BulkOperations(collection, rollups=rollups, chunk_size=2)
+
+
+def _recomputed(collection):
+    expected = OutcomeRollups(collection, summary_name='expected')
+    expected.apply(added=collection.find())
+    return expected.read()
+
+
+def test_bulk_writes_move_rollups_incrementally(mongo_client):
+    collection, rollups, bulk = _tracked_bulk(mongo_client)
+    bulk.bulk_update([{'filter': {'name': 'A'}, 'update': {'outcome_type': 'Transfer'}},
+                      {'filter': {'animal_type': 'Cat'}, 'update': {'$inc': {'age_upon_outcome_in_weeks': 5}},
+                       'many': True},
+                      {'filter': {'name': 'D'}, 'update': _outcome('D', breed='Boxer'), 'upsert': True}])
+    bulk.bulk_delete([{'name': 'C'}])
+    bulk.bulk_write([pymongo.InsertOne(_outcome('E')), pymongo.UpdateOne({'name': 'E'}, {'$set': {'breed': 'Pug'}})])
+    assert rollups.read() == _recomputed(collection)
+
+
+def test_bulk_insert_counts_only_written_documents(mongo_client):
+    collection, rollups, bulk = _tracked_bulk(mongo_client)
+    existing = collection.find_one({'name': 'A'})
+    with pytest.raises(pymongo.errors.BulkWriteError):
+        bulk.bulk_insert([_outcome('F'), {'_id': existing['_id']}, _outcome('G')])
+    assert rollups.read() == _recomputed(collection)
+
+
+def test_bulk_updates_of_other_fields_skip_rollups(mongo_client, monkeypatch):
+    collection, rollups, bulk = _tracked_bulk(mongo_client)
+    calls = []
+    monkeypatch.setattr(rollups, 'apply', lambda *args, **kwargs: calls.append(args))
+    monkeypatch.setattr(collection, 'find_one', lambda *args, **kwargs: calls.append(args))
+    bulk.bulk_update([{'filter': {'name': 'A'}, 'update': {'color': 'Black'}}])
+    assert calls == []
@@ -0,0 +1,37 @@
+"""
+test_queryCache.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Tests for the SQLite query cache: results are shared through the file, invalidations drop them, and a
+result that can't be stored is skipped instead of failing the read.
+Issues: None known
+"""
+
+import pytest
+
+from queryCache import SqliteQueryCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SqliteQueryCache(str(tmp_path / 'cache.sqlite'))
+
+
+def test_put_and_get(cache):
+    cache.put('key', [{'name': 'Max'}], cache.generation)
+    assert cache.get('key') == (True, [{'name': 'Max'}])
+
+
+def test_stale_generation_is_not_stored(cache):
+    generation = cache.generation
+    cache.invalidate()
+    cache.put('key', [1], generation)
+    assert cache.get('key') == (False, None)
+
+
+@pytest.mark.parametrize('value', [[{'count': 2 ** 70}], [{'value': object()}], [{1: 'non-string key'}]])
+def test_results_bson_cant_encode_are_skipped(cache, value):
+    cache.put('key', value, cache.generation)
+    assert cache.get('key') == (False, None)
@@ -0,0 +1,87 @@
+"""
+test_rescueQueries.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: Tests for the rescue tags: how breeds are split and tagged, how writes carry the tags, the startup backfill,
+and the queries the rescue type filters issue.
+Issues: None known
+"""
+
+import pytest
+
+import rescueQueries
+from rescueQueries import (construct_query, ensure_tagged, rescue_tags, split_breed, tag_document, tag_fields,
+                           tag_update, tagged_copy, TAG_FIELD)
+
+
+@pytest.mark.parametrize('breed, expected', [
+    ('Labrador Retriever/Pit Bull', ['labrador retriever', 'pit bull']),
+    ('  German   Shepherd Mix', ['german shepherd']),
+    ('Beagle/', ['beagle']),
+    (None, []),
+])
+def test_split_breed(breed, expected):
+    assert split_breed(breed) == expected
+
+
+@pytest.mark.parametrize('breed, expected', [
+    ('Labrador Retriever Mix', ['water']),
+    ('German Shepherd', ['disaster', 'mountain']),
+    ('Beagle/Rottweiler', ['disaster', 'mountain']),
+    ('Newfoundland/Bloodhound', ['disaster', 'water']),
+    ('Domestic Shorthair Mix', []),
+    (None, []),
+])
+def test_rescue_tags(breed, expected):
+    assert rescue_tags(breed) == expected
+
+
+def test_tag_document_changes_the_document_in_place():
+    document = {'breed': 'Newfoundland'}
+    assert tag_document(document) is document
+    assert document['rescue_tags'] == ['water']
+    assert tag_document({'name': 'Max'}) == {'name': 'Max'}
+
+
+def test_tagged_copy_leaves_the_caller_untagged():
+    data = {'breed': 'Rottweiler'}
+    document = tagged_copy(data)
+    assert document is not data
+    assert document['rescue_tags'] == ['disaster', 'mountain']
+    assert 'rescue_tags' not in data
+    # The _id is shared so the caller can find the document it created
+    assert data['_id'] == document['_id']
+
+
+def test_tag_fields_only_when_the_breed_changes():
+    fields = {'name': 'Max'}
+    assert tag_fields(fields) is fields
+    assert tag_fields({'breed': 'Bloodhound'}) == {'breed': 'Bloodhound', 'rescue_tags': ['disaster']}
+
+
+def test_tag_update():
+    assert tag_update({'$set': {'breed': 'Newfoundland'}, '$inc': {'visits': 1}}) == {
+        '$set': {'breed': 'Newfoundland', 'rescue_tags': ['water']}, '$inc': {'visits': 1}}
+    pipeline = [{'$set': {'breed': 'Newfoundland'}}]
+    assert tag_update(pipeline) is pipeline
+
+
+def test_construct_query():
+    assert construct_query('Water Rescue') == {'rescue_tags': 'water'}
+    assert construct_query('All') == {}
+    assert construct_query('Mountain or Wilderness Rescue', sex='Intact Male', min_age_weeks=26,
+                           max_age_weeks=156) == {'rescue_tags': 'mountain', 'sex_upon_outcome': 'Intact Male',
+                                                  'age_upon_outcome_in_weeks': {'$gte': 26, '$lte': 156}}
+
+
+def test_ensure_tagged_backfills_once_per_collection(mongo_client, monkeypatch):
+    monkeypatch.setattr(rescueQueries, '_checked', set())
+    collection = mongo_client.db.outcomes
+    collection.insert_many([{'breed': 'German Shepherd'}, tag_document({'breed': 'Beagle'})])
+    assert ensure_tagged(collection) == 1
+    assert collection.find_one({'breed': 'German Shepherd'})[TAG_FIELD] == ['disaster', 'mountain']
+    collection.insert_one({'breed': 'Beagle'})
+    assert ensure_tagged(collection) == 0
+    assert collection.count_documents({TAG_FIELD: {'$exists': False}}) == 1
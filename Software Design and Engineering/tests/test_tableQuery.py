@@ -0,0 +1,142 @@
+"""
+test_tableQuery.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: Tests for the translation of DataTable filter, sort and paging properties into MongoDB query arguments,
+including the range conditions built for the date and numeric columns.
+Issues: None known
+"""
+
+from datetime import datetime
+
+import pytest
+
+from tableQuery import (combine_queries, date_span, page_bounds, parse_filter_query, parse_sort_by,
+                        parse_value, split_operator)
+
+
+@pytest.mark.parametrize('operator, expected', [
+    ('=', ('=', True)), ('icontains', ('contains', False)), ('s<=', ('<=', True)), ('regex', (None, True)),
+])
+def test_split_operator(operator, expected):
+    assert split_operator(operator) == expected
+
+
+@pytest.mark.parametrize('value, expected', [('"Lab"', 'Lab'), ('52', 52), ('-1.5', -1.5), ('Lab', 'Lab')])
+def test_parse_value(value, expected):
+    assert parse_value(value) == expected
+
+
+def test_text_filters():
+    query = parse_filter_query('{breed} icontains lab && {name} s= Max && {color} datestartswith Bl')
+    assert query == {
+        'breed': {'$regex': 'lab', '$options': 'i'},
+        'name': {'$eq': 'Max'},
+        'color': {'$regex': '^Bl'},
+    }
+
+
+def test_case_insensitive_equality_is_anchored():
+    assert parse_filter_query('{name} i= max') == {'name': {'$regex': '^max$', '$options': 'i'}}
+
+
+def test_unknown_columns_and_operators_are_ignored():
+    query = parse_filter_query('{$where} = 1 && {secret} = 2 && {breed} ~ Lab && {name} = Max',
+                               allowed_columns=['breed', 'name'])
+    assert query == {'name': {'$eq': 'Max'}}
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2016', (datetime(2016, 1, 1), datetime(2017, 1, 1))),
+    ('2016-12', (datetime(2016, 12, 1), datetime(2017, 1, 1))),
+    ('2016-02-29', (datetime(2016, 2, 29), datetime(2016, 3, 1))),
+    ('2016-02-29 10:30:00', (datetime(2016, 2, 29, 10, 30), datetime(2016, 2, 29, 10, 30, 1))),
+    ('2016-02-30', None),
+    ('Lab', None),
+])
+def test_date_span(value, expected):
+    assert date_span(value) == expected
+
+
+def test_date_prefix_matches_dates_and_strings():
+    assert parse_filter_query('{datetime} datestartswith 2016-01') == {'$or': [
+        {'datetime': {'$gte': datetime(2016, 1, 1), '$lt': datetime(2016, 2, 1)}},
+        {'datetime': {'$gte': '2016-01-01 00:00:00', '$lt': '2016-02-01 00:00:00'}},
+    ]}
+
+
+@pytest.mark.parametrize('operator, dates', [
+    ('<', {'$lt': datetime(2015, 1, 1)}),
+    ('<=', {'$lt': datetime(2016, 1, 1)}),
+    ('>', {'$gte': datetime(2016, 1, 1)}),
+    ('>=', {'$gte': datetime(2015, 1, 1)}),
+])
+def test_date_comparisons_cover_the_whole_period(operator, dates):
+    query = parse_filter_query(f'{{date_of_birth}} {operator} 2015')
+    assert query['$or'][0] == {'date_of_birth': dates}
+    # date_of_birth is stored as '%Y-%m-%d' when it is a string
+    assert all(len(bound) == 10 for bound in query['$or'][1]['date_of_birth'].values())
+
+
+def test_date_inequality_excludes_both_forms():
+    assert parse_filter_query('{datetime} != 2016-01-31') == {'$nor': [
+        {'datetime': {'$gte': datetime(2016, 1, 31), '$lt': datetime(2016, 2, 1)}},
+        {'datetime': {'$gte': '2016-01-31 00:00:00', '$lt': '2016-02-01 00:00:00'}},
+    ]}
+
+
+def test_two_date_filters_are_combined_with_and():
+    query = parse_filter_query('{datetime} >= 2016 && {date_of_birth} < 2014 && {breed} contains Lab')
+    assert set(query) == {'$and'}
+    assert {'breed': {'$regex': 'Lab'}} in query['$and']
+    assert len(query['$and']) == 3
+
+
+def test_date_text_that_is_not_a_date_keeps_the_regex():
+    assert parse_filter_query('{datetime} contains 01-31') == {'datetime': {'$regex': '01\\-31'}}
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{age_upon_outcome_in_weeks} contains 52', {'$eq': 52}),
+    ('{age_upon_outcome_in_weeks} >= "52.5"', {'$gte': 52.5}),
+    ('{location_lat} < 30', {'$lt': 30}),
+])
+def test_numeric_columns_compare_numbers(filter_query, expected):
+    assert parse_filter_query(filter_query) == {filter_query[1:filter_query.index('}')]: expected}
+
+
+def test_filters_match_typed_documents():
+    mongomock = pytest.importorskip('mongomock')
+    collection = mongomock.MongoClient().db.outcomes
+    collection.insert_many([
+        {'_id': 1, 'datetime': datetime(2016, 1, 31, 12), 'age_upon_outcome_in_weeks': 52.0},
+        {'_id': 2, 'datetime': '2016-01-15 10:00:00', 'age_upon_outcome_in_weeks': 10.0},
+        {'_id': 3, 'datetime': datetime(2017, 3, 1), 'age_upon_outcome_in_weeks': 100.0},
+    ])
+
+    def ids(filter_query):
+        return sorted(document['_id'] for document in collection.find(parse_filter_query(filter_query)))
+
+    assert ids('{datetime} datestartswith 2016-01') == [1, 2]
+    assert ids('{datetime} > 2016-01-20') == [1, 3]
+    assert ids('{datetime} != 2016-01') == [3]
+    assert ids('{age_upon_outcome_in_weeks} contains 52') == [1]
+
+
+def test_parse_sort_by():
+    assert parse_sort_by([{'column_id': 'name', 'direction': 'asc'}, {'column_id': 'breed', 'direction': 'desc'},
+                          {'column_id': '$where', 'direction': 'asc'}]) == [('name', 1), ('breed', -1)]
+    assert parse_sort_by([]) is None
+
+
+def test_page_bounds():
+    assert page_bounds(3, 25) == (75, 25)
+    assert page_bounds(None, 0) == (0, 1)
+
+
+def test_combine_queries():
+    assert combine_queries({'a': 1}, {}, {'b': 2}) == {'a': 1, 'b': 2}
+    assert combine_queries({'a': 1}, {'a': 2}) == {'$and': [{'a': 1}, {'a': 2}]}
+    assert combine_queries() == {}
@@ -0,0 +1,71 @@
+"""
+test_writeBuffer.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.1
+Purpose: Tests for the write-behind buffer: queued writes to the same document are applied in the order they were
+made, every Future settles with its own result, and a failed batch doesn't stop later flushes.
+Issues: None known
+"""
+
+import pytest
+
+from writeBuffer import WriteBuffer
+
+
+def test_writes_with_the_same_filter_keep_their_order(mongo_client):
+    collection = mongo_client.db.outcomes
+    collection.insert_many([{'animal_id': 'A1', 'name': 'first'}, {'animal_id': 'A2', 'name': 'first'}])
+    buffer = WriteBuffer(collection, max_delay_ms=60_000)
+    runs = []
+    bulk_write = buffer.collection.bulk_write
+
+    def record(requests, ordered):
+        runs.append(len(requests))
+        return bulk_write(requests, ordered=ordered)
+
+    buffer.collection.bulk_write = record
+    futures = [buffer.update({'animal_id': 'A1'}, {'name': str(number)}) for number in range(3)]
+    futures.append(buffer.update({'animal_id': 'A2'}, {'name': 'other'}))
+    futures.append(buffer.delete({'animal_id': 'A1'}))
+    buffer.close()
+
+    assert [future.result() for future in futures] == [True] * 5
+    # A repeated filter starts a new run; a different filter or kind shares or starts one as usual
+    assert runs == [1, 1, 2, 1]
+    assert collection.find_one({'animal_id': 'A1'}) is None
+    assert collection.find_one({'animal_id': 'A2'})['name'] == 'other'
+
+
+def test_creates_tag_a_copy(mongo_client):
+    buffer = WriteBuffer(mongo_client.db.outcomes)
+    data = {'animal_id': 'A1', 'breed': 'Newfoundland'}
+    assert buffer.create(data).result() is True
+    buffer.close()
+    assert 'rescue_tags' not in data
+    assert mongo_client.db.outcomes.find_one({'_id': data['_id']})['rescue_tags'] == ['water']
+
+
+def test_filters_that_cant_be_encoded_fail_the_caller(mongo_client):
+    buffer = WriteBuffer(mongo_client.db.outcomes)
+    with pytest.raises(ValueError):
+        buffer.delete({'animal_id': object()})
+    buffer.close()
+
+
+def test_a_failed_batch_settles_its_futures_and_the_thread_keeps_flushing(mongo_client):
+    collection = mongo_client.db.outcomes
+    buffer = WriteBuffer(collection, max_delay_ms=0)
+    write_run = buffer._write_run
+
+    def fail_once(run):
+        buffer._write_run = write_run
+        raise RuntimeError('lost connection')
+
+    buffer._write_run = fail_once
+    with pytest.raises(RuntimeError):
+        buffer.create({'animal_id': 'A1'}).result(timeout=5)
+    assert buffer.create({'animal_id': 'A2'}).result(timeout=5) is True
+    buffer.close()
+    assert collection.find_one({'animal_id': 'A2'}) is not None
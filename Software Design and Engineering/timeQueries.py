@@ -0,0 +1,112 @@
+"""
+timeQueries.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module builds date range filters on the outcome 'datetime' field and the pipeline that counts outcomes
+per day, week or month. Filters are plain range conditions, so they use the datetime_1 index, and the time buckets
+are computed by the database.
+Issues: Outcomes loaded with mongoimport keep 'datetime' as a string while csvLoader stores a date, so a range is
+matched against both forms. The time series needs MongoDB 5.0 or later ($dateTrunc)
+"""
+
+from datetime import date, datetime, time, timedelta
+
+# Field holding the outcome date, indexed by datetime_1
+TIME_FIELD = 'datetime'
+# Format of outcome dates stored as strings, as in the CSV
+STRING_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Bucket sizes accepted by time_series_pipeline
+TIME_UNITS = ('day', 'week', 'month')
+
+
+def parse_date(value):
+    """
+    Read a date given as a datetime, a date or an ISO string such as the '2016-01-31' sent by a date picker.
+
+    :param value: Date value
+    :return: datetime (midnight for a date without a time)
+    :raises ValueError: If the value isn't a date
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    raise ValueError(f"Not a date: {value!r}")
+
+
+def end_of_day(value):
+    """
+    Turn the last day of an inclusive date range into the exclusive end date_range expects.
+
+    :param value: Last day to include, in any form parse_date accepts, or None
+    :return: Midnight after that day, or None
+    """
+    if value is None:
+        return None
+    return datetime.combine(parse_date(value).date(), time()) + timedelta(days=1)
+
+
+def date_range(start=None, end=None, field=TIME_FIELD):
+    """
+    Build a filter for outcomes from start (inclusive) until end (exclusive).
+    MongoDB only compares values of the same type, so the range is given once as dates and once as strings;
+    both branches are index range scans.
+
+    :param start: First date to include, or None for no lower bound
+    :param end: First date to exclude, or None for no upper bound
+    :param field: Date field to filter on
+    :return: Query dictionary (empty when neither bound is given)
+    :raises ValueError: If a bound isn't a date or the range is reversed
+    """
+    bounds = {}
+    if start is not None:
+        bounds['$gte'] = parse_date(start)
+    if end is not None:
+        bounds['$lt'] = parse_date(end)
+    if not bounds:
+        return {}
+    if start is not None and end is not None and bounds['$gte'] > bounds['$lt']:
+        raise ValueError("The start of a date range must not be after its end")
+    as_strings = {operator: value.strftime(STRING_FORMAT) for operator, value in bounds.items()}
+    return {'$or': [{field: bounds}, {field: as_strings}]}
+
+
+def time_series_pipeline(query, unit='month', field=TIME_FIELD, split_by='outcome_type'):
+    """
+    Build the aggregation that counts the outcomes matching a query per time bucket and per value of split_by.
+    Only the date and split_by fields are projected after the match, so the counts need no other fields.
+
+    :param query: Dictionary representing the query criteria, e.g. including a date_range
+    :param unit: Bucket size: 'day', 'week' (starting on Monday) or 'month'
+    :param field: Date field to bucket on
+    :param split_by: Field whose values get a series each, or None for a single series
+    :return: List of aggregation stages producing {'period', split_by, 'count'} in time order
+    :raises ValueError: If the unit is not one of TIME_UNITS
+    """
+    if unit not in TIME_UNITS:
+        raise ValueError(f"Unknown time unit '{unit}', expected one of {TIME_UNITS}")
+    value = f'${field}'
+    as_date = {'$cond': [
+        {'$eq': [{'$type': value}, 'date']},
+        value,
+        {'$dateFromString': {'dateString': value, 'format': STRING_FORMAT, 'onError': None, 'onNull': None}},
+    ]}
+    group_id = {'period': {'$dateTrunc': {'date': as_date, 'unit': unit, 'startOfWeek': 'monday'}}}
+    projection = {'_id': 0, field: 1}
+    if split_by:
+        group_id[split_by] = {'$ifNull': [f'${split_by}', None]}
+        projection[split_by] = 1
+    return [
+        {'$match': query},
+        {'$project': projection},
+        {'$group': {'_id': group_id, 'count': {'$sum': 1}}},
+        # Dates that couldn't be parsed have no bucket
+        {'$match': {'_id.period': {'$ne': None}}},
+        {'$sort': {'_id.period': 1, **({f'_id.{split_by}': 1} if split_by else {})}},
+        {'$project': {'_id': 0, 'period': '$_id.period', **({split_by: f'$_id.{split_by}'} if split_by else {}),
+                      'count': 1}},
+    ]
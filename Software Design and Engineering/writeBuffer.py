@@ -0,0 +1,278 @@
+"""
+writeBuffer.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.2
+Purpose: This module provides an optional write-behind buffer for single-document creates, updates and deletes.
+Calls from any number of threads are queued and flushed by a background thread once max_batch writes are waiting
+or the oldest has waited max_delay_ms, so a burst of small writes shares a few round trips. A batch is split into
+runs in submission order, and each run goes out as one unordered bulk_write: a run holds writes of one kind
+(insert, update, delete), and an update or delete whose filter is already in the run starts a new one, so two
+writes to the same document are always applied in the order they were queued. Every call gets a Future that
+resolves when its write is acknowledged (or raises its own write error), and the buffer is flushed when the
+process exits.
+Issues: Writes are only known to touch the same document when their filters are equal; an update by _id and one
+by animal_id that hit the same document may still be applied in either order. With w=0 writes are not
+acknowledged, so Futures resolve to False and write errors are not reported
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import bson
+import bson.errors
+import pymongo
+import pymongo.errors
+from pymongo.write_concern import WriteConcern
+
+from crudOperations import invalidate_cache, apply_rollups
+from rescueQueries import tagged_copy, tag_fields
+from queryMetrics import track
+
+logging.basicConfig(level=logging.INFO)
+
+# Server error code for a duplicate key, reported as DuplicateKeyError like CreateOperation does
+DUPLICATE_KEY = 11000
+
+
+class WriteBuffer:
+    """
+    Queues single-document writes and flushes them in batches from a background thread.
+    """
+
+    def __init__(self, collection, max_batch=500, max_delay_ms=50, w=1, j=False, cache=None, metrics=None,
+                 rollups=None):
+        """
+        Initialize the buffer. The flush thread starts with the first write.
+
+        :param collection: MongoDB collection object
+        :param max_batch: Number of queued writes that triggers a flush
+        :param max_delay_ms: Longest time a write waits in the queue before it is flushed
+        :param w: Write concern: number of members (or 'majority') that must acknowledge a flush, 0 for none
+        :param j: Wait for the flush to be written to the on-disk journal
+        :param cache: Optional QueryCache invalidated after every flush
+        :param metrics: Optional QueryMetrics that times every flush
+        :param rollups: Optional OutcomeRollups updated with every inserted document
+        """
+        if max_batch < 1 or max_delay_ms < 0:
+            raise ValueError("max_batch must be positive and max_delay_ms must be non-negative")
+        self.collection = collection.with_options(write_concern=WriteConcern(w=w, j=j))
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.cache = cache
+        self.metrics = metrics
+        self.rollups = rollups
+        self.closed = False
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        """
+        Create the queue, lock and thread state. Also used in a forked child, where the parent's thread doesn't
+        exist, its lock may be held and its queued writes belong to the parent.
+        """
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        # Held from taking a batch until it is written, so batches reach the server in the order they were queued.
+        # Always taken before the condition.
+        self.write_lock = threading.Lock()
+        # List of (kind, request, inserted document or BSON-encoded update/delete filter, Future)
+        self.pending = []
+        self.oldest = None
+        self.thread = None
+
+    def submit(self, kind, request, document=None):
+        """
+        Queue one write.
+
+        :param kind: 'insert', 'update' or 'delete'
+        :param request: pymongo InsertOne, UpdateOne or DeleteOne
+        :param document: The inserted document, used to update the rollups, or the filter of an update or delete,
+            used to keep writes to the same document in order
+        :return: Future resolving to True once the write is acknowledged (False with w=0)
+        :raises ValueError: If the filter can't be encoded as BSON
+        """
+        if kind != 'insert':
+            # Encoded here so a filter the server could never accept fails its caller, not the flush thread
+            try:
+                document = bson.encode(document)
+            except (bson.errors.BSONError, TypeError, ValueError) as e:
+                raise ValueError(f"Filter can't be encoded as BSON: {e}")
+        if self.pid != os.getpid():
+            self._reset()
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Write buffer is closed")
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+                self.thread.start()
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.append((kind, request, document, future))
+            # The flush thread waits without a timeout while the queue is empty, so the first write starts its timer
+            if len(self.pending) == 1 or len(self.pending) >= self.max_batch:
+                self.condition.notify()
+        return future
+
+    def create(self, data):
+        """
+        Queue an insert.
+
+        :param data: Dictionary representing the document to be inserted
+        :return: Future resolving to the acknowledgement of the insert
+        """
+        if data is None or not isinstance(data, dict):
+            raise ValueError("Data parameter must be a non-empty dictionary")
+        document = tagged_copy(data)
+        return self.submit('insert', pymongo.InsertOne(document), document)
+
+    def update(self, query, update_data):
+        """
+        Queue an update of the first document matching the query.
+
+        :param query: Dictionary representing the query criteria
+        :param update_data: Dictionary of the fields to set
+        :return: Future resolving to the acknowledgement of the update
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        if update_data is None or not isinstance(update_data, dict):
+            raise ValueError("Update data must be a non-empty dictionary")
+        return self.submit('update', pymongo.UpdateOne(query, {'$set': tag_fields(update_data)}), query)
+
+    def delete(self, query):
+        """
+        Queue a delete of the first document matching the query.
+
+        :param query: Dictionary representing the query criteria
+        :return: Future resolving to the acknowledgement of the delete
+        """
+        if query is None or not isinstance(query, dict):
+            raise ValueError("Query parameter must be a non-empty dictionary")
+        return self.submit('delete', pymongo.DeleteOne(query), query)
+
+    def _run(self):
+        """
+        Flush thread: wait until the batch is full, the oldest write is due, or the buffer is closed.
+        """
+        while True:
+            with self.condition:
+                while not self.closed and len(self.pending) < self.max_batch:
+                    if self.pending:
+                        remaining = self.oldest + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    else:
+                        self.condition.wait()
+                if self.closed and not self.pending:
+                    return
+            try:
+                with self.write_lock:
+                    with self.condition:
+                        batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+                        self.oldest = time.monotonic() if self.pending else None
+                    self._write(batch)
+            except Exception as e:
+                # Keep the thread alive: writes queued later still need a flush
+                logging.error(f"Write buffer flush thread error: {e}")
+
+    def flush(self):
+        """
+        Write every queued write now, on the calling thread. Writes already taken by the flush thread are
+        written first.
+        """
+        with self.write_lock:
+            with self.condition:
+                batch, self.pending, self.oldest = self.pending, [], None
+            self._write(batch)
+
+    def _write(self, batch):
+        """
+        Write a batch as unordered bulk_write calls, one per run, and settle the Futures. A run holds writes of
+        the same kind, and never two updates or deletes with the same filter, since an unordered bulk_write may
+        apply its writes in any order. Every Future is settled even if the batch fails unexpectedly.
+
+        :param batch: List of queued (kind, request, document, Future) entries
+        """
+        runs = []
+        filters = set()
+        for entry in batch:
+            kind, _, document, _ = entry
+            key = document if kind != 'insert' else None
+            if runs and runs[-1][0][0] == kind and key not in filters:
+                runs[-1].append(entry)
+            else:
+                runs.append([entry])
+                filters.clear()
+            if key is not None:
+                filters.add(key)
+        try:
+            for run in runs:
+                self._write_run(run)
+        except Exception as e:
+            logging.error(f"Write buffer flush failed: {e}")
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Failed to write buffered writes: {e}"))
+        finally:
+            if batch:
+                invalidate_cache(self.cache)
+
+    def _write_run(self, run):
+        """
+        Write one run of same-kind writes and settle each Future with its own result or error.
+
+        :param run: List of queued (kind, request, document, Future) entries of one kind
+        """
+        failed = {}
+        acknowledged = True
+        try:
+            with track(self.metrics, 'write_buffer'):
+                result = self.collection.bulk_write([request for _, request, _, _ in run], ordered=False)
+            acknowledged = result.acknowledged
+        except pymongo.errors.BulkWriteError as bwe:
+            for error in bwe.details.get('writeErrors', []):
+                error_type = (pymongo.errors.DuplicateKeyError if error.get('code') == DUPLICATE_KEY
+                              else pymongo.errors.WriteError)
+                failed[error['index']] = error_type(error.get('errmsg'), error.get('code'), error)
+            if bwe.details.get('writeConcernErrors'):
+                # Every write in the run was applied but not with the requested durability
+                concern = pymongo.errors.WriteConcernError(bwe.details['writeConcernErrors'][0].get('errmsg'))
+                failed.update({index: concern for index in range(len(run)) if index not in failed})
+            logging.error(f"Write buffer flush had {len(failed)} failed writes of {len(run)}")
+        except Exception as e:
+            logging.error(f"Write buffer flush failed: {e}")
+            for _, _, _, future in run:
+                future.set_exception(RuntimeError(f"Failed to write buffered {run[0][0]}: {e}"))
+            return
+
+        inserted = [document for index, (kind, _, document, _) in enumerate(run)
+                    if kind == 'insert' and index not in failed]
+        if inserted:
+            apply_rollups(self.rollups, added=inserted)
+        for index, (_, _, _, future) in enumerate(run):
+            if index in failed:
+                future.set_exception(failed[index])
+            else:
+                future.set_result(acknowledged)
+
+    def close(self):
+        """
+        Stop accepting writes, flush everything queued and stop the flush thread. Registered with atexit.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+            thread = self.thread
+        if thread is not None and self.pid == os.getpid():
+            thread.join()
+        self.flush()
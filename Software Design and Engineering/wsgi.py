@@ -0,0 +1,17 @@
+"""
+wsgi.py
+Author: Nathan Wilson
+Contact: nathan.wilson3@outlook.com
+Date: 2026-10-18
+Version: 1.0
+Purpose: This module is the production entry point for the dashboard. It exposes the Flask server behind the Dash
+app as a WSGI callable for gunicorn or uwsgi running several worker processes. Each worker opens its own MongoDB
+connection after the fork; set QUERY_CACHE_BACKEND=sqlite so the workers share cached results.
+Usage: gunicorn -c gunicorn.conf.py wsgi:application
+       uwsgi --http :8050 --master --processes 4 --module wsgi:application
+Issues: None known
+"""
+
+from app import create_app
+
+application = create_app().server